@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import math
+import random
+import threading
+from typing import Dict, Optional, Tuple
+
+from metrics import REGISTRY
+
+
+HTTP_RTT_SECONDS = REGISTRY.gauge("gpuniq_agent_http_rtt_seconds", "Оценка времени ответа backend по endpoint: srtt | rttvar")
+HTTP_TIMEOUT_SECONDS = REGISTRY.gauge("gpuniq_agent_http_timeout_seconds", "Текущий таймаут по endpoint: connect | read")
+
+# Как у TCP RTO (RFC 6298): веса EWMA среднего и отклонения, множитель отклонения
+RTT_ALPHA = 1 / 8
+RTT_BETA = 1 / 4
+RTT_K = 4
+RTT_GRANULARITY_S = 0.1
+MAX_BACKOFF = 8  # во сколько раз таймаут может вырасти после подряд идущих таймаутов
+
+# Границы read-таймаута: нижняя — чтобы ближние агенты быстро замечали мёртвое соединение,
+# верхняя — чтобы агенты на плохом канале не ждали бесконечно
+READ_TIMEOUT_BOUNDS: Dict[str, Tuple[float, float]] = {
+    "confirm": (3.0, 60.0),
+    "init": (3.0, 90.0),
+    "pull": (2.0, 60.0),
+    "sync": (2.0, 60.0),
+    "status": (2.0, 60.0),
+    "heartbeat": (3.0, 60.0),
+    "logs": (1.0, 15.0),
+}
+DEFAULT_READ_BOUNDS = (2.0, 60.0)
+CONNECT_TIMEOUT_BOUNDS = (1.0, 15.0)
+
+
+class RttEstimator:
+    """SRTT и RTTVAR по образцам времени ответа; таймаут = SRTT + max(G, K * RTTVAR) в пределах [floor, ceiling].
+    До первого образца — initial_s. Таймаут удваивается после каждого таймаута подряд и сбрасывается
+    первым успешным ответом.
+    """
+
+    def __init__(self, initial_s: float, floor_s: float, ceiling_s: float):
+        self.initial_s = initial_s
+        self.floor_s = floor_s
+        self.ceiling_s = ceiling_s
+        self.srtt: Optional[float] = None
+        self.rttvar: Optional[float] = None
+        self.backoff = 1
+
+    def observe(self, sample_s: float) -> None:
+        if self.srtt is None:
+            self.srtt = sample_s
+            self.rttvar = sample_s / 2
+        else:
+            self.rttvar = (1 - RTT_BETA) * self.rttvar + RTT_BETA * abs(self.srtt - sample_s)
+            self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * sample_s
+        self.backoff = 1
+
+    def timed_out(self) -> None:
+        self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+
+    def timeout(self) -> float:
+        base = self.initial_s if self.srtt is None else self.srtt + max(RTT_GRANULARITY_S, RTT_K * self.rttvar)
+        return min(self.ceiling_s, max(self.floor_s, base * self.backoff))
+
+
+class AdaptiveTimeouts:
+    """Таймауты (connect, read) для запросов к одному backend.
+    connect — одна оценка на backend (по времени установки соединения), read — своя на каждый endpoint
+    (по времени до заголовков ответа без установки соединения).
+    """
+
+    def __init__(self, initial: Dict[str, Tuple[float, float]], default: Tuple[float, float]):
+        self.initial = dict(initial)
+        self.default = default
+        self._connect = RttEstimator(max(c for c, _ in self.initial.values()) if self.initial else default[0],
+                                     *CONNECT_TIMEOUT_BOUNDS)
+        self._read: Dict[str, RttEstimator] = {}
+        self._lock = threading.Lock()
+
+    def _estimator(self, endpoint: str) -> RttEstimator:
+        estimator = self._read.get(endpoint)
+        if estimator is None:
+            floor_s, ceiling_s = READ_TIMEOUT_BOUNDS.get(endpoint, DEFAULT_READ_BOUNDS)
+            estimator = self._read[endpoint] = RttEstimator(self.initial.get(endpoint, self.default)[1], floor_s, ceiling_s)
+        return estimator
+
+    def timeout(self, endpoint: str) -> Tuple[float, float]:
+        with self._lock:
+            return self._connect.timeout(), self._estimator(endpoint).timeout()
+
+    def observe(self, endpoint: str, read_s: float) -> None:
+        with self._lock:
+            estimator = self._estimator(endpoint)
+            estimator.observe(read_s)
+            self._export(endpoint, estimator)
+
+    def observe_connect(self, connect_s: float) -> None:
+        with self._lock:
+            self._connect.observe(connect_s)
+
+    def timed_out(self, endpoint: str, connect: bool) -> None:
+        with self._lock:
+            estimator = self._estimator(endpoint)
+            (self._connect if connect else estimator).timed_out()
+            self._export(endpoint, estimator)
+
+    def _export(self, endpoint: str, estimator: RttEstimator) -> None:
+        if estimator.srtt is not None:
+            HTTP_RTT_SECONDS.set(estimator.srtt, endpoint=endpoint, stat="srtt")
+            HTTP_RTT_SECONDS.set(estimator.rttvar, endpoint=endpoint, stat="rttvar")
+        HTTP_TIMEOUT_SECONDS.set(self._connect.timeout(), endpoint=endpoint, kind="connect")
+        HTTP_TIMEOUT_SECONDS.set(estimator.timeout(), endpoint=endpoint, kind="read")
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="read-таймаут pull по мере накопления образцов на разных каналах")
+    p.add_argument("--samples", type=int, default=200)
+    p.add_argument("--seed", type=int, default=1)
+    args = p.parse_args()
+    rng = random.Random(args.seed)
+    links = {
+        "near (40 ms ± 10)": lambda: max(0.005, rng.gauss(0.04, 0.01)),
+        "far (0.8 s ± 0.3)": lambda: max(0.1, rng.gauss(0.8, 0.3)),
+        "poor (~6 s, long tail)": lambda: rng.lognormvariate(math.log(6.0), 0.6),
+    }
+    print(f"{'link':<22} {'fixed, s':>9} {'after 1':>9} {'after 10':>9} {'after ' + str(args.samples):>10} {'>fixed':>7} {'>adaptive':>10}")
+    for name, draw in links.items():
+        timeouts = AdaptiveTimeouts({"pull": (5.0, 15.0)}, (5.0, 10.0))
+        after, over_fixed, over_adaptive = {}, 0, 0
+        for i in range(1, args.samples + 1):
+            sample = draw()
+            current = timeouts.timeout("pull")[1]
+            over_fixed += sample > 15.0
+            over_adaptive += sample > current
+            if sample > current:
+                timeouts.timed_out("pull", connect=False)
+            else:
+                timeouts.observe("pull", sample)
+            if i in (1, 10, args.samples):
+                after[i] = timeouts.timeout("pull")[1]
+        print(f"{name:<22} {15.0:>9.1f} {after[1]:>9.2f} {after[10]:>9.2f} {after[args.samples]:>10.2f} "
+              f"{over_fixed:>7} {over_adaptive:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,57 +1,369 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import sys
 import os
 import time
 import json
 import psutil
 import threading
 import subprocess
-import socket
 import re
-from typing import Dict, Any, Optional
+import argparse
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List
 
 from hardware_analyzer import HardwareAnalyzer
+from disk_benchmark import DiskBenchmark, BenchmarkAborted, docker_data_root
+from network_selftest import NetworkSelfTest
+from resource_availability import ResourceAvailability
+from state_store import StateStore
+from task_dedup import TaskDedupIndex
+from task_queue import TaskQueue, QueuedTask, PRIORITY_NAMES
+import hardware_fingerprint
 from api_client import APIClient
-from clean_manager import ContainerManager
+from clean_manager import ContainerManager, StartCancelled
+from command_runner import RUNNER
+from metrics_sampler import MetricsSampler
+from network_monitor import NetworkRateTracker
+from container_monitor import ContainerIndex, ContainerGpuMonitor, ContainerIOMonitor
+from heartbeat_scheduler import HeartbeatScheduler
+from thermal import ThermalMonitor
+from metrics import REGISTRY, MetricsServer, labels
+from profiler import SamplingProfiler
+from task_trace import TRACER, now_us
+
+TASKS_TOTAL = REGISTRY.counter("gpuniq_agent_tasks_total", "Обработанные задачи по операции и статусу")
+TASK_SECONDS = REGISTRY.histogram("gpuniq_agent_task_duration_seconds", "Длительность обработки задачи по операции")
 
 # Константы
 AGENT_ID_FILE = ".agent_id"
+FINGERPRINT_FILE = ".agent_fingerprint.json"
+IP_CACHE_FILE = ".agent_location.json"
+STATE_DB_FILE = ".agent_state.db"
+TASK_HISTORY_S = 30 * 24 * 3600.0  # сколько хранить записи о задачах в базе состояния
+DISK_BENCHMARK_IDLE_POLL_S = 60.0  # как часто проверять простой хоста перед замером диска
+NETWORK_SELFTEST_RETRY_S = 300.0   # повтор самопроверки сети, если канал занят арендаторами
+NETWORK_QUIET_MBPS = 5.0           # суммарный трафик физических интерфейсов, при котором канал считается свободным
+
+
+@dataclass
+class AgentSettings:
+    heartbeat_interval_s: int = 300   # период heartbeat
+    heartbeat_phase_s: Optional[float] = None  # сдвиг фазы; None — случайный в пределах периода
+    heartbeat_min_event_gap_s: float = 10.0    # минимальный интервал между внеочередными heartbeat
+    disk_full_percent: float = 95.0
+    metrics_host: str = "127.0.0.1"   # интерфейс для /metrics
+    metrics_port: Optional[int] = None  # None — endpoint выключен
+    profile_dir: str = "profiles"     # куда писать профили (kill -USR2 / GET /debug/profile)
+    trace_dir: str = "traces"         # trace-event JSON по задачам
+    trace_max_files: int = 50         # кольцо последних задач; 0 — трассировка выключена
+    sample_interval_s: float = 1.0    # период фонового сэмплирования метрик
+    gpu_sample_interval_s: float = 5.0
+    disk_benchmark: bool = False      # замерить диск data-root Docker в простое (один раз на набор дисков)
+    disk_benchmark_file_mb: int = 256
+    disk_benchmark_phase_s: float = 5.0
+    disk_benchmark_max_io_mb: int = 2048
+    network_selftest_url: Optional[str] = None  # endpoint самопроверки канала; None — выключено
+    network_selftest_interval_s: float = 6 * 3600.0
+    network_selftest_max_mb: int = 25          # лимит трафика на направление
+    network_selftest_max_s: float = 5.0        # лимит времени на направление
+    hardware_watch_interval_s: float = 10.0  # период сверки отпечатков железа (NIC по netlink — сразу)
+    task_dedup_window_s: float = 24 * 3600.0  # сколько отвечать на повторную доставку задачи сохранённым итогом
+    task_workers: int = 2             # исполнители запусков; stop/stop_remove обслуживает ещё один, выделенный
+    pull_batch_size: int = 20         # сколько задач просить за один pull
+    sync_mode: bool = False           # pull, heartbeat, статусы и логи одним периодическим запросом /sync
+    sync_interval_s: float = 10.0     # период sync без задач и событий
+    binary_encoding: bool = True      # MessagePack/CBOR, если сервер их объявит и библиотека установлена
 
 
 class Agent:
     """Основной класс агента"""
     
-    def __init__(self, secret_key: str, base_url: str = "https://devapi.gpuniq.ru"):
+    def __init__(self, secret_key: str, base_url: str = "https://devapi.gpuniq.ru", settings: Optional[AgentSettings] = None):
         self.secret_key = secret_key
         self.base_url = base_url
+        self.settings = settings if settings is not None else AgentSettings()
         self.agent_id = None
         
         # Инициализируем компоненты
-        self.hardware_analyzer = HardwareAnalyzer()
+        self.state_store = StateStore(STATE_DB_FILE)
+        self.hardware_analyzer = HardwareAnalyzer(change_callback=self._on_hardware_change, ip_cache_path=IP_CACHE_FILE,
+                                                  state_store=self.state_store)
+        self._hardware_changes = set()
+        self._hardware_changes_lock = threading.Lock()
+        self._identity: Dict[str, Any] = {}
+        self.fingerprint_store = hardware_fingerprint.FingerprintStore(FINGERPRINT_FILE, state_store=self.state_store)
+        self.disk_benchmark: Optional[Dict[str, Any]] = None
+        self.network_selftest: Optional[Dict[str, Any]] = None
+        self._tasks_in_flight = 0
+        self._tasks_in_flight_lock = threading.Lock()  # задачи выполняют несколько воркеров очереди
+        self._stop_event = threading.Event()
         self.api_client = APIClient(base_url=base_url, secret_key=secret_key)
+        self.api_client.state_store = self.state_store
+        self.api_client.pull_batch_size = settings.pull_batch_size
+        self.api_client.codec.enabled = settings.binary_encoding
+        if settings.sync_mode:
+            self.api_client.enable_sync(settings.sync_interval_s).on_directive = self._on_sync_directive
+        self.task_dedup = TaskDedupIndex(self.state_store, window_s=settings.task_dedup_window_s)
         self.container_manager = ContainerManager()
+        self.task_queue = TaskQueue(self._run_queued, workers=settings.task_workers,
+                                    image_cached=self.container_manager.has_image,
+                                    container_name_of=self._container_name_for)
+        self.api_client.task_known = self._task_known
+        self.network_tracker = NetworkRateTracker()
+        self.container_index = ContainerIndex()
+        self.container_gpu_monitor = ContainerGpuMonitor(self.container_index)
+        self.container_io_monitor = ContainerIOMonitor(self.container_index)
+        self.thermal_monitor = ThermalMonitor(gpu_interval_s=settings.gpu_sample_interval_s)
+        self.heartbeat_scheduler = HeartbeatScheduler(
+            period_s=settings.heartbeat_interval_s,
+            phase_s=settings.heartbeat_phase_s,
+            min_event_gap_s=settings.heartbeat_min_event_gap_s,
+        )
+        # История метрик хранится с запасом в одну минуту сверх окна heartbeat
+        self.metrics_sampler = MetricsSampler(
+            interval_s=settings.sample_interval_s,
+            history_s=settings.heartbeat_interval_s + 60,
+            gpu_interval_s=settings.gpu_sample_interval_s,
+            net_tracker=self.network_tracker,
+            event_callback=self.heartbeat_scheduler.trigger,
+            disk_full_percent=settings.disk_full_percent,
+            container_index=self.container_index,
+            thermal_monitor=self.thermal_monitor,
+        )
+        
+        self.resource_availability = ResourceAvailability(self.hardware_analyzer, self.container_index, self.metrics_sampler)
+        self.hardware_analyzer.resource_availability = self.resource_availability
+        
+        self.metrics_server: Optional[MetricsServer] = None
+        self.profiler = SamplingProfiler(output_dir=settings.profile_dir)
+        TRACER.configure(settings.trace_dir, settings.trace_max_files)
+        REGISTRY.add_collector(self._collect_host_metrics)
         
         # Загружаем сохраненный agent_id
         self._load_agent_id()
     
     def _load_agent_id(self):
-        """Загружает сохраненный agent_id из файла"""
-        if os.path.exists(AGENT_ID_FILE):
+        """Загружает сохраненный agent_id из базы состояния (или переносит его из старого файла .agent_id)"""
+        agent_id = self.state_store.get_identity("agent_id")
+        if agent_id is None and os.path.exists(AGENT_ID_FILE):
             with open(AGENT_ID_FILE, "r") as f:
-                self.agent_id = f.read().strip()
-                print(f"[INFO] Loaded agent_id from {AGENT_ID_FILE}: {self.agent_id}")
-                self.api_client.set_credentials(self.agent_id, self.secret_key)
+                agent_id = f.read().strip() or None
+            if agent_id:
+                self.state_store.set_identity("agent_id", agent_id)
+                print(f"[INFO] Migrated agent_id from {AGENT_ID_FILE} to {STATE_DB_FILE}")
+        if agent_id:
+            self.agent_id = agent_id
+            print(f"[INFO] Loaded agent_id: {self.agent_id}")
+            self.api_client.set_credentials(self.agent_id, self.secret_key)
     
     def _save_agent_id(self, agent_id: str):
-        """Сохраняет agent_id в файл"""
-        with open(AGENT_ID_FILE, "w") as f:
-            f.write(str(agent_id))
-        print(f"[INFO] Saved agent_id to {AGENT_ID_FILE}: {agent_id}")
+        """Сохраняет agent_id в базу состояния"""
+        self.state_store.set_identity("agent_id", agent_id)
+        print(f"[INFO] Saved agent_id to {STATE_DB_FILE}: {agent_id}")
+    
+    def _on_hardware_change(self, category: str):
+        """Железо изменилось — отправляем внеочередной heartbeat с новым hardware_info"""
+        with self._hardware_changes_lock:
+            self._hardware_changes.add(category)
+        self.heartbeat_scheduler.trigger(f"hardware_changed:{category}")
+    
+    def _on_location_resolved(self, ip_address: str, location: str):
+        """Геолокация определилась в фоне — досылаем её ближайшим heartbeat"""
+        print(f"[INFO] Detected location: {location} (IP: {ip_address})")
+        self._identity = {"ip_address": ip_address, "location": location}
+        with self._hardware_changes_lock:
+            self._hardware_changes.add("identity")
+        self.heartbeat_scheduler.trigger("location_resolved")
+    
+    def _on_sync_directive(self, directive: Dict[str, Any]):
+        """Директивы из ответа sync: heartbeat_now — внеочередной heartbeat, full_report — с полным hardware_info"""
+        kind = directive.get("type")
+        if kind == "full_report":
+            with self._hardware_changes_lock:
+                self._hardware_changes.add("full_report")
+                if self._identity:
+                    self._hardware_changes.add("identity")
+        elif kind != "heartbeat_now":
+            print(f"[WARNING] Unknown sync directive: {kind}")
+            return
+        self.heartbeat_scheduler.trigger(f"directive:{kind}")
+    
+    def _restore_disk_benchmark(self, record: Optional[Dict[str, Any]], disks_digest: Optional[str],
+                                system_data: Optional[Dict[str, Any]] = None) -> None:
+        """Берёт сохранённый замер дисков, если набор дисков с тех пор не менялся"""
+        cached = (record or {}).get("disk_benchmark")
+        if not cached or not disks_digest or cached.get("disks_fingerprint") != disks_digest:
+            return
+        self.disk_benchmark = cached
+        result = cached["result"]
+        self.hardware_analyzer.set_disk_speed(result.get("device"), result.get("seq_read_mb_s"), result.get("seq_write_mb_s"))
+        if system_data is not None:
+            for disk in (system_data.get("hardware_info") or {}).get("disks", []):
+                if disk.get("name") == result.get("device"):
+                    disk["read_speed_mb_s"] = result.get("seq_read_mb_s")
+                    disk["write_speed_mb_s"] = result.get("seq_write_mb_s")
+            system_data["disk_benchmark"] = result
+    
+    def _restore_network_selftest(self, record: Optional[Dict[str, Any]]) -> None:
+        """Берёт сохранённую самопроверку канала, если она не старше периода и сделана до того же endpoint"""
+        cached = (record or {}).get("network_selftest")
+        if not cached or cached.get("endpoint") != (self.settings.network_selftest_url or "").rstrip("/"):
+            return
+        if time.time() - cached.get("measured_at", 0) >= self.settings.network_selftest_interval_s:
+            return
+        self.network_selftest = cached
+        self.hardware_analyzer.set_link_measurement(cached.get("interface"), cached)
+    
+    def _network_quiet(self) -> bool:
+        """Канал свободен: нет задач и контейнеров арендаторов, трафик физических интерфейсов почти нулевой"""
+        if self._tasks_in_flight or self.container_index.containers():
+            return False
+        last = self.network_tracker.last()
+        return last.get("up_mbps", 0) + last.get("down_mbps", 0) < NETWORK_QUIET_MBPS
+    
+    def _network_selftest_loop(self):
+        """Самопроверка канала раз в network_selftest_interval_s, только когда канал свободен"""
+        interval = self.settings.network_selftest_interval_s
+        last_at = (self.network_selftest or {}).get("measured_at", 0)
+        delay = max(NETWORK_SELFTEST_RETRY_S, last_at + interval - time.time())
+        while not self._stop_event.wait(delay):
+            if not self._network_quiet():
+                delay = NETWORK_SELFTEST_RETRY_S
+                continue
+            selftest = NetworkSelfTest(self.settings.network_selftest_url,
+                                       max_bytes=self.settings.network_selftest_max_mb * 1024 * 1024,
+                                       max_duration_s=self.settings.network_selftest_max_s)
+            try:
+                result = selftest.run()
+            except Exception as e:
+                print(f"[WARNING] Network self-test failed: {e}")
+                delay = NETWORK_SELFTEST_RETRY_S
+                continue
+            print(f"[INFO] Network self-test: down {result['measured_down_mbps']} Mbit/s, up {result['measured_up_mbps']} Mbit/s, "
+                  f"RTT {result['rtt_ms']} ms via {result['interface']}")
+            self.network_selftest = result
+            self.hardware_analyzer.set_link_measurement(result["interface"], result)
+            try:
+                self.fingerprint_store.update(network_selftest=result)
+            except OSError as e:
+                print(f"[WARNING] Failed to save network self-test: {e}")
+            self._on_hardware_change("network")
+            delay = interval
+    
+    def _host_idle(self, check_disk: bool = True) -> bool:
+        """Хост простаивает: нет задач в обработке и контейнеров арендаторов, CPU и диски почти не заняты.
+        check_disk=False — во время замера диска: его собственный I/O сэмплер видит как нагрузку.
+        """
+        if self._tasks_in_flight or self.container_index.containers():
+            return False
+        latest = self.metrics_sampler.latest_all()
+        if latest.get("cpu_usage", 0) > 50:
+            return False
+        if not check_disk:
+            return True
+        return latest.get("disk_read_mb_s", 0) + latest.get("disk_write_mb_s", 0) < 20
+    
+    def _disk_benchmark_loop(self):
+        """Ждёт простоя хоста и один раз замеряет диск data-root Docker"""
+        path = docker_data_root()
+        while not self._stop_event.wait(DISK_BENCHMARK_IDLE_POLL_S):
+            if not self._host_idle():
+                continue
+            print(f"[INFO] Host is idle, benchmarking disk at {path}...")
+            bench = DiskBenchmark(path, file_size_mb=self.settings.disk_benchmark_file_mb,
+                                  phase_max_s=self.settings.disk_benchmark_phase_s,
+                                  max_io_mb=self.settings.disk_benchmark_max_io_mb,
+                                  should_continue=lambda: not self._stop_event.is_set() and self._host_idle(check_disk=False))
+            try:
+                result = bench.run()
+            except BenchmarkAborted:
+                print("[INFO] Disk benchmark interrupted: host became busy, will retry later")
+                continue
+            except Exception as e:
+                print(f"[WARNING] Disk benchmark failed: {e}")
+                return
+            print(f"[INFO] Disk benchmark: seq read {result['seq_read_mb_s']} MB/s, seq write {result['seq_write_mb_s']} MB/s, "
+                  f"random {result['rand_read_iops']}/{result['rand_write_iops']} IOPS")
+            disks_digest = hardware_fingerprint.compute({"hardware_info": {"disks": self.hardware_analyzer.get_disk_info()}})["sections"]["disks"]
+            self.disk_benchmark = {"disks_fingerprint": disks_digest, "result": result}
+            self.hardware_analyzer.set_disk_speed(result["device"], result["seq_read_mb_s"], result["seq_write_mb_s"])
+            try:
+                self.fingerprint_store.update(disk_benchmark=self.disk_benchmark)
+            except OSError as e:
+                print(f"[WARNING] Failed to save disk benchmark: {e}")
+            self._on_hardware_change("disk")
+            return
+    
+    @staticmethod
+    def _build_init_data(system_data: Dict[str, Any], fingerprint: Dict[str, Any], previous: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Полный init при первом запуске, иначе — отпечаток и только изменившиеся секции"""
+        if previous is None:
+            return dict(system_data, fingerprint=fingerprint["fingerprint"])
+        changed = hardware_fingerprint.changed_sections(previous, fingerprint)
+        print(f"[INFO] Hardware sections changed since last init: {', '.join(changed) or 'none'}")
+        return {
+            "fingerprint": fingerprint["fingerprint"],
+            "incremental": True,
+            "changed_sections": changed,
+            "status": "online",
+            **hardware_fingerprint.section_payload(system_data, changed),
+        }
+    
+    def _collect_host_metrics(self):
+        """Телеметрия хоста для /metrics из уже собранных сэмплов (без подпроцессов)"""
+        host = {
+            "cpu_usage": ("gpuniq_host_cpu_usage_percent", "Загрузка CPU, %"),
+            "memory_usage": ("gpuniq_host_memory_usage_percent", "Использование RAM, %"),
+            "disk_usage": ("gpuniq_host_disk_usage_percent", "Заполнение корневого раздела, %"),
+            "disk_read_mb_s": ("gpuniq_host_disk_read_mb_per_second", "Чтение с дисков, МБ/с"),
+            "disk_write_mb_s": ("gpuniq_host_disk_write_mb_per_second", "Запись на диски, МБ/с"),
+            "net_up_mbps": ("gpuniq_host_network_up_mbps", "Исходящий трафик физических интерфейсов, Мбит/с"),
+            "net_down_mbps": ("gpuniq_host_network_down_mbps", "Входящий трафик физических интерфейсов, Мбит/с"),
+            "cpu_temperature": ("gpuniq_host_cpu_temperature_celsius", "Температура CPU"),
+        }
+        families = []
+        latest = self.metrics_sampler.latest_all()
+        gpu_util = {}
+        gpu_temp = {}
+        for name, value in latest.items():
+            if name in host:
+                metric, doc = host[name]
+                families.append((metric, "gauge", doc, {labels(): value}))
+            elif name.startswith("gpu") and name.endswith("_temperature"):
+                gpu_temp[labels(gpu=name[3:-len("_temperature")])] = value
+            elif name.startswith("gpu"):
+                gpu_util[labels(gpu=name[3:])] = value
+        if gpu_util:
+            families.append(("gpuniq_host_gpu_utilization_percent", "gauge", "Загрузка GPU, %", gpu_util))
+        if gpu_temp:
+            families.append(("gpuniq_host_gpu_temperature_celsius", "gauge", "Температура GPU", gpu_temp))
+        families.append(("gpuniq_host_thermal_throttling", "gauge", "Хост в состоянии троттлинга (1/0)",
+                         {labels(): 1 if self.thermal_monitor.is_throttling() else 0}))
+        families.append(("gpuniq_agent_sampler_samples_total", "counter", "Снятые сэмплы метрик",
+                         {labels(): self.metrics_sampler.sample_count}))
+        families.append(("gpuniq_agent_sampler_seconds_total", "counter", "Суммарное время сэмплирования",
+                         {labels(): self.metrics_sampler.sample_time_total_s}))
+        return families
+    
+    def _sampled_gpu_usage(self) -> Dict[str, Any]:
+        """Загрузка GPU из последнего опроса фонового сэмплера, в формате get_gpu_usage"""
+        latest = self.metrics_sampler.latest_all()
+        gpu_usage = {}
+        values = []
+        for key, gpu_name in sorted(self.metrics_sampler.gpu_names.items(), key=lambda item: int(item[0][3:])):
+            usage = latest.get(key)
+            if usage is not None:
+                gpu_usage[gpu_name] = int(usage)
+                values.append(usage)
+        if values:
+            gpu_usage["average"] = round(sum(values) / len(values), 1)
+        return gpu_usage
     
     def get_gpu_usage(self) -> Dict[str, Any]:
-        """Получение использования GPU"""
+        """Получение использования GPU: из фонового сэмплера, если он запущен, иначе через nvidia-smi"""
+        if self.metrics_sampler.is_running():
+            return self._sampled_gpu_usage()
         gpu_usage = {}
         
         try:
@@ -60,7 +372,7 @@ class Agent:
             
             # Попробуем получить информацию через nvidia-smi для NVIDIA
             try:
-                nvidia_output = subprocess.check_output(['nvidia-smi', '--query-gpu=name,utilization.gpu', '--format=csv,noheader'], stderr=subprocess.DEVNULL).decode(errors='ignore')
+                nvidia_output = RUNNER.check_output(['nvidia-smi', '--query-gpu=name,utilization.gpu', '--format=csv,noheader'], stderr=subprocess.DEVNULL).decode(errors='ignore')
                 for line in nvidia_output.strip().split('\n'):
                     if line:
                         parts = line.split(',')
@@ -73,7 +385,7 @@ class Agent:
                                 total_usage += usage
                                 gpu_count += 1
                                 gpu_usage[gpu_name] = usage
-            except:
+            except Exception:
                 pass
             
             # Вычисляем среднее использование
@@ -87,81 +399,34 @@ class Agent:
         return gpu_usage
     
     def get_network_usage(self) -> Dict[str, Any]:
-        """Получение использования сети"""
-        usage = {}
-        
+        """Получение использования сети: rx/tx по интерфейсам с момента предыдущего замера (без ожидания)"""
         try:
-            # Получаем статистику сети
-            counters = psutil.net_io_counters(pernic=True)
-            
-            # Для Linux используем простой подход
-            if os.name == 'posix':
-                # Запоминаем начальные значения
-                counters_before = {}
-                for iface, stats in counters.items():
-                    counters_before[iface] = stats.bytes_sent + stats.bytes_recv
-                
-                # Ждем 0.5 секунды
-                time.sleep(0.5)
-                
-                # Получаем новые значения
-                counters_after = psutil.net_io_counters(pernic=True)
-                
-                # Вычисляем использование для каждого интерфейса
-                for iface in counters:
-                    if iface in counters_before and iface in counters_after:
-                        before = counters_before[iface]
-                        after = counters_after[iface].bytes_sent + counters_after[iface].bytes_recv
-                        delta_bytes = after - before
-                        
-                        # Конвертируем в мегабиты в секунду
-                        delta_mbps = (delta_bytes * 8 * 2) / (1024 * 1024)
-                        usage[iface] = round(delta_mbps, 2)
-                    else:
-                        usage[iface] = 0.0
-            else:
-                # Для других систем используем базовый подход
-                for iface in counters:
-                    usage[iface] = 0.0
-                    
+            return self.network_tracker.sample()
         except Exception as e:
             print(f"[WARNING] Network usage calculation error: {e}")
-            usage = {}
-        
-        return usage
+            return {}
     
     def get_cpu_temperature(self) -> Optional[int]:
         """Get CPU temperature in Celsius as integer"""
         temperature = None
         
         try:
-            if os.name == 'posix':
-                # Попробуем несколько методов для Linux
-                temperature_sources = [
-                    "/sys/class/thermal/thermal_zone0/temp",
-                    "/sys/class/hwmon/hwmon0/temp1_input",
-                    "/sys/class/hwmon/hwmon1/temp1_input",
-                ]
-                
-                for source in temperature_sources:
-                    try:
-                        with open(source, 'r') as f:
-                            temp_raw = f.read().strip()
-                            if temp_raw.isdigit():
-                                temperature = int(int(temp_raw) / 1000)  # Convert from millidegrees to integer
-                                break
-                    except:
-                        continue
-                
-                # Если не удалось через файлы, попробуем через sensors
-                if temperature is None:
-                    try:
-                        sensors_output = subprocess.check_output(['sensors'], stderr=subprocess.DEVNULL).decode(errors='ignore')
-                        temp_match = re.search(r'Core 0:\s*\+(\d+(?:\.\d+)?)°C', sensors_output)
-                        if temp_match:
-                            temperature = int(float(temp_match.group(1)))
-                    except:
-                        pass
+            # Сенсоры пакета/ядер CPU из hwmon и thermal_zone; фоновый сэмплер держит их свежими
+            if not self.metrics_sampler.is_running():
+                self.thermal_monitor.sample()
+            cpu_temperature = self.thermal_monitor.cpu_temperature()
+            if cpu_temperature is not None:
+                temperature = int(cpu_temperature)
+            
+            # Если сенсоры CPU не найдены, попробуем через sensors
+            if temperature is None and os.name == 'posix':
+                try:
+                    sensors_output = RUNNER.check_output(['sensors'], stderr=subprocess.DEVNULL, timeout=5).decode(errors='ignore')
+                    temp_match = re.search(r'(?:Package id \d+|Tctl|Core 0):\s*\+(\d+(?:\.\d+)?)°C', sensors_output)
+                    if temp_match:
+                        temperature = int(float(temp_match.group(1)))
+                except Exception:
+                    pass
                         
         except Exception as e:
             print(f"[WARNING] Failed to get CPU temperature: {e}")
@@ -173,35 +438,48 @@ class Agent:
         print("[INFO] Collecting system information...")
         
         try:
+            # Первый замер счётчиков сети: окном для скорости станет время сбора системной информации
+            self.get_network_usage()
+            
             # Получаем системную информацию
             system_info = self.hardware_analyzer.get_system_info()
             
             # Получаем данные мониторинга
-            cpu_usage = psutil.cpu_percent()
+            cpu_usage = self.metrics_sampler.cpu_usage()
             memory_usage = psutil.virtual_memory().percent
             
             # Получаем информацию о диске
             disk_usage = {}
             try:
                 disk_usage = {"/": psutil.disk_usage('/').percent}
-            except:
+            except Exception:
                 pass
             
             # Получаем GPU usage
             gpu_usage_data = self.get_gpu_usage()
             gpu_usage = gpu_usage_data.get("average", 0) if gpu_usage_data else 0
             
-            # Получаем network usage
-            network_usage = self.get_network_usage()
+            # Получаем network usage: в init прежний формат {интерфейс: rx+tx Мбит/с}
+            network = self.get_network_usage()
+            network_usage = {
+                iface: round(rates["rx_mbps"] + rates["tx_mbps"], 2)
+                for bucket in ("physical", "virtual", "containers")
+                for iface, rates in network.get(bucket, {}).items()
+            }
             
             # Получаем CPU temperature
             cpu_temperature = self.get_cpu_temperature()
             
-            # Получаем IP адрес и определяем локацию
-            ip_address = self.hardware_analyzer.get_ip_address()
-            if ip_address:
-                location = self.hardware_analyzer.get_location_from_ip(ip_address)
-                print(f"[INFO] Detected location: {location} (IP: {ip_address})")
+            # Локация по IP: из кэша, иначе определяется в фоне и досылается heartbeat, init не ждёт её
+            ip_address = system_info.get("ip_address")
+            if ip_address and ip_address != "unknown":
+                location = self.hardware_analyzer.cached_location(ip_address)
+                if location:
+                    print(f"[INFO] Detected location: {location} (IP: {ip_address})")
+                else:
+                    location = "Unknown"
+                    print(f"[INFO] Location for IP {ip_address} is not cached, resolving in background")
+                    self.hardware_analyzer.resolve_location_async(ip_address, self._on_location_resolved)
             else:
                 location = "Unknown"
                 print("[WARNING] Could not detect IP address, using 'Unknown' location")
@@ -244,14 +522,22 @@ class Agent:
     def collect_monitoring_data(self) -> Dict[str, Any]:
         """Собирает данные мониторинга для heartbeat"""
         try:
-            cpu_usage = psutil.cpu_percent()
+            # Агрегаты за окно heartbeat из фонового сэмплера
+            stats = {}
+            if self.metrics_sampler.is_running():
+                stats = self.metrics_sampler.summary(self.settings.heartbeat_interval_s)
+            
+            if "cpu_usage" in stats:
+                cpu_usage = stats["cpu_usage"]["avg"]
+            else:
+                cpu_usage = self.metrics_sampler.cpu_usage()
             memory_usage = psutil.virtual_memory().percent
             
             # Получаем информацию о диске
             disk_usage = {}
             try:
                 disk_usage = {"/": psutil.disk_usage('/').percent}
-            except:
+            except Exception:
                 pass
             
             # Получаем GPU usage
@@ -264,8 +550,29 @@ class Agent:
             
             # Получаем network usage
             network_usage = self.get_network_usage()
-            net_up_mbps = sum(network_usage.values()) if network_usage else 0
-            net_down_mbps = net_up_mbps  # Упрощенная версия
+            
+            # Память и загрузка GPU по контейнерам задач
+            container_gpu_usage = {}
+            try:
+                container_gpu_usage = self.container_gpu_monitor.collect()
+            except Exception as e:
+                print(f"[WARNING] Per-container GPU usage error: {e}")
+            
+            # Дисковый и сетевой I/O по контейнерам (скорости с прошлого heartbeat)
+            container_io = {}
+            try:
+                container_io = self.container_io_monitor.collect()
+            except Exception as e:
+                print(f"[WARNING] Per-container I/O error: {e}")
+            
+            # Температуры и троттлинг CPU/GPU
+            thermal = {}
+            try:
+                if not self.metrics_sampler.is_running():
+                    self.thermal_monitor.sample()
+                thermal = self.thermal_monitor.snapshot()
+            except Exception as e:
+                print(f"[WARNING] Thermal data error: {e}")
             
             return {
                 "gpu_usage": gpu_usage,
@@ -273,9 +580,16 @@ class Agent:
                 "memory_usage": memory_usage,
                 "disk_usage": disk_usage,
                 "network_usage": {
-                    "up_mbps": net_up_mbps,
-                    "down_mbps": net_down_mbps
-                }
+                    "up_mbps": network_usage.get("up_mbps", 0),
+                    "down_mbps": network_usage.get("down_mbps", 0),
+                    "interfaces": network_usage.get("physical", {}),
+                    "virtual": network_usage.get("virtual", {}),
+                    "containers": network_usage.get("containers", {})
+                },
+                "container_gpu_usage": container_gpu_usage,
+                "container_io": container_io,
+                "thermal": thermal,
+                "stats": stats
             }
             
         except Exception as e:
@@ -285,11 +599,94 @@ class Agent:
                 "cpu_usage": 0,
                 "memory_usage": 0,
                 "disk_usage": {},
-                "network_usage": {"up_mbps": 0, "down_mbps": 0}
+                "network_usage": {"up_mbps": 0, "down_mbps": 0},
+                "container_gpu_usage": {},
+                "container_io": {},
+                "thermal": {},
+                "stats": {}
             }
     
-    def process_task(self, task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """Обрабатывает полученную задачу"""
+    def _task_known(self, task_id: Any) -> bool:
+        """Задача уже ждёт в очереди, выполняется или завершилась в окне дедупликации"""
+        return self.task_queue.has_task(task_id) or self.task_dedup.is_known(task_id)
+    
+    @staticmethod
+    def _container_name_for(task: Dict[str, Any]) -> str:
+        return f"task_{task.get('id', int(time.time()))}"
+    
+    @staticmethod
+    def _cancelled_result(container_name: str) -> Dict[str, Any]:
+        return {
+            'status': 'failed',
+            'container_id': '',
+            'container_name': container_name,
+            'error_message': 'Start cancelled by a stop task'
+        }
+    
+    def _run_queued(self, item: QueuedTask) -> None:
+        """Исполнитель очереди: задача, её статус и трасса (с ожиданием в очереди)"""
+        def handle(task: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+            TRACER.add_complete("queue", "task", item.enqueued_us, now_us() - item.enqueued_us,
+                                priority=PRIORITY_NAMES[item.priority])
+            return self.process_task(task, cancel_event=item.cancel_event, cancelled_starts=item.cancels)
+        self.api_client.run_task(item.task, handle, item.poll_started_us, item.poll_dur_us)
+    
+    def process_task(self, task: Dict[str, Any], cancel_event: Optional[threading.Event] = None,
+                     cancelled_starts: List[QueuedTask] = ()) -> Optional[Dict[str, Any]]:
+        """Обрабатывает полученную задачу и учитывает её в метриках"""
+        started = time.perf_counter()
+        task_data = task.get('task_data') or {}
+        operation = (task_data.get('operation') or 'start').strip().lower()
+        task_id = task.get('id')
+        if task_id is not None:
+            result, source = self.task_dedup.execute(task_id, lambda: self._execute_task(task, operation, cancel_event, cancelled_starts))
+            if source != "executed":
+                print(f"[INFO] Task {task_id} was already handled, answering with its outcome ({source}): "
+                      f"container_id={result.get('container_id') if result else None}")
+                return result
+        else:
+            result = self._execute_task(task, operation, cancel_event, cancelled_starts)
+        status = (result.get('status') or 'running') if result else 'failed'
+        TASK_SECONDS.observe(time.perf_counter() - started, operation=operation)
+        TASKS_TOTAL.inc(operation=operation, status=status)
+        return result
+    
+    def _execute_task(self, task: Dict[str, Any], operation: str, cancel_event: Optional[threading.Event] = None,
+                      cancelled_starts: List[QueuedTask] = ()) -> Optional[Dict[str, Any]]:
+        with self._tasks_in_flight_lock:
+            self._tasks_in_flight += 1
+        try:
+            with TRACER.span("process_task", "task", task_id=task.get('id'), operation=operation) as span_args:
+                self._persist_task(task, operation, None, received=True)
+                result = self._process_task(task, cancel_event, cancelled_starts)
+                self._persist_task(task, operation, result)
+                span_args["container_id"] = result.get('container_id') if result else None
+        finally:
+            with self._tasks_in_flight_lock:
+                self._tasks_in_flight -= 1
+        return result
+    
+    def _persist_task(self, task: Dict[str, Any], operation: str, result: Optional[Dict[str, Any]], received: bool = False) -> None:
+        """Записывает задачу (и её контейнер с ресурсами) в базу состояния; сбой записи задачу не прерывает"""
+        task_id = task.get('id')
+        if task_id is None:
+            return
+        try:
+            with TRACER.span("persist", "task", received=received):
+                if received:
+                    self.state_store.record_task(task_id, operation, "received")
+                else:
+                    self.state_store.record_task_result(task_id, operation, result, image=(task.get('task_data') or {}).get('docker_image'))
+        except Exception as e:
+            print(f"[WARNING] Failed to persist task {task_id}: {e}")
+    
+    def _process_task(self, task: Dict[str, Any], cancel_event: Optional[threading.Event] = None,
+                      cancelled_starts: List[QueuedTask] = ()) -> Optional[Dict[str, Any]]:
+        """Обрабатывает полученную задачу.
+        cancel_event — отмена запуска управляющей задачей; cancelled_starts — запуски, которые отменила эта задача.
+        """
+        parse_started_us = now_us()
+        parse_started = time.perf_counter()
         try:
             print(f"[INFO] Processing task: {task.get('id')}")
             
@@ -301,6 +698,19 @@ class Agent:
             if operation in {'stop', 'stop_remove'}:
                 container_id = task_data.get('container_id') or container_info.get('container_id')
                 container_name = task_data.get('container_name') or container_info.get('container_name')
+                if cancelled_starts:
+                    # Дожидаемся отменённого запуска: если контейнер так и не создан, останавливать нечего
+                    for start in cancelled_starts:
+                        start.done.wait()
+                    existing = self.container_manager.container_id(container_id or container_name)
+                    if existing is None:
+                        print(f"[INFO] Start of {container_name} was cancelled before the container was created")
+                        return {
+                            'status': 'completed',
+                            'container_id': container_id or '',
+                            'container_name': container_name
+                        }
+                    container_id = existing
                 if not container_id:
                     print("[ERROR] CONTROL task missing container_id")
                     try:
@@ -435,11 +845,17 @@ class Agent:
             
             # Формируем имя контейнера (без зависимости от username)
             task_id = task.get('id', int(time.time()))
-            container_name = f"task_{task_id}"
+            container_name = self._container_name_for(task)
+            if cancel_event is not None and cancel_event.is_set():
+                print(f"[INFO] Start of {container_name} cancelled while queued")
+                return self._cancelled_result(container_name)
             
             # Вычисляем Jupyter порт (на 1 больше SSH порта)
             jup_port = ssh_port + 1
 
+            TRACER.add_complete("parse", "task", parse_started_us, int((time.perf_counter() - parse_started) * 1_000_000),
+                                image=docker_image, gpus=gpus_param, cpuset=cpuset_cpus, memory_gb=memory_gb)
+            
             # Используем ContainerManager для создания контейнера
             try:
                 self.api_client.send_log(f"task start requested: id={task_id} image={docker_image}")
@@ -458,8 +874,11 @@ class Agent:
                 memory_gb=memory_gb,
                 memory_swap_gb=memory_gb,
                 shm_size_gb=shm_size_gb,
-                storage_gb=storage_gb
+                storage_gb=storage_gb,
+                cancel_event=cancel_event
             )
+            if cancel_event is not None and cancel_event.is_set() and not container_id:
+                return self._cancelled_result(container_name)
             
             # Формируем результат
             result = {
@@ -495,6 +914,13 @@ class Agent:
             
             return result
                 
+        except StartCancelled as e:
+            print(f"[INFO] {e}")
+            try:
+                self.api_client.send_log(f"task start cancelled: id={task.get('id')}")
+            except Exception:
+                pass
+            return self._cancelled_result(self._container_name_for(task))
         except Exception as e:
             print(f"[ERROR] Task processing failed: {e}")
             try:
@@ -542,9 +968,26 @@ class Agent:
         else:
             print("[INFO] Docker GPU support confirmed")
         
-        # Собираем данные о системе
-        system_data = self.collect_system_data()
-        print(json.dumps(system_data, indent=2, ensure_ascii=False))
+        # Отпечаток железа: если дешёвая проверка не видит изменений, полный сбор system_data не нужен
+        previous = self.fingerprint_store.load()
+        self._restore_network_selftest(previous)
+        precheck_digest = hardware_fingerprint.precheck()
+        already_confirmed = bool(self.agent_id)
+        system_data = None
+        fingerprint = previous
+        if (already_confirmed and previous and precheck_digest
+                and previous.get("precheck") == precheck_digest and hardware_fingerprint.FingerprintStore.is_fresh(previous)):
+            print(f"[INFO] Hardware unchanged since last init (fingerprint {previous['fingerprint'][:12]}), skipping system data collection")
+            init_data = {"fingerprint": previous["fingerprint"], "incremental": True, "changed_sections": [], "status": "online"}
+            self._restore_disk_benchmark(previous, previous["sections"].get("disks"))
+        else:
+            system_data = self.collect_system_data()
+            fingerprint = hardware_fingerprint.compute(system_data)
+            self._restore_disk_benchmark(previous, fingerprint["sections"].get("disks"), system_data)
+            print(json.dumps(system_data, indent=2, ensure_ascii=False))
+            init_data = self._build_init_data(system_data, fingerprint, previous if already_confirmed else None)
+        if self.disk_benchmark:
+            init_data["disk_benchmark"] = self.disk_benchmark["result"]
         
         if not self.agent_id:
             # Первый запуск — делаем confirm
@@ -577,8 +1020,21 @@ class Agent:
         # Отправляем init данные
         print(f"[INFO] Sending init data to server for agent_id: {self.agent_id}")
         try:
-            success = self.api_client.send_init_data(system_data)
+            success = self.api_client.send_init_data(init_data)
+            if not success and init_data.get("incremental"):
+                # Сервер не принял инкрементальный init — отправляем полные данные
+                print("[WARNING] Incremental init rejected, sending full system data")
+                if system_data is None:
+                    system_data = self.collect_system_data()
+                    fingerprint = hardware_fingerprint.compute(system_data)
+                success = self.api_client.send_init_data(self._build_init_data(system_data, fingerprint, None))
             if success:
+                if system_data is not None:
+                    try:
+                        extra = {"disk_benchmark": self.disk_benchmark} if self.disk_benchmark else None
+                        self.fingerprint_store.save(fingerprint, precheck_digest, extra)
+                    except OSError as e:
+                        print(f"[WARNING] Failed to save hardware fingerprint: {e}")
                 try:
                     self.api_client.send_log("agent init sent")
                 except Exception:
@@ -617,10 +1073,11 @@ class Agent:
                 pass
             return
         
-        # Запускаем polling в отдельном потоке
+        # Запускаем polling в отдельном потоке; задачи исполняются из локальной очереди по приоритету
         print("[INFO] Starting polling thread...")
         try:
-            polling_thread = self.api_client.start_polling_thread(self.process_task)
+            self.task_queue.start()
+            polling_thread = self.api_client.start_polling_thread(self.process_task, dispatch=self.task_queue.submit)
             print("[INFO] Polling thread started successfully")
             try:
                 self.api_client.send_log("polling started")
@@ -634,29 +1091,90 @@ class Agent:
                 pass
             return
         
+        # Локальный endpoint метрик (если включен)
+        if self.settings.metrics_port is not None:
+            try:
+                self.metrics_server = MetricsServer(host=self.settings.metrics_host, port=self.settings.metrics_port)
+                self.metrics_server.routes["/debug/profile"] = self.profiler.http_route
+                self.metrics_server.start()
+                print(f"[INFO] Metrics endpoint: http://{self.settings.metrics_host}:{self.metrics_server.port}/metrics")
+            except Exception as e:
+                print(f"[WARNING] Failed to start metrics endpoint: {e}")
+                self.metrics_server = None
+        
+        # Профилирование по сигналу: kill -USR2 <pid>
+        if self.profiler.install_signal_handler():
+            print(f"[INFO] Profiler armed: send SIGUSR2 to pid {os.getpid()} to profile for {self.profiler.default_duration_s:.0f}s")
+        
+        # Запускаем фоновый сэмплер метрик
+        try:
+            self.metrics_sampler.start()
+            print(f"[INFO] Metrics sampler started (interval {self.settings.sample_interval_s}s)")
+        except Exception as e:
+            print(f"[WARNING] Failed to start metrics sampler: {e}")
+        
+        # Отслеживание изменений железа (hot-plug дисков, выпадение GPU, смена линка NIC)
+        try:
+            self.hardware_analyzer.start_watch(self.settings.hardware_watch_interval_s)
+        except Exception as e:
+            print(f"[WARNING] Failed to start hardware watch: {e}")
+        
+        # Замер диска в простое, если включён и ещё не сделан для текущего набора дисков
+        if self.settings.disk_benchmark and self.disk_benchmark is None:
+            threading.Thread(target=self._disk_benchmark_loop, name="disk-benchmark", daemon=True).start()
+        
+        # Самопроверка канала до настроенного endpoint
+        if self.settings.network_selftest_url:
+            threading.Thread(target=self._network_selftest_loop, name="network-selftest", daemon=True).start()
+        
         print("[INFO] Agent initialization completed. Starting main loop...")
         
-        # Основной цикл с периодической отправкой heartbeat
-        heartbeat_counter = 0
+        # Основной цикл: периодические heartbeat по расписанию и внеочередные по событиям
         print("[INFO] Main loop started. Agent is running...")
+        print(f"[INFO] First heartbeat in {self.heartbeat_scheduler.seconds_until_next():.0f}s, then every {self.settings.heartbeat_interval_s}s")
         
         try:
             while True:
-                time.sleep(60)
-                heartbeat_counter += 1
-                
-                # Каждые 5 минут отправляем heartbeat
-                if heartbeat_counter >= 5:
+                scheduled = self.heartbeat_scheduler.wait()
+                if scheduled is None:
+                    break
+                kind, reasons = scheduled
+                if reasons:
+                    print(f"[INFO] Sending {kind} heartbeat: {', '.join(reasons)}")
+                # Соединение, закрытое сервером за время простоя, открывается заново, пока собирается мониторинг
+                self.api_client.warm_up()
+                try:
+                    monitoring_data = self.collect_monitoring_data()
+                    if reasons:
+                        monitoring_data["events"] = reasons
+                    # Время сбора по часам backend: отчёты разных агентов сравнимы между собой
+                    monitoring_data["clock"] = self.api_client.transport.clock.report()
+                    with self._hardware_changes_lock:
+                        hardware_changes = set(self._hardware_changes)
+                    if "identity" in hardware_changes:
+                        monitoring_data.update(self._identity)
+                    if hardware_changes - {"identity"}:
+                        total_ram_gb, ram_type = self.hardware_analyzer.get_ram_info()
+                        monitoring_data["hardware_info"] = self.hardware_analyzer.get_hardware_info()
+                        monitoring_data["total_ram_gb"] = total_ram_gb
+                        monitoring_data["ram_type"] = ram_type
+                        if self.disk_benchmark:
+                            monitoring_data["disk_benchmark"] = self.disk_benchmark["result"]
+                    heartbeat_ok = self.api_client.send_heartbeat(monitoring_data)
+                    if heartbeat_ok and hardware_changes:
+                        with self._hardware_changes_lock:
+                            self._hardware_changes -= hardware_changes
+                    if heartbeat_ok:
+                        # Backend снова доступен — досылаем статусы задач, не отправленные ранее
+                        self.api_client.flush_status_queue()
+                    if kind == "periodic":
+                        self.state_store.prune_tasks(TASK_HISTORY_S)
+                except Exception as e:
+                    print(f"[WARNING] Heartbeat failed: {e}")
                     try:
-                        monitoring_data = self.collect_monitoring_data()
-                        self.api_client.send_heartbeat(monitoring_data)
-                    except Exception as e:
-                        print(f"[WARNING] Heartbeat failed: {e}")
-                        try:
-                            self.api_client.send_log(f"heartbeat exception: {e}")
-                        except Exception:
-                            pass
-                    heartbeat_counter = 0
+                        self.api_client.send_log(f"heartbeat exception: {e}")
+                    except Exception:
+                        pass
                     
         except KeyboardInterrupt:
             print("[INFO] Received interrupt signal. Shutting down...")
@@ -672,7 +1190,16 @@ class Agent:
                 pass
         finally:
             # Закрываем соединения
+            self._stop_event.set()
+            self.heartbeat_scheduler.stop()
+            self.task_queue.stop()
+            self.hardware_analyzer.stop_watch()
+            self.metrics_sampler.stop()
+            self.thermal_monitor.close()
+            if self.metrics_server is not None:
+                self.metrics_server.stop()
             self.api_client.close()
+            self.state_store.close()
             print("[INFO] Agent shutdown completed")
             try:
                 if self.api_client.agent_id:
@@ -681,16 +1208,48 @@ class Agent:
                 pass
 
 
+def _parse_cli() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="GPUniq agent")
+    p.add_argument("secret_key", help="секретный ключ агента")
+    p.add_argument("--heartbeat-interval", type=int, default=AgentSettings.heartbeat_interval_s, help="период heartbeat, сек")
+    p.add_argument("--heartbeat-phase", type=float, default=None, help="сдвиг фазы heartbeat, сек (по умолчанию случайный)")
+    p.add_argument("--metrics-host", default=AgentSettings.metrics_host, help="интерфейс для /metrics")
+    p.add_argument("--metrics-port", type=int, default=None, help="порт /metrics (по умолчанию выключен)")
+    p.add_argument("--profile-dir", default=AgentSettings.profile_dir, help="каталог для профилей")
+    p.add_argument("--trace-dir", default=AgentSettings.trace_dir, help="каталог для trace-файлов задач")
+    p.add_argument("--trace-max-files", type=int, default=AgentSettings.trace_max_files, help="сколько последних трасс хранить (0 — выключено)")
+    p.add_argument("--sample-interval", type=float, default=AgentSettings.sample_interval_s, help="период сэмплирования метрик, сек")
+    p.add_argument("--disk-benchmark", action="store_true", help="замерить скорость диска data-root Docker в простое")
+    p.add_argument("--network-selftest-url", default=None, help="endpoint самопроверки канала (GET /download, POST /upload)")
+    p.add_argument("--gpu-sample-interval", type=float, default=AgentSettings.gpu_sample_interval_s, help="период опроса GPU, сек")
+    p.add_argument("--sync", action="store_true", help="режим sync: задачи, heartbeat, статусы и логи одним запросом")
+    p.add_argument("--sync-interval", type=float, default=AgentSettings.sync_interval_s, help="период sync, сек")
+    p.add_argument("--json-only", action="store_true", help="не переходить на MessagePack/CBOR, даже если сервер их поддерживает")
+    return p.parse_args()
+
+
 def main():
     """Точка входа"""
-    if len(sys.argv) < 2:
-        print("Usage: python agent.py <secret_key>")
-        sys.exit(1)
-    
-    secret_key = sys.argv[1]
+    args = _parse_cli()
+    settings = AgentSettings(
+        heartbeat_interval_s=args.heartbeat_interval,
+        heartbeat_phase_s=args.heartbeat_phase,
+        sample_interval_s=args.sample_interval,
+        gpu_sample_interval_s=args.gpu_sample_interval,
+        metrics_host=args.metrics_host,
+        metrics_port=args.metrics_port,
+        profile_dir=args.profile_dir,
+        trace_dir=args.trace_dir,
+        trace_max_files=args.trace_max_files,
+        disk_benchmark=args.disk_benchmark,
+        network_selftest_url=args.network_selftest_url,
+        sync_mode=args.sync,
+        sync_interval_s=args.sync_interval,
+        binary_encoding=not args.json_only,
+    )
     
     # Создаем и запускаем агента
-    agent = Agent(secret_key)
+    agent = Agent(args.secret_key, settings=settings)
     agent.run()
 
 
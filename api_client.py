@@ -3,10 +3,30 @@
 
 
 import requests
-import json
 import time
 import threading
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, Callable, List, Tuple
+
+from metrics import REGISTRY
+from task_trace import TRACER, now_us
+from transport import Transport
+from wire_codec import WireCodec, API_PAYLOAD_BYTES
+
+
+API_REQUEST_SECONDS = REGISTRY.histogram("gpuniq_agent_api_request_duration_seconds", "Длительность запросов к backend по endpoint")
+API_ERRORS = REGISTRY.counter("gpuniq_agent_api_errors_total", "Ошибки запросов к backend по endpoint и причине")
+POLL_TASKS = REGISTRY.counter("gpuniq_agent_poll_tasks_total", "Задачи, полученные через pull")
+HEARTBEAT_PAYLOAD_BYTES = REGISTRY.gauge("gpuniq_agent_heartbeat_payload_bytes", "Размер последнего heartbeat, байт")
+POLL_BATCH_SIZE = REGISTRY.histogram("gpuniq_agent_poll_batch_size", "Задач в одном непустом ответе pull",
+                                     buckets=(1, 2, 5, 10, 20, 50, 100))
+
+# Сколько задач просить за один pull (сервер со старым API всё равно вернёт одну)
+DEFAULT_PULL_BATCH_SIZE = 20
+# Минимальная пауза между pull подряд, когда сервер отдал полный пакет
+MIN_PULL_GAP_S = 0.5
+
+# Сколько раз досылать статус из очереди, прежде чем отбросить (сервер мог отвергнуть его окончательно)
+STATUS_QUEUE_MAX_ATTEMPTS = 20
 
 
 class APIClient:
@@ -16,14 +36,41 @@ class APIClient:
         self.base_url = base_url
         self.agent_id = agent_id
         self.secret_key = secret_key
-        self.session = requests.Session()
-        self.session.timeout = 15
+        # Сессия с пулом на каждый поток, keep-alive, кэш DNS и таймауты по endpoint
+        self.transport = Transport()
+        # Кодировка тел запросов: JSON, пока сервер не объявит MessagePack/CBOR
+        self.codec = WireCodec()
+        # База состояния агента: статусы, которые не удалось отправить, ставятся в очередь и досылаются
+        self.state_store = None
+        self.poll_interval_s = 10.0
+        self.pull_batch_size = DEFAULT_PULL_BATCH_SIZE
+        # task_known(task_id) -> bool: задача уже выполнена, выполняется или ждёт в локальной очереди
+        self.task_known: Optional[Callable[[Any], bool]] = None
+        self._stop_event = threading.Event()
+        # Режим sync (enable_sync): pull, heartbeat, статусы и логи идут одним периодическим запросом
+        self.sync = None
         
     def set_credentials(self, agent_id: str, secret_key: str):
         """Устанавливает учетные данные агента"""
         self.agent_id = agent_id
         self.secret_key = secret_key
     
+    def enable_sync(self, interval_s: float = 10.0):
+        """Включает режим sync; при отказе сервера клиент сам вернётся к pull + heartbeat"""
+        from sync_session import SyncSession
+        self.sync = SyncSession(self, interval_s)
+        return self.sync
+    
+    def warm_up(self) -> None:
+        """Заранее открывает соединение для ближайшего запроса из текущего потока (перед heartbeat)"""
+        if self._sync_active():
+            # heartbeat уходит из потока sync, соединение которого не простаивает
+            return
+        self.transport.warm_up(self.base_url)
+    
+    def _sync_active(self) -> bool:
+        return self.sync is not None and self.sync.supported
+    
     def _get_headers(self) -> Dict[str, str]:
         """Возвращает заголовки для запросов"""
         headers = {
@@ -33,17 +80,59 @@ class APIClient:
             headers["X-Agent-Secret-Key"] = self.secret_key
         return headers
     
+    def _post(self, endpoint: str, url: str, json: Any = None, **kwargs) -> requests.Response:
+        """POST с учётом длительности и ошибок в метриках.
+        Тело json кодируется согласованной с сервером кодировкой; на 415 запрос повторяется в JSON.
+        """
+        response = self._send(endpoint, url, json, **kwargs)
+        if response.status_code == 415 and json is not None and self.codec.rejected():
+            response = self._send(endpoint, url, json, **kwargs)
+        if response.status_code == 200:
+            self.codec.negotiate(response)
+        return response
+    
+    def _send(self, endpoint: str, url: str, payload: Any, **kwargs) -> requests.Response:
+        if payload is not None:
+            body, content_type = self.codec.encode(payload)
+            kwargs["data"] = body
+            kwargs["headers"] = dict(kwargs.get("headers") or {}, **{"Content-Type": content_type, "Accept": self.codec.accept()})
+            API_PAYLOAD_BYTES.set(len(body), endpoint=endpoint, encoding=content_type.split(";")[0].split("/")[-1])
+            if endpoint == "heartbeat":
+                HEARTBEAT_PAYLOAD_BYTES.set(len(body))
+        started = time.perf_counter()
+        try:
+            with TRACER.span(f"POST {endpoint}", "http", url=url) as span_args:
+                response = self.transport.request("POST", endpoint, url, **kwargs)
+                span_args["status"] = response.status_code
+        except requests.exceptions.Timeout:
+            API_ERRORS.inc(endpoint=endpoint, reason="timeout")
+            raise
+        except requests.exceptions.ConnectionError:
+            API_ERRORS.inc(endpoint=endpoint, reason="connection_error")
+            raise
+        except Exception:
+            API_ERRORS.inc(endpoint=endpoint, reason="exception")
+            raise
+        finally:
+            API_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+        if response.status_code != 200:
+            API_ERRORS.inc(endpoint=endpoint, reason=f"http_{response.status_code}")
+        return response
+    
     def send_log(self, message: str) -> bool:
         """Отправляет короткое лог-сообщение на бэкенд
         POST /v1/agents/{agent_id}/logs, body {"message": "..."}
         """
         if not self.agent_id:
             return False
+        if self._sync_active():
+            self.sync.add_log(str(message))
+            return True
         url = f"{self.base_url}/v1/agents/{self.agent_id}/logs"
         # Логи не требуют аутентификацию; отправляем только content-type
         headers = {"Content-Type": "application/json"}
         try:
-            resp = self.session.post(url, headers=headers, json={"message": str(message)}, timeout=5)
+            resp = self._post("logs", url, headers=headers, json={"message": str(message)})
             return resp.status_code == 200
         except Exception:
             # Ничего не печатаем и не ретраим, чтобы не зациклиться
@@ -55,9 +144,9 @@ class APIClient:
         headers = self._get_headers()
         
         try:
-            response = self.session.post(url, headers=headers, json=data, timeout=10)
+            response = self._post("confirm", url, headers=headers, json=data)
             
-            resp_json = response.json()
+            resp_json = self.codec.decode(response)
             agent_id = None
             
             if resp_json and isinstance(resp_json, dict):
@@ -86,10 +175,10 @@ class APIClient:
         headers = self._get_headers()
         
         try:
-            response = self.session.post(url, headers=headers, json=data, timeout=10)
+            response = self._post("init", url, headers=headers, json=data)
             
             if response.status_code == 200:
-                resp_json = response.json()
+                resp_json = self.codec.decode(response)
                 if resp_json.get('exception') == 0:
                     return True
                 else:
@@ -115,11 +204,92 @@ class APIClient:
                 pass
             return False
     
-    def poll_for_tasks(self, callback: callable) -> None:
-        """Опрашивает сервер на наличие задач"""
+    def run_task(self, full_task: Dict[str, Any], callback: callable, poll_started_us: Optional[int] = None,
+                 poll_dur_us: int = 0) -> bool:
+        """Выполняет задачу через callback и отправляет её статус; True — задача обработана"""
+        task_id = full_task['id']
+        # Трасса жизненного цикла задачи: от получения до отправки статуса
+        TRACER.begin(task_id)
+        if poll_started_us is not None:
+            TRACER.add_complete("poll", "api", poll_started_us, poll_dur_us, task_id=task_id)
+        try:
+            # Вызываем callback с задачей
+            try:
+                result = callback(full_task)
+                if result:
+                    # Отправляем статус задачи
+                    self.send_task_status(task_id, result)
+                    return True
+                print(f"[ERROR] Failed to process task {task_id}")
+                try:
+                    self.send_log(f"task process failed: id={task_id}")
+                except Exception:
+                    pass
+                return False
+            except Exception as e:
+                print(f"[ERROR] Task processing failed: {e}")
+                try:
+                    self.send_log(f"task processing exception: id={task_id} error={e}")
+                except Exception:
+                    pass
+                return False
+        finally:
+            TRACER.end()
+    
+    @staticmethod
+    def tasks_from_pull(data: Any) -> Tuple[List[Dict[str, Any]], List[Any]]:
+        """Задачи из ответа pull: пакет {"tasks": [...]} (или сразу список) и прежняя форма с одной задачей.
+        Возвращает (полные задачи, некорректные записи).
+        """
+        if isinstance(data, list):
+            entries = data
+        elif isinstance(data, dict) and isinstance(data.get('tasks'), list):
+            entries = data['tasks']
+        elif isinstance(data, dict) and data.get('task_id') is not None:
+            entries = [data]
+        else:
+            entries = []
+        tasks, invalid = [], []
+        for entry in entries:
+            if not isinstance(entry, dict) or entry.get('task_data') is None or entry.get('container_info') is None:
+                invalid.append(entry)
+                continue
+            tasks.append({
+                'id': entry.get('task_id', entry.get('id')),
+                'task_data': entry['task_data'],
+                'container_info': entry['container_info']
+            })
+        return tasks, invalid
+    
+    def more_tasks_waiting(self, tasks: List[Dict[str, Any]]) -> bool:
+        """Стоит ли сразу повторить pull: пакет заполнен целиком и в нём есть новые задачи.
+        Вызывается до передачи задач в очередь. Неполный пакет значит, что очередь на сервере пуста;
+        пакет из уже известных задач — повторная доставка неподтверждённых, и немедленный повтор вернул бы их же.
+        """
+        if len(tasks) < self.pull_batch_size:
+            return False
+        if self.task_known is None:
+            return True
+        try:
+            return not all(self.task_known(task['id']) for task in tasks)
+        except Exception as e:
+            print(f"[WARNING] Task index check failed: {e}")
+            return False
+
+    def poll_for_tasks(self, callback: callable, dispatch: Optional[callable] = None) -> None:
+        """Опрашивает сервер на наличие задач.
+        Запрашивает до pull_batch_size задач за раз; сервер может вернуть пакет или одну задачу в прежнем формате.
+        Пока сервер отдаёт полные пакеты новых задач, следующий запрос идёт через MIN_PULL_GAP_S, без паузы poll_interval_s.
+        Без dispatch задача выполняется здесь же через callback; с dispatch(task, poll_started_us, poll_dur_us)
+        она передаётся в очередь исполнения.
+        В режиме sync задачи приходят в ответах sync; если сервер его не поддерживает, опрос продолжается через pull.
+        """
         if not self.agent_id:
             print("[ERROR] Agent ID not set")
             return
+        
+        if self._sync_active():
+            self.sync.run(dispatch or (lambda task, *args: self.run_task(task, callback, *args)), self._stop_event)
             
         url = f"{self.base_url}/v1/agents/{self.agent_id}/tasks/pull"
         headers = self._get_headers()
@@ -127,13 +297,17 @@ class APIClient:
         consecutive_errors = 0
         max_consecutive_errors = 5
         
-        while True:
+        while not self._stop_event.is_set():
+            more_waiting = False
             try:
                 # print(f"[DEBUG] Polling for tasks from {url}")
-                response = self.session.post(url, headers=headers, timeout=15)
+                poll_started_us = now_us()
+                poll_started = time.perf_counter()
+                response = self._post("pull", url, headers=headers, json={"max_tasks": self.pull_batch_size})
+                poll_dur_us = int((time.perf_counter() - poll_started) * 1_000_000)
                 
                 if response.status_code == 200:
-                    resp_json = response.json()
+                    resp_json = self.codec.decode(response)
                     
                     # Проверяем exception поле
                     if resp_json.get('exception') != 0:
@@ -143,72 +317,51 @@ class APIClient:
                         except Exception:
                             pass
                         consecutive_errors += 1
-                        time.sleep(10)
+                        self._stop_event.wait(self.poll_interval_s)
                         continue
                     
                     data = resp_json.get('data', {})
-                    task_id = data.get('task_id')
-                    task_data = data.get('task_data')
-                    container_info = data.get('container_info')
-                    message = data.get('message', '')
+                    tasks, invalid = self.tasks_from_pull(data)
+                    more_waiting = self.more_tasks_waiting(tasks)
                     
-                    # print(f"[INFO] Server response: {message}")
+                    if invalid:
+                        print(f"[WARNING] Invalid task data received: {invalid}")
+                        try:
+                            self.send_log("invalid task data received")
+                        except Exception:
+                            pass
+                        consecutive_errors += 1
+                    elif not tasks:
+                        # print(f"[INFO] No tasks available: {data.get('message', '')}")
+                        consecutive_errors = 0
                     
-                    if task_id is not None and task_data is not None and container_info is not None:
-                        print(f"[INFO] New task received:")
-                        
-                        print(f"  Data: {data}")
-
-                        print(f"  Task ID: {task_id}")
-                        print(f"  Docker Image: {task_data.get('docker_image')}")
-                        print(f"  SSH Username: {container_info.get('ssh_username')}")
-                        print(f"  SSH Port: {container_info.get('ssh_port')}")
-                        print(f"  SSH Command: {container_info.get('ssh_command')}")
+                    if tasks:
+                        POLL_TASKS.inc(len(tasks))
+                        POLL_BATCH_SIZE.observe(len(tasks))
+                        for full_task in tasks:
+                            task_data = full_task['task_data']
+                            container_info = full_task['container_info']
+                            print(f"[INFO] New task received:")
+                            print(f"  Task ID: {full_task['id']}")
+                            print(f"  Docker Image: {task_data.get('docker_image')}")
+                            print(f"  SSH Username: {container_info.get('ssh_username')}")
+                            print(f"  SSH Port: {container_info.get('ssh_port')}")
+                            print(f"  SSH Command: {container_info.get('ssh_command')}")
                         try:
-                            op = (task_data.get('operation') or 'start').strip().lower()
-                            self.send_log(f"task received: id={task_id} op={op}")
+                            ops = ", ".join(f"id={t['id']} op={(t['task_data'].get('operation') or 'start').strip().lower()}" for t in tasks)
+                            self.send_log(f"task received: {ops}")
                         except Exception:
                             pass
                         
-                        # Создаем полную задачу
-                        full_task = {
-                            'id': task_id,
-                            'task_data': task_data,
-                            'container_info': container_info
-                        }
-                        
-                        # Вызываем callback с задачей
-                        try:
-                            result = callback(full_task)
-                            if result:
-                                # Отправляем статус задачи
-                                self.send_task_status(task_id, result)
+                        for full_task in tasks:
+                            if dispatch is not None:
+                                # Задача уходит в локальную очередь; статус отправит её исполнитель
+                                dispatch(full_task, poll_started_us, poll_dur_us)
+                                consecutive_errors = 0
+                            elif self.run_task(full_task, callback, poll_started_us, poll_dur_us):
                                 consecutive_errors = 0
                             else:
-                                print(f"[ERROR] Failed to process task {task_id}")
-                                try:
-                                    self.send_log(f"task process failed: id={task_id}")
-                                except Exception:
-                                    pass
                                 consecutive_errors += 1
-                        except Exception as e:
-                            print(f"[ERROR] Task processing failed: {e}")
-                            try:
-                                self.send_log(f"task processing exception: id={task_id} error={e}")
-                            except Exception:
-                                pass
-                            consecutive_errors += 1
-                            
-                    elif task_id is None:
-                        # print(f"[INFO] No tasks available: {message}")
-                        consecutive_errors = 0
-                    else:
-                        print(f"[WARNING] Invalid task data received: {data}")
-                        try:
-                            self.send_log("invalid task data received")
-                        except Exception:
-                            pass
-                        consecutive_errors += 1
                 else:
                     print(f"[WARNING] Server returned status {response.status_code}")
                     # print(f"[DEBUG] Server response: {response.text}")
@@ -243,9 +396,12 @@ class APIClient:
             # Если слишком много ошибок подряд, увеличиваем интервал
             if consecutive_errors >= max_consecutive_errors:
                 print(f"[WARNING] Too many consecutive errors ({consecutive_errors}), increasing poll interval")
-                time.sleep(60)
+                self._stop_event.wait(60)
+            elif more_waiting:
+                # Пакет заполнен новыми задачами — на сервере могут ждать ещё, забираем без полной паузы
+                self._stop_event.wait(MIN_PULL_GAP_S)
             else:
-                time.sleep(10)
+                self._stop_event.wait(self.poll_interval_s)
     
     def send_task_status(self, task_id: str, container_info: Dict[str, Any]) -> bool:
         """Отправляет статус задачи
@@ -261,9 +417,6 @@ class APIClient:
             print("[ERROR] Agent ID not set")
             return False
             
-        url = f"{self.base_url}/v1/agents/{self.agent_id}/tasks/{task_id}/status"
-        headers = self._get_headers()
-        
         status = container_info.get("status") or "running"
         data = {
             "status": status,
@@ -283,11 +436,38 @@ class APIClient:
             if container_info.get('error_message'):
                 data["error_message"] = container_info.get('error_message')
         
+        if self._sync_active():
+            # Уйдёт ближайшим sync-запросом; до подтверждения сервером хранится в очереди
+            try:
+                self.sync.add_status(task_id, data)
+                return True
+            except Exception as e:
+                print(f"[WARNING] Failed to queue task status for sync: {e}")
+        if self.state_store is not None:
+            # Более новый статус заменяет недосланные старые, чтобы они не пришли после него
+            try:
+                self.state_store.drop_statuses(task_id)
+            except Exception as e:
+                print(f"[WARNING] Failed to update task status queue: {e}")
+        if self._send_status_body(task_id, data):
+            return True
+        if self.state_store is not None:
+            try:
+                self.state_store.enqueue_status(task_id, data)
+                print(f"[INFO] Task {task_id} status queued for retry")
+            except Exception as e:
+                print(f"[WARNING] Failed to queue task status: {e}")
+        return False
+    
+    def _send_status_body(self, task_id: str, data: Dict[str, Any]) -> bool:
+        url = f"{self.base_url}/v1/agents/{self.agent_id}/tasks/{task_id}/status"
+        headers = self._get_headers()
+        
         try:
-            response = self.session.post(url, headers=headers, json=data, timeout=10)
+            response = self._post("status", url, headers=headers, json=data)
             
             if response.status_code == 200:
-                resp_json = response.json()
+                resp_json = self.codec.decode(response)
                 if resp_json.get('exception') == 0:
                     return True
                 else:
@@ -313,6 +493,25 @@ class APIClient:
                 pass
             return False
     
+    def flush_status_queue(self, limit: int = 100) -> int:
+        """Досылает статусы из очереди по порядку; на первой ошибке останавливается. Возвращает число отправленных"""
+        if self.state_store is None or not self.agent_id or self._sync_active():
+            return 0
+        sent = 0
+        for entry in self.state_store.pending_statuses(limit):
+            if entry["attempts"] >= STATUS_QUEUE_MAX_ATTEMPTS:
+                print(f"[WARNING] Dropping task {entry['task_id']} status after {entry['attempts']} attempts")
+                self.state_store.ack_status(entry["id"])
+                continue
+            if not self._send_status_body(entry["task_id"], entry["payload"]):
+                self.state_store.retry_status(entry["id"])
+                break
+            self.state_store.ack_status(entry["id"])
+            sent += 1
+        if sent:
+            print(f"[INFO] Sent {sent} queued task status update(s)")
+        return sent
+    
     def send_heartbeat(self, monitoring_data: Dict[str, Any]) -> bool:
         """Отправляет heartbeat с информацией о состоянии агента"""
         if not self.agent_id:
@@ -327,11 +526,14 @@ class APIClient:
             **monitoring_data
         }
         
+        if self._sync_active():
+            return self.sync.submit_heartbeat(data)
+        
         try:
-            response = self.session.post(url, headers=headers, json=data, timeout=10)
+            response = self._post("heartbeat", url, headers=headers, json=data)
             
             if response.status_code == 200:
-                resp_json = response.json()
+                resp_json = self.codec.decode(response)
                 if resp_json.get('exception') == 0:
                     return True
                 else:
@@ -357,14 +559,16 @@ class APIClient:
                 pass
             return False
     
-    def start_polling_thread(self, callback: callable) -> threading.Thread:
+    def start_polling_thread(self, callback: callable, dispatch: Optional[callable] = None) -> threading.Thread:
         """Запускает поток для опроса задач"""
-        polling_thread = threading.Thread(target=self.poll_for_tasks, args=(callback,), daemon=True)
+        polling_thread = threading.Thread(target=self.poll_for_tasks, args=(callback, dispatch), name="task-polling", daemon=True)
         polling_thread.start()
         print("[INFO] Polling thread started successfully")
         return polling_thread
     
     def close(self):
-        """Закрывает сессию"""
-        if self.session:
-            self.session.close()
+        """Останавливает опрос задач и закрывает сессии"""
+        self._stop_event.set()
+        if self.sync is not None:
+            self.sync.wake()
+        self.transport.close()
@@ -7,6 +7,8 @@ import time
 import os
 from typing import Optional, Dict, Any
 from clean_manager import ContainerManager
+from command_runner import RUNNER
+from task_trace import TRACER
 
 
 class APIContainerManager(ContainerManager):
@@ -14,15 +16,15 @@ class APIContainerManager(ContainerManager):
         """Проверяет и устанавливает Docker если необходимо"""
         try:
             # Проверяем, работает ли Docker
-            result = subprocess.run(['docker', 'ps'], check=True, capture_output=True)
+            result = RUNNER.run(['docker', 'ps'], check=True, capture_output=True)
             print("[INFO] Docker is working correctly")
             return True
-        except (subprocess.CalledProcessError, FileNotFoundError):
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
             print("[INFO] Docker not working, attempting to fix...")
             
             # Проверяем, установлен ли Docker
             try:
-                subprocess.run(['docker', '--version'], check=True, capture_output=True)
+                RUNNER.run(['docker', '--version'], check=True, capture_output=True)
                 print("[INFO] Docker is installed but not working")
                 
                 # Исправляем права
@@ -33,7 +35,7 @@ class APIContainerManager(ContainerManager):
                     print("[WARNING] Could not fix Docker permissions")
                     return False
                     
-            except (subprocess.CalledProcessError, FileNotFoundError):
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
                 print("[INFO] Docker not found, please install Docker manually")
                 return False
 
@@ -44,11 +46,11 @@ class APIContainerManager(ContainerManager):
             
             # Проверяем, работает ли Docker без sudo
             try:
-                result = subprocess.run(['docker', 'ps'], capture_output=True, text=True, timeout=10)
+                result = RUNNER.run(['docker', 'ps'], capture_output=True, text=True, timeout=10)
                 if result.returncode == 0:
                     print("[INFO] Docker permissions are OK")
                     return True
-            except:
+            except Exception:
                 pass
             
             # Пытаемся исправить права
@@ -56,15 +58,15 @@ class APIContainerManager(ContainerManager):
             
             # Добавляем текущего пользователя в группу docker
             try:
-                current_user = subprocess.check_output(['whoami']).decode().strip()
-                subprocess.run(['sudo', 'usermod', '-aG', 'docker', current_user], check=True)
+                current_user = RUNNER.check_output(['whoami']).decode().strip()
+                RUNNER.run(['sudo', 'usermod', '-aG', 'docker', current_user], check=True)
                 print(f"[INFO] Added user {current_user} to docker group")
             except Exception as e:
                 print(f"[WARNING] Failed to add user to docker group: {e}")
             
             # Перезапускаем Docker service
             try:
-                subprocess.run(['sudo', 'systemctl', 'restart', 'docker'], check=True)
+                RUNNER.run(['sudo', 'systemctl', 'restart', 'docker'], check=True)
                 print("[INFO] Docker service restarted")
             except Exception as e:
                 print(f"[WARNING] Failed to restart Docker service: {e}")
@@ -74,11 +76,11 @@ class APIContainerManager(ContainerManager):
             
             # Проверяем Docker без sudo
             try:
-                result = subprocess.run(['docker', 'ps'], capture_output=True, text=True, timeout=10)
+                result = RUNNER.run(['docker', 'ps'], capture_output=True, text=True, timeout=10)
                 if result.returncode == 0:
                     print("[INFO] Docker permissions fixed successfully")
                     return True
-            except:
+            except Exception:
                 pass
             
             return False
@@ -94,44 +96,44 @@ class APIContainerManager(ContainerManager):
             
             # Проверяем наличие nvidia-container-toolkit
             try:
-                result = subprocess.run(['nvidia-container-cli', 'info'], 
+                result = RUNNER.run(['nvidia-container-cli', 'info'], 
                                       capture_output=True, text=True, timeout=10)
                 if result.returncode == 0:
                     print("[INFO] nvidia-container-toolkit found")
                     
                     # Проверяем, работает ли --gpus флаг
                     try:
-                        result = subprocess.run(['docker', 'run', '--rm', '--gpus', 'all', 'ubuntu:20.04', 'nvidia-smi'], 
+                        result = RUNNER.run(['docker', 'run', '--rm', '--gpus', 'all', 'ubuntu:20.04', 'nvidia-smi'], 
                                               capture_output=True, text=True, timeout=30)
                         if result.returncode == 0:
                             print("[INFO] Docker GPU support confirmed with --gpus flag")
                             return True
-                    except:
+                    except Exception:
                         pass
                     
                     # Проверяем --runtime=nvidia
                     try:
-                        result = subprocess.run(['docker', 'run', '--rm', '--runtime=nvidia', 'ubuntu:20.04', 'nvidia-smi'], 
+                        result = RUNNER.run(['docker', 'run', '--rm', '--runtime=nvidia', 'ubuntu:20.04', 'nvidia-smi'], 
                                               capture_output=True, text=True, timeout=30)
                         if result.returncode == 0:
                             print("[INFO] Docker GPU support confirmed with --runtime=nvidia")
                             return True
-                    except:
+                    except Exception:
                         pass
                     
                     print("[WARNING] nvidia-container-toolkit found but GPU access not working")
                     return False
-            except:
+            except Exception:
                 pass
 
             # Проверяем наличие nvidia-docker
             try:
-                result = subprocess.run(['docker', 'run', '--rm', '--runtime=nvidia', 'ubuntu:20.04', 'nvidia-smi'], 
+                result = RUNNER.run(['docker', 'run', '--rm', '--runtime=nvidia', 'ubuntu:20.04', 'nvidia-smi'], 
                                       capture_output=True, text=True, timeout=30)
                 if result.returncode == 0:
                     print("[INFO] Docker GPU support confirmed with nvidia-docker")
                     return True
-            except:
+            except Exception:
                 pass
             
             print("[WARNING] Docker GPU support not available")
@@ -142,6 +144,11 @@ class APIContainerManager(ContainerManager):
 
     def wait_for_ssh_ready(self, host: str, port: int, timeout: int = 60) -> bool:
         """Ждет, пока SSH сервис будет готов к подключению"""
+        with TRACER.span("readiness ssh", "probe", host=host, port=port) as span_args:
+            span_args["ready"] = self._wait_for_ssh_ready(host, port, timeout)
+            return span_args["ready"]
+
+    def _wait_for_ssh_ready(self, host: str, port: int, timeout: int = 60) -> bool:
         start_time = time.time()
         while time.time() - start_time < timeout:
             try:
@@ -150,7 +157,7 @@ class APIContainerManager(ContainerManager):
                     result = s.connect_ex((host, port))
                     if result == 0:
                         return True
-            except:
+            except Exception:
                 pass
             time.sleep(2)
         return False
@@ -5,9 +5,22 @@ import argparse
 import re
 import socket
 import subprocess
+import threading
+import time
 from dataclasses import dataclass
 from typing import List, Optional
 
+from command_runner import RUNNER
+from metrics import REGISTRY
+from task_trace import TRACER
+
+
+CONTAINER_START_PHASE_SECONDS = REGISTRY.histogram("gpuniq_agent_container_start_phase_seconds", "Длительность фаз запуска контейнера")
+
+
+class StartCancelled(RuntimeError):
+    """Запуск контейнера отменён (управляющей задачей) до создания контейнера"""
+
 
 @dataclass
 class Settings:
@@ -25,11 +38,12 @@ class ContainerManager:
     def __init__(self, settings: Settings = Settings()):
         self.s = settings
 
-    def _run(self, args: List[str], check: bool = True, capture_output: bool = False, quiet: bool = False) -> subprocess.CompletedProcess:
+    def _run(self, args: List[str], check: bool = True, capture_output: bool = False, quiet: bool = False,
+             cancel_event: Optional[threading.Event] = None) -> subprocess.CompletedProcess:
         if not quiet:
             print("[RUN]", " ".join(args))
         try:
-            return subprocess.run(args, check=check, capture_output=capture_output, text=True)
+            return RUNNER.run(args, check=check, capture_output=capture_output, text=True, cancel_event=cancel_event)
         except subprocess.CalledProcessError as e:
             if not quiet:
                 print(f"[ERROR] Command failed with return code {e.returncode}")
@@ -39,6 +53,13 @@ class ContainerManager:
                 print(f"[ERROR] Command execution failed: {e}")
             raise
 
+    @staticmethod
+    def _phase_done(phase: str, started: float) -> float:
+        """Фиксирует длительность фазы запуска контейнера, возвращает начало следующей"""
+        now = time.perf_counter()
+        CONTAINER_START_PHASE_SECONDS.observe(now - started, phase=phase)
+        return now
+
     def _exists(self, name: str) -> bool:
         out = self._run(["docker", "ps", "-a", "--format", "{{.Names}}"], capture_output=True).stdout.splitlines()
         return name in out
@@ -47,9 +68,23 @@ class ContainerManager:
         out = self._run(["docker", "ps", "--format", "{{.Names}}"], capture_output=True).stdout.splitlines()
         return name in out
 
-    def _docker_images_has(self, image: str) -> bool:
-        cp = self._run(["docker", "image", "inspect", image], check=False, capture_output=True, quiet=True)
-        if cp.returncode == 0:
+    def container_id(self, name: str) -> Optional[str]:
+        """Полный id контейнера по имени или id (None — контейнера нет)"""
+        cp = self._run(["docker", "inspect", "--format", "{{.Id}}", name], check=False, capture_output=True, quiet=True)
+        return (cp.stdout.strip() or None) if cp.returncode == 0 else None
+
+    def has_image(self, image: str) -> bool:
+        """Образ уже есть локально (запуск обойдётся без docker pull)"""
+        cp = self._run(["docker", "image", "inspect", "--format", "{{.Id}}", image], check=False, capture_output=True, quiet=True)
+        return cp.returncode == 0
+
+    def _docker_images_has(self, image: str, cancel_event: Optional[threading.Event] = None) -> bool:
+        with TRACER.span("image", "container", image=image) as span_args:
+            span_args["available"] = self._docker_images_has_impl(image, cancel_event)
+            return span_args["available"]
+
+    def _docker_images_has_impl(self, image: str, cancel_event: Optional[threading.Event] = None) -> bool:
+        if self.has_image(image):
             print(f"[OK]   Образ найден: {image}")
             return True
         else:
@@ -57,7 +92,11 @@ class ContainerManager:
             print(f"[INFO] Пытаемся загрузить образ из интернета...")
             try:
                 # Пытаемся загрузить образ из интернета
-                pull_result = self._run(["docker", "pull", image], check=False, capture_output=False, quiet=False)
+                pull_result = self._run(["docker", "pull", image], check=False, capture_output=False, quiet=False,
+                                        cancel_event=cancel_event)
+                if cancel_event is not None and cancel_event.is_set():
+                    print(f"[INFO] Загрузка образа прервана: {image}")
+                    return False
                 if pull_result.returncode == 0:
                     print(f"[OK]   Образ успешно загружен: {image}")
                     return True
@@ -95,7 +134,7 @@ class ContainerManager:
         if bad:
             raise RuntimeError(f"Порты заняты: {', '.join(bad)}")
 
-    def start(self, container_name: str, ssh_port: int, jup_port: int, ssh_password: str, jupyter_token: str, ssh_username: str = "root", gpus: Optional[str] = None, image: Optional[str] = None, cpuset_cpus: Optional[str] = None, memory_gb: Optional[int] = None, memory_swap_gb: Optional[int] = None, shm_size_gb: Optional[int] = None, storage_gb: Optional[int] = None) -> Optional[str]:
+    def start(self, container_name: str, ssh_port: int, jup_port: int, ssh_password: str, jupyter_token: str, ssh_username: str = "root", gpus: Optional[str] = None, image: Optional[str] = None, cpuset_cpus: Optional[str] = None, memory_gb: Optional[int] = None, memory_swap_gb: Optional[int] = None, shm_size_gb: Optional[int] = None, storage_gb: Optional[int] = None, cancel_event: Optional[threading.Event] = None) -> Optional[str]:
         """
         Запустить/создать контейнер с указанными параметрами.
         - container_name: имя контейнера
@@ -105,35 +144,51 @@ class ContainerManager:
         - jupyter_token: токен Jupyter
         - ssh_username: имя пользователя SSH (по умолчанию "root" - системный пользователь)
         - gpus: GPU (по умолчанию все или список '0,2,3')
+        - cancel_event: если установлен до создания контейнера, загрузка образа прерывается и бросается StartCancelled
         """
+        with TRACER.span("container start", "container", name=container_name, image=image or self.s.image):
+            return self._start(container_name, ssh_port, jup_port, ssh_password, jupyter_token, ssh_username, gpus, image,
+                               cpuset_cpus, memory_gb, memory_swap_gb, shm_size_gb, storage_gb, cancel_event)
+
+    def _start(self, container_name: str, ssh_port: int, jup_port: int, ssh_password: str, jupyter_token: str, ssh_username: str = "root", gpus: Optional[str] = None, image: Optional[str] = None, cpuset_cpus: Optional[str] = None, memory_gb: Optional[int] = None, memory_swap_gb: Optional[int] = None, shm_size_gb: Optional[int] = None, storage_gb: Optional[int] = None, cancel_event: Optional[threading.Event] = None) -> Optional[str]:
         name = container_name
+        phase_started = time.perf_counter()
 
         if self._running(name):
             print(f"[INFO] Контейнер уже запущен: {name}")
             print(f"[INFO] SSH:     ssh -p {ssh_port} {ssh_username}@<host>  (пароль: {ssh_password})")
             print(f"[INFO] Jupyter: http://<host>:{jup_port}/lab (token:  {jupyter_token})")
-            return
+            return self.container_id(name)
 
         if self._exists(name):
+            phase_started = self._phase_done("lookup", phase_started)
             print(f"[INFO] Контейнер существует, стартуем: {name}")
             self._run(["docker", "start", name])
+            self._phase_done("restart", phase_started)
             print(f"[OK]   Запущено.")
             print(f"[INFO] SSH:     ssh -p {ssh_port} {ssh_username}@<host>  (пароль: {ssh_password})")
             print(f"[INFO] Jupyter: http://<host>:{jup_port}/lab (token:  {jupyter_token})")
-            return
+            return self.container_id(name)
 
+        phase_started = self._phase_done("lookup", phase_started)
         self._assert_ports_free(ssh_port, jup_port)
+        phase_started = self._phase_done("ports", phase_started)
 
         image_to_run = image or self.s.image
 
-        if not self._docker_images_has(image_to_run):
+        available = self._docker_images_has(image_to_run, cancel_event)
+        if cancel_event is not None and cancel_event.is_set():
+            raise StartCancelled(f"Запуск {name} отменён до создания контейнера")
+        if not available:
             raise RuntimeError(
                 f"Образ '{image_to_run}' недоступен. "
                 f"Проверьте подключение к интернету и доступность образа в реестре."
             )
+        phase_started = self._phase_done("image", phase_started)
 
         work_vol = f"{name}-work"
         self._run(["docker", "volume", "create", work_vol])
+        phase_started = self._phase_done("volume", phase_started)
 
         # legacy GPU runtime 
         env = [
@@ -176,6 +231,7 @@ class ContainerManager:
         args.append(image_to_run)
         result = self._run(args, capture_output=True)
         container_id = result.stdout.strip()
+        self._phase_done("run", phase_started)
 
         print("[OK]   Контейнер создан и запущен.")
         print(f"[INFO] Name:    {name}")
@@ -254,7 +310,11 @@ class ContainerManager:
 
     def wait_for_ssh_ready(self, host: str, port: int, timeout: int = 60) -> bool:
         """Ждет, пока SSH сервис будет готов к подключению"""
-        import time
+        with TRACER.span("readiness ssh", "probe", host=host, port=port) as span_args:
+            span_args["ready"] = self._wait_for_ssh_ready(host, port, timeout)
+            return span_args["ready"]
+
+    def _wait_for_ssh_ready(self, host: str, port: int, timeout: int = 60) -> bool:
         start_time = time.time()
         while time.time() - start_time < timeout:
             try:
@@ -263,7 +323,7 @@ class ContainerManager:
                     result = s.connect_ex((host, port))
                     if result == 0:
                         return True
-            except:
+            except Exception:
                 pass
             time.sleep(2)
         return False
@@ -272,15 +332,15 @@ class ContainerManager:
         """Проверяет и устанавливает Docker если необходимо"""
         try:
             # Проверяем, работает ли Docker
-            result = subprocess.run(['docker', 'ps'], check=True, capture_output=True)
+            result = RUNNER.run(['docker', 'ps'], check=True, capture_output=True)
             print("[INFO] Docker is working correctly")
             return True
-        except (subprocess.CalledProcessError, FileNotFoundError):
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
             print("[INFO] Docker not working, attempting to fix...")
             
             # Проверяем, установлен ли Docker
             try:
-                subprocess.run(['docker', '--version'], check=True, capture_output=True)
+                RUNNER.run(['docker', '--version'], check=True, capture_output=True)
                 print("[INFO] Docker is installed but not working")
                 
                 # Исправляем права
@@ -291,7 +351,7 @@ class ContainerManager:
                     print("[WARNING] Could not fix Docker permissions")
                     return False
                     
-            except (subprocess.CalledProcessError, FileNotFoundError):
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired, FileNotFoundError):
                 print("[INFO] Docker not found, please install Docker manually")
                 return False
 
@@ -303,11 +363,11 @@ class ContainerManager:
             
             # Проверяем, работает ли Docker без sudo
             try:
-                result = subprocess.run(['docker', 'ps'], capture_output=True, text=True, timeout=10)
+                result = RUNNER.run(['docker', 'ps'], capture_output=True, text=True, timeout=10)
                 if result.returncode == 0:
                     print("[INFO] Docker permissions are OK")
                     return True
-            except:
+            except Exception:
                 pass
             
             # Пытаемся исправить права
@@ -315,15 +375,15 @@ class ContainerManager:
             
             # Добавляем текущего пользователя в группу docker
             try:
-                current_user = subprocess.check_output(['whoami']).decode().strip()
-                subprocess.run(['sudo', 'usermod', '-aG', 'docker', current_user], check=True)
+                current_user = RUNNER.check_output(['whoami']).decode().strip()
+                RUNNER.run(['sudo', 'usermod', '-aG', 'docker', current_user], check=True)
                 print(f"[INFO] Added user {current_user} to docker group")
             except Exception as e:
                 print(f"[WARNING] Failed to add user to docker group: {e}")
             
             # Перезапускаем Docker service
             try:
-                subprocess.run(['sudo', 'systemctl', 'restart', 'docker'], check=True)
+                RUNNER.run(['sudo', 'systemctl', 'restart', 'docker'], check=True)
                 print("[INFO] Docker service restarted")
             except Exception as e:
                 print(f"[WARNING] Failed to restart Docker service: {e}")
@@ -333,11 +393,11 @@ class ContainerManager:
             
             # Проверяем Docker без sudo
             try:
-                result = subprocess.run(['docker', 'ps'], capture_output=True, text=True, timeout=10)
+                result = RUNNER.run(['docker', 'ps'], capture_output=True, text=True, timeout=10)
                 if result.returncode == 0:
                     print("[INFO] Docker permissions fixed successfully")
                     return True
-            except:
+            except Exception:
                 pass
             
             return False
@@ -353,44 +413,44 @@ class ContainerManager:
             
             # Проверяем наличие nvidia-container-toolkit
             try:
-                result = subprocess.run(['nvidia-container-cli', 'info'], 
+                result = RUNNER.run(['nvidia-container-cli', 'info'], 
                                       capture_output=True, text=True, timeout=10)
                 if result.returncode == 0:
                     print("[INFO] nvidia-container-toolkit found")
                     
                     # Проверяем, работает ли --gpus флаг
                     try:
-                        result = subprocess.run(['docker', 'run', '--rm', '--gpus', 'all', 'ubuntu:20.04', 'nvidia-smi'], 
+                        result = RUNNER.run(['docker', 'run', '--rm', '--gpus', 'all', 'ubuntu:20.04', 'nvidia-smi'], 
                                               capture_output=True, text=True, timeout=30)
                         if result.returncode == 0:
                             print("[INFO] Docker GPU support confirmed with --gpus flag")
                             return True
-                    except:
+                    except Exception:
                         pass
                     
                     # Проверяем --runtime=nvidia
                     try:
-                        result = subprocess.run(['docker', 'run', '--rm', '--runtime=nvidia', 'ubuntu:20.04', 'nvidia-smi'], 
+                        result = RUNNER.run(['docker', 'run', '--rm', '--runtime=nvidia', 'ubuntu:20.04', 'nvidia-smi'], 
                                               capture_output=True, text=True, timeout=30)
                         if result.returncode == 0:
                             print("[INFO] Docker GPU support confirmed with --runtime=nvidia")
                             return True
-                    except:
+                    except Exception:
                         pass
                     
                     print("[WARNING] nvidia-container-toolkit found but GPU access not working")
                     return False
-            except:
+            except Exception:
                 pass
 
             # Проверяем наличие nvidia-docker
             try:
-                result = subprocess.run(['docker', 'run', '--rm', '--runtime=nvidia', 'ubuntu:20.04', 'nvidia-smi'], 
+                result = RUNNER.run(['docker', 'run', '--rm', '--runtime=nvidia', 'ubuntu:20.04', 'nvidia-smi'], 
                                       capture_output=True, text=True, timeout=30)
                 if result.returncode == 0:
                     print("[INFO] Docker GPU support confirmed with nvidia-docker")
                     return True
-            except:
+            except Exception:
                 pass
             
             print("[WARNING] Docker GPU support not available")
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple, Union
+
+from metrics import REGISTRY
+from task_trace import TRACER
+
+
+SUBPROCESS_SECONDS = REGISTRY.histogram("gpuniq_agent_subprocess_duration_seconds", "Длительность запуска внешних команд")
+SUBPROCESS_TOTAL = REGISTRY.counter("gpuniq_agent_subprocess_total", "Запуски внешних команд по результату")
+SUBPROCESS_CACHE_HITS = REGISTRY.counter("gpuniq_agent_subprocess_cache_hits_total", "Ответы из кэша read-only команд")
+SUBPROCESS_IN_FLIGHT = REGISTRY.gauge("gpuniq_agent_subprocess_in_flight", "Выполняющиеся сейчас внешние команды")
+
+# Таймауты по семействам команд (ключ — command_label или имя программы), сек
+DEFAULT_TIMEOUTS: Dict[str, float] = {
+    "docker pull": 1800.0,
+    "docker run": 300.0,
+    "docker stop": 60.0,
+    "docker start": 60.0,
+    "docker rm": 60.0,
+    "docker": 30.0,
+    "nvidia-smi": 15.0,
+    "nvidia-container-cli": 10.0,
+    "sudo": 120.0,
+}
+FALLBACK_TIMEOUT = 30.0
+
+SECRET_ENV_RE = re.compile(r'^([A-Z0-9_]*(?:PASSWORD|TOKEN|SECRET|KEY)[A-Z0-9_]*)=.*$')
+
+Args = Union[List[str], str]
+
+
+def redact_args(args: Args) -> str:
+    """Командная строка без значений секретных переменных окружения (-e SSH_PASSWORD=...)"""
+    if isinstance(args, str):
+        args = args.split()
+    return " ".join(SECRET_ENV_RE.sub(r'\1=***', a) for a in args)
+
+
+def command_label(args: Args) -> str:
+    """Метка команды для метрик: 'docker stop', 'nvidia-smi', ..."""
+    if isinstance(args, str):
+        args = args.split()
+    if not args:
+        return ""
+    program = os.path.basename(args[0])
+    if program == "docker" and len(args) > 1:
+        return f"docker {args[1]}"
+    return program
+
+
+class CommandRunner:
+    """Единая точка запуска внешних команд.
+    - таймаут по умолчанию для каждого семейства команд, по таймауту убивается вся группа процессов;
+    - ограничение числа одновременных запусков;
+    - длительность и статус выполнения в метриках;
+    - опциональный кэш идемпотентных read-only команд (lscpu, nvidia-smi -L) на короткий TTL.
+    """
+
+    def __init__(self, max_concurrent: int = 8, timeouts: Optional[Dict[str, float]] = None):
+        self.timeouts = dict(DEFAULT_TIMEOUTS if timeouts is None else timeouts)
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._cache: Dict[Tuple, Tuple[float, subprocess.CompletedProcess]] = {}
+        self._cache_lock = threading.Lock()
+
+    def timeout_for(self, args: Args) -> float:
+        label = command_label(args)
+        program = label.split()[0] if label else ""
+        return self.timeouts.get(label, self.timeouts.get(program, FALLBACK_TIMEOUT))
+
+    @staticmethod
+    def _kill(proc: subprocess.Popen) -> None:
+        """Убивает процесс вместе с его группой (docker CLI, sudo и их дочерние процессы)"""
+        try:
+            if os.name == 'posix':
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except (ProcessLookupError, PermissionError, OSError):
+            try:
+                proc.kill()
+            except OSError:
+                pass
+
+    def run(self, args: Args, check: bool = False, capture_output: bool = False, text: bool = False,
+            timeout: Optional[float] = None, cache_ttl_s: Optional[float] = None,
+            stdout: Any = None, stderr: Any = None, shell: bool = False, env: Optional[Dict[str, str]] = None,
+            cancel_event: Optional[threading.Event] = None) -> subprocess.CompletedProcess:
+        """Аналог subprocess.run с таймаутом по умолчанию, метриками и кэшем.
+        cancel_event позволяет прервать команду извне (процесс будет убит, вернётся код -9).
+        """
+        if capture_output:
+            stdout = stderr = subprocess.PIPE
+        cache_key = (tuple(args) if isinstance(args, list) else args, stdout, stderr, text, shell)
+        if cache_ttl_s:
+            with self._cache_lock:
+                cached = self._cache.get(cache_key)
+            if cached is not None and cached[0] > time.monotonic():
+                SUBPROCESS_CACHE_HITS.inc(command=command_label(args))
+                return cached[1]
+
+        if timeout is None:
+            timeout = self.timeout_for(args)
+        label = command_label(args)
+        status = "error"
+        started = time.perf_counter()
+        try:
+            with self._semaphore:
+                SUBPROCESS_IN_FLIGHT.inc()
+                try:
+                    with TRACER.span(label, "subprocess", argv=redact_args(args)) as span_args:
+                        proc = subprocess.Popen(args, stdout=stdout, stderr=stderr, text=text, shell=shell, env=env,
+                                                start_new_session=(os.name == 'posix'))
+                        try:
+                            out, err = self._wait(proc, timeout, cancel_event)
+                        except subprocess.TimeoutExpired:
+                            status = "timeout"
+                            self._kill(proc)
+                            out, err = proc.communicate()
+                            raise subprocess.TimeoutExpired(args, timeout, output=out, stderr=err)
+                        except BaseException:
+                            self._kill(proc)
+                            proc.wait()
+                            raise
+                        span_args["returncode"] = proc.returncode
+                finally:
+                    SUBPROCESS_IN_FLIGHT.dec()
+            cp = subprocess.CompletedProcess(args, proc.returncode, out, err)
+            if cancel_event is not None and cancel_event.is_set() and proc.returncode < 0:
+                status = "cancelled"
+            else:
+                status = "ok" if proc.returncode == 0 else "failed"
+        finally:
+            SUBPROCESS_TOTAL.inc(command=label, status=status)
+            SUBPROCESS_SECONDS.observe(time.perf_counter() - started, command=label)
+
+        if check and cp.returncode != 0:
+            raise subprocess.CalledProcessError(cp.returncode, args, output=out, stderr=err)
+        if cache_ttl_s and cp.returncode == 0:
+            with self._cache_lock:
+                self._cache[cache_key] = (time.monotonic() + cache_ttl_s, cp)
+        return cp
+
+    def _wait(self, proc: subprocess.Popen, timeout: float, cancel_event: Optional[threading.Event]) -> Tuple[Any, Any]:
+        if cancel_event is None:
+            return proc.communicate(timeout=timeout)
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(proc.args, timeout)
+            try:
+                return proc.communicate(timeout=min(0.5, remaining))
+            except subprocess.TimeoutExpired:
+                if cancel_event.is_set():
+                    self._kill(proc)
+                    return proc.communicate()
+
+    def check_output(self, args: Args, stderr: Any = None, timeout: Optional[float] = None,
+                     cache_ttl_s: Optional[float] = None, shell: bool = False) -> bytes:
+        """Аналог subprocess.check_output (возвращает bytes)"""
+        return self.run(args, check=True, stdout=subprocess.PIPE, stderr=stderr, timeout=timeout,
+                        cache_ttl_s=cache_ttl_s, shell=shell).stdout
+
+    def clear_cache(self) -> None:
+        with self._cache_lock:
+            self._cache.clear()
+
+
+# Исполнитель по умолчанию, общий для всех модулей агента
+RUNNER = CommandRunner()
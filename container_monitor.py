@@ -0,0 +1,444 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import subprocess
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple
+
+from command_runner import RUNNER
+
+
+DOCKER_ID_RE = re.compile(r'(?:docker[-/])([0-9a-f]{64})')
+CONTAINER_DIR_RE = re.compile(r'^(?:docker-)?([0-9a-f]{64})(?:\.scope)?$')
+
+# Каталоги cgroup, где docker создаёт группы контейнеров (v2 systemd/cgroupfs и v1)
+CGROUP_CONTAINER_DIRS = (
+    "system.slice",
+    "docker",
+    "memory/system.slice",
+    "memory/docker",
+)
+
+
+def container_id_from_cgroup(pid: int, proc_root: str = "/proc") -> Optional[str]:
+    """Определяет docker id контейнера процесса по /proc/<pid>/cgroup"""
+    try:
+        with open(os.path.join(proc_root, str(pid), "cgroup"), "r") as f:
+            match = DOCKER_ID_RE.search(f.read())
+            return match.group(1) if match else None
+    except OSError:
+        return None
+
+
+# id, pid и лимиты из docker run (--memory, --cpus, --cpuset-cpus, --storage-opt size, NVIDIA_VISIBLE_DEVICES).
+# Из окружения берётся только NVIDIA_VISIBLE_DEVICES — пароли и токены в вывод не попадают.
+INSPECT_FORMAT = (
+    '{{.Id}}\t{{.State.Pid}}\t{{.HostConfig.Memory}}\t{{.HostConfig.NanoCpus}}\t{{.HostConfig.CpusetCpus}}\t'
+    '{{index .HostConfig.StorageOpt "size"}}\t'
+    '{{range .Config.Env}}{{$kv := split . "="}}{{if eq (index $kv 0) "NVIDIA_VISIBLE_DEVICES"}}{{index $kv 1}}{{end}}{{end}}'
+)
+SIZE_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+
+def count_cpuset(cpuset: str) -> int:
+    """Количество CPU в списке вида 0-3,8"""
+    count = 0
+    for part in cpuset.split(","):
+        part = part.strip()
+        if "-" in part:
+            lo, _, hi = part.partition("-")
+            if lo.isdigit() and hi.isdigit():
+                count += int(hi) - int(lo) + 1
+        elif part.isdigit():
+            count += 1
+    return count
+
+
+def parse_size(value: str) -> Optional[int]:
+    """'50G', '512m', '1073741824' → байты"""
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([bkmgt]?)i?b?\s*$', value or "", re.IGNORECASE)
+    if not match:
+        return None
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+
+def parse_limits(memory: str, nano_cpus: str, cpuset: str, storage: str, visible_devices: str) -> Dict[str, Any]:
+    """Лимиты контейнера из docker inspect; None — лимит не задан"""
+    cpus = None
+    if nano_cpus.isdigit() and int(nano_cpus) > 0:
+        cpus = int(nano_cpus) / 1e9
+    elif cpuset:
+        cpus = float(count_cpuset(cpuset)) or None
+    visible = visible_devices.strip().lower()
+    if visible in ("", "none", "void"):
+        gpus: Any = 0
+    elif visible == "all":
+        gpus = "all"
+    else:
+        gpus = len([d for d in visible.split(",") if d.strip()])
+    return {
+        "memory_bytes": int(memory) if memory.isdigit() and int(memory) > 0 else None,
+        "cpus": cpus,
+        "storage_bytes": parse_size(storage) if storage and storage != "<no value>" else None,
+        "gpus": gpus,
+    }
+
+
+class ContainerIndex:
+    """Кэш запущенных контейнеров задач: docker id → имя, pid, каталог cgroup.
+    Перечитывается через docker только когда меняется набор групп в cgroupfs.
+    """
+
+    def __init__(self, cgroup_root: str = "/sys/fs/cgroup", name_prefix: str = "task_", fallback_ttl_s: float = 30.0):
+        self.cgroup_root = cgroup_root
+        self.name_prefix = name_prefix
+        self.fallback_ttl_s = fallback_ttl_s
+        self._fingerprint: Optional[frozenset] = None
+        self._cgroup_dirs: Dict[str, str] = {}
+        self._containers: Dict[str, Dict[str, Any]] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.RLock()
+        self.version = 0
+
+    def _scan_cgroups(self) -> Dict[str, str]:
+        """docker id → каталог cgroup; чтение каталогов без запуска процессов"""
+        found = {}
+        for rel in CGROUP_CONTAINER_DIRS:
+            base = os.path.join(self.cgroup_root, rel)
+            try:
+                entries = os.listdir(base)
+            except OSError:
+                continue
+            for entry in entries:
+                match = CONTAINER_DIR_RE.match(entry)
+                if match and match.group(1) not in found:
+                    found[match.group(1)] = os.path.join(base, entry)
+        return found
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        result = RUNNER.run(
+            ['docker', 'ps', '--no-trunc', '--filter', f'name={self.name_prefix}', '--format', '{{.ID}}\t{{.Names}}'],
+            capture_output=True, text=True, timeout=10
+        )
+        if result.returncode != 0:
+            return self._containers
+
+        containers = {}
+        for line in result.stdout.strip().split('\n'):
+            parts = line.split('\t')
+            if len(parts) == 2 and parts[1].startswith(self.name_prefix):
+                containers[parts[0]] = {"name": parts[1], "pid": None, "cgroup": self._cgroup_dirs.get(parts[0])}
+
+        if containers:
+            inspect = RUNNER.run(
+                ['docker', 'inspect', '-f', INSPECT_FORMAT, *containers.keys()],
+                capture_output=True, text=True, timeout=10
+            )
+            for line in inspect.stdout.strip().split('\n'):
+                parts = line.split('\t')
+                if len(parts) != 7 or parts[0] not in containers:
+                    continue
+                info = containers[parts[0]]
+                info["pid"] = (int(parts[1]) or None) if parts[1].isdigit() else None
+                info["limits"] = parse_limits(*parts[2:])
+        return containers
+
+    def refresh(self, force: bool = False) -> bool:
+        """Обновляет индекс, если изменился набор контейнеров. Возвращает True при изменении."""
+        with self._lock:
+            return self._refresh(force)
+
+    def _refresh(self, force: bool) -> bool:
+        self._cgroup_dirs = self._scan_cgroups()
+        fingerprint = frozenset(self._cgroup_dirs)
+        now = time.monotonic()
+        if not force and self._loaded_at:
+            if fingerprint and fingerprint == self._fingerprint:
+                return False
+            # Без cgroupfs изменения не видны — обновляемся по TTL
+            if not fingerprint and now - self._loaded_at < self.fallback_ttl_s:
+                return False
+        try:
+            containers = self._load()
+        except Exception as e:
+            print(f"[WARNING] Failed to refresh container index: {e}")
+            # Не повторяем неудачный запрос на каждом вызове
+            self._fingerprint = fingerprint
+            self._loaded_at = now
+            return False
+        self._fingerprint = fingerprint
+        self._loaded_at = now
+        changed = containers != self._containers
+        self._containers = containers
+        if changed:
+            self.version += 1
+        return changed
+
+    def containers(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            self._refresh(False)
+            return self._containers
+
+    def name_for(self, container_id: str) -> Optional[str]:
+        info = self._containers.get(container_id)
+        return info["name"] if info else None
+
+
+class ContainerGpuMonitor:
+    """Распределение памяти и загрузки GPU по контейнерам задач"""
+
+    def __init__(self, index: ContainerIndex, proc_root: str = "/proc"):
+        self.index = index
+        self.proc_root = proc_root
+        self._pid_map: Dict[int, Optional[str]] = {}
+        self._pid_set: frozenset = frozenset()
+        self._index_version = -1
+        self._gpu_available = True
+
+    def _query_gpus(self) -> Dict[str, Tuple[str, Optional[float]]]:
+        """uuid → (индекс, загрузка %)"""
+        out = RUNNER.check_output(
+            ['nvidia-smi', '--query-gpu=index,uuid,utilization.gpu', '--format=csv,noheader,nounits'],
+            stderr=subprocess.DEVNULL, timeout=10
+        ).decode(errors='ignore')
+        gpus = {}
+        for line in out.strip().split('\n'):
+            parts = [p.strip() for p in line.split(',')]
+            if len(parts) >= 3:
+                try:
+                    util = float(parts[2])
+                except ValueError:
+                    util = None
+                gpus[parts[1]] = (parts[0], util)
+        return gpus
+
+    def _query_apps(self) -> List[Tuple[int, str, float]]:
+        """Список (pid, uuid GPU, память МБ) вычислительных процессов"""
+        out = RUNNER.check_output(
+            ['nvidia-smi', '--query-compute-apps=pid,gpu_uuid,used_memory', '--format=csv,noheader,nounits'],
+            stderr=subprocess.DEVNULL, timeout=10
+        ).decode(errors='ignore')
+        apps = []
+        for line in out.strip().split('\n'):
+            parts = [p.strip() for p in line.split(',')]
+            if len(parts) >= 3 and parts[0].isdigit():
+                try:
+                    used_mb = float(parts[2])
+                except ValueError:
+                    used_mb = 0.0
+                apps.append((int(parts[0]), parts[1], used_mb))
+        return apps
+
+    def _query_pmon(self) -> Dict[int, float]:
+        """SM-загрузка по процессам (nvidia-smi pmon, один сэмпл ~1 с)"""
+        out = RUNNER.check_output(
+            ['nvidia-smi', 'pmon', '-c', '1', '-s', 'u'],
+            stderr=subprocess.DEVNULL, timeout=10
+        ).decode(errors='ignore')
+        sm = {}
+        for line in out.split('\n'):
+            if line.startswith('#'):
+                continue
+            parts = line.split()
+            # gpu pid type sm mem enc dec ...
+            if len(parts) >= 4 and parts[1].isdigit():
+                try:
+                    sm[int(parts[1])] = sm.get(int(parts[1]), 0.0) + float(parts[3])
+                except ValueError:
+                    continue
+        return sm
+
+    def _map_pids(self, pids: frozenset) -> None:
+        """Обновляет pid → имя контейнера только при смене набора PID или контейнеров"""
+        self.index.refresh()
+        index_changed = self.index.version != self._index_version
+        if pids == self._pid_set and not index_changed:
+            return
+        if index_changed:
+            self._pid_map = {}
+            self._index_version = self.index.version
+        pid_map = {}
+        for pid in pids:
+            if pid in self._pid_map:
+                pid_map[pid] = self._pid_map[pid]
+                continue
+            container_id = container_id_from_cgroup(pid, self.proc_root)
+            pid_map[pid] = self.index.name_for(container_id) if container_id else None
+        self._pid_map = pid_map
+        self._pid_set = pids
+
+    def collect(self) -> Dict[str, Dict[str, Any]]:
+        """Возвращает {имя контейнера: {gpu_memory_mb, sm_util, gpus: {индекс: {...}}}}"""
+        if not self._gpu_available:
+            return {}
+        try:
+            apps = self._query_apps()
+            if not apps:
+                return {}
+            gpus = self._query_gpus()
+        except FileNotFoundError:
+            self._gpu_available = False
+            return {}
+        except Exception as e:
+            print(f"[WARNING] Per-container GPU query failed: {e}")
+            return {}
+
+        self._map_pids(frozenset(pid for pid, _, _ in apps))
+
+        # Какие контейнеры делят каждый GPU
+        tenants: Dict[str, set] = {}
+        for pid, uuid, _ in apps:
+            name = self._pid_map.get(pid)
+            if name:
+                tenants.setdefault(uuid, set()).add(name)
+
+        # pmon нужен только если GPU делят несколько контейнеров
+        pmon = {}
+        if any(len(names) > 1 for names in tenants.values()):
+            try:
+                pmon = self._query_pmon()
+            except Exception:
+                pmon = {}
+
+        result: Dict[str, Dict[str, Any]] = {}
+        for pid, uuid, used_mb in apps:
+            name = self._pid_map.get(pid)
+            if not name:
+                continue
+            gpu_index, device_util = gpus.get(uuid, (uuid, None))
+            entry = result.setdefault(name, {"gpu_memory_mb": 0.0, "sm_util": None, "gpus": {}})
+            gpu_entry = entry["gpus"].setdefault(gpu_index, {"memory_mb": 0.0, "sm_util": None})
+            gpu_entry["memory_mb"] += used_mb
+            entry["gpu_memory_mb"] += used_mb
+            if len(tenants.get(uuid, ())) == 1:
+                # Единственный арендатор GPU — вся загрузка устройства его
+                gpu_entry["sm_util"] = device_util
+            elif pid in pmon:
+                gpu_entry["sm_util"] = (gpu_entry["sm_util"] or 0.0) + pmon[pid]
+
+        for entry in result.values():
+            utils = [g["sm_util"] for g in entry["gpus"].values() if g["sm_util"] is not None]
+            if utils:
+                # Среднее только по GPU с известной загрузкой: неизвестная — не 0%
+                entry["sm_util"] = round(sum(utils) / len(utils), 1)
+        return result
+
+
+def read_cgroup_io(cgroup_dir: str) -> Optional[Tuple[int, int]]:
+    """Суммарные (прочитано, записано) байт по всем устройствам группы.
+    cgroup v2 — io.stat, v1 — blkio.throttle.io_service_bytes.
+    """
+    try:
+        with open(os.path.join(cgroup_dir, "io.stat"), "r") as f:
+            rbytes = wbytes = 0
+            for line in f:
+                for field in line.split()[1:]:
+                    key, _, value = field.partition('=')
+                    if key == "rbytes":
+                        rbytes += int(value)
+                    elif key == "wbytes":
+                        wbytes += int(value)
+            return rbytes, wbytes
+    except (OSError, ValueError):
+        pass
+
+    blkio_dir = cgroup_dir.replace(f"{os.sep}memory{os.sep}", f"{os.sep}blkio{os.sep}", 1)
+    try:
+        with open(os.path.join(blkio_dir, "blkio.throttle.io_service_bytes"), "r") as f:
+            rbytes = wbytes = 0
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[1] == "Read":
+                    rbytes += int(parts[2])
+                elif len(parts) == 3 and parts[1] == "Write":
+                    wbytes += int(parts[2])
+            return rbytes, wbytes
+    except (OSError, ValueError):
+        return None
+
+
+def read_netns_counters(pid: int, proc_root: str = "/proc") -> Optional[Tuple[int, int]]:
+    """(rx, tx) байт в сетевом namespace процесса по /proc/<pid>/net/dev, без lo"""
+    try:
+        with open(os.path.join(proc_root, str(pid), "net", "dev"), "r") as f:
+            rx = tx = 0
+            for line in f.readlines()[2:]:
+                iface, _, data = line.partition(':')
+                if iface.strip() == "lo":
+                    continue
+                fields = data.split()
+                if len(fields) >= 9:
+                    rx += int(fields[0])
+                    tx += int(fields[8])
+            return rx, tx
+    except (OSError, ValueError):
+        return None
+
+
+class ContainerIOMonitor:
+    """Дисковый и сетевой I/O контейнеров задач: скорости между замерами и топ потребителей"""
+
+    def __init__(self, index: ContainerIndex, proc_root: str = "/proc", top_n: int = 5):
+        self.index = index
+        self.proc_root = proc_root
+        self.top_n = top_n
+        # docker id → (ts, rbytes, wbytes, rx, tx)
+        self._prev: Dict[str, Tuple[float, Optional[int], Optional[int], Optional[int], Optional[int]]] = {}
+
+    @staticmethod
+    def _rate(cur: Optional[int], prev: Optional[int], dt: float) -> Optional[float]:
+        if cur is None or prev is None or dt <= 0 or cur < prev:
+            return None
+        return (cur - prev) / dt
+
+    def sample(self) -> Dict[str, Dict[str, Any]]:
+        """Скорости I/O по контейнерам с момента предыдущего замера"""
+        now = time.monotonic()
+        rates: Dict[str, Dict[str, Any]] = {}
+        current = {}
+        for container_id, info in self.index.containers().items():
+            io = read_cgroup_io(info["cgroup"]) if info.get("cgroup") else None
+            net = read_netns_counters(info["pid"], self.proc_root) if info.get("pid") else None
+            rbytes, wbytes = io if io else (None, None)
+            rx, tx = net if net else (None, None)
+            current[container_id] = (now, rbytes, wbytes, rx, tx)
+
+            prev = self._prev.get(container_id)
+            if prev is None:
+                continue
+            dt = now - prev[0]
+            read_bps = self._rate(rbytes, prev[1], dt)
+            write_bps = self._rate(wbytes, prev[2], dt)
+            rx_bps = self._rate(rx, prev[3], dt)
+            tx_bps = self._rate(tx, prev[4], dt)
+            rates[info["name"]] = {
+                "disk_read_mb_s": round(read_bps / (1024 * 1024), 3) if read_bps is not None else None,
+                "disk_write_mb_s": round(write_bps / (1024 * 1024), 3) if write_bps is not None else None,
+                "net_rx_mbps": round(rx_bps * 8 / 1_000_000, 3) if rx_bps is not None else None,
+                "net_tx_mbps": round(tx_bps * 8 / 1_000_000, 3) if tx_bps is not None else None,
+            }
+        # Удалённые контейнеры выпадают из состояния автоматически
+        self._prev = current
+        return rates
+
+    def collect(self) -> Dict[str, Any]:
+        """Топ контейнеров по диску и по сети для heartbeat"""
+        rates = self.sample()
+
+        def top(keys: Tuple[str, str]) -> List[Dict[str, Any]]:
+            scored = []
+            for name, r in rates.items():
+                score = sum(r[k] or 0 for k in keys)
+                if score > 0:
+                    scored.append((score, name))
+            scored.sort(reverse=True)
+            return [{"container_name": name, **rates[name]} for _, name in scored[:self.top_n]]
+
+        return {
+            "containers": len(rates),
+            "top_disk": top(("disk_read_mb_s", "disk_write_mb_s")),
+            "top_network": top(("net_rx_mbps", "net_tx_mbps")),
+        }
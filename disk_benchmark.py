@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import mmap
+import os
+import random
+import time
+from typing import Dict, Any, Optional, Callable, Tuple
+
+from command_runner import RUNNER
+
+
+MIB = 1024 * 1024
+SEQ_BLOCK = 1 * MIB
+RAND_BLOCK = 4096
+TEST_FILE_NAME = ".gpuniq-diskbench.tmp"
+
+
+class BenchmarkAborted(Exception):
+    """Замер прерван: хост перестал простаивать"""
+
+
+def docker_data_root() -> str:
+    """Каталог данных Docker (docker info), иначе /var/lib/docker, иначе /"""
+    try:
+        out = RUNNER.run(["docker", "info", "--format", "{{.DockerRootDir}}"], capture_output=True, text=True, timeout=10)
+        path = out.stdout.strip()
+        if out.returncode == 0 and path and os.path.isdir(path):
+            return path
+    except Exception:
+        pass
+    return "/var/lib/docker" if os.path.isdir("/var/lib/docker") else "/"
+
+
+def block_device_for(path: str, sysfs_root: str = "/sys") -> Optional[str]:
+    """Имя диска в /sys/block, на котором лежит path (раздел → родительский диск)"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    dev_link = os.path.join(sysfs_root, "dev", "block", f"{os.major(st.st_dev)}:{os.minor(st.st_dev)}")
+    try:
+        real = os.path.realpath(dev_link)
+    except OSError:
+        return None
+    if not os.path.exists(real):
+        return None
+    # У раздела есть файл partition, диск — родительский каталог
+    if os.path.exists(os.path.join(real, "partition")):
+        real = os.path.dirname(real)
+    return os.path.basename(real)
+
+
+class DiskBenchmark:
+    """Ограниченный по времени и объёму замер дисковой подсистемы в каталоге path.
+    Последовательные чтение/запись блоками 1 МиБ и случайные 4 КиБ (IOPS) через O_DIRECT,
+    чтобы мерить диск, а не page cache. Тестовый файл не больше file_size_mb, каждая фаза — не дольше
+    phase_max_s и не больше четверти max_io_mb; should_continue() опрашивается между блоками —
+    если хост перестал простаивать, замер прерывается.
+    """
+
+    def __init__(self, path: str, file_size_mb: int = 256, phase_max_s: float = 5.0, max_io_mb: int = 2048,
+                 should_continue: Optional[Callable[[], bool]] = None):
+        self.path = path
+        self.file_size = max(SEQ_BLOCK, file_size_mb * MIB // SEQ_BLOCK * SEQ_BLOCK)
+        self.phase_max_s = phase_max_s
+        self.max_io_bytes = max_io_mb * MIB
+        self.should_continue = should_continue or (lambda: True)
+        self._io_done = 0
+
+    def _open(self, file_path: str) -> Tuple[int, bool]:
+        flags = os.O_RDWR | os.O_CREAT
+        direct = getattr(os, "O_DIRECT", 0)
+        if direct:
+            try:
+                return os.open(file_path, flags | direct, 0o600), True
+            except OSError:
+                pass  # tmpfs и некоторые overlay не поддерживают O_DIRECT
+        return os.open(file_path, flags, 0o600), False
+
+    def _budget_left(self, started: float) -> bool:
+        if not self.should_continue():
+            raise BenchmarkAborted("host is busy")
+        return time.monotonic() - started < self.phase_max_s and self._io_done < self.max_io_bytes // 4
+
+    def _drop_cache(self, fd: int, direct: bool) -> None:
+        if not direct and hasattr(os, "posix_fadvise"):
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+    def _sequential_write(self, fd: int, buf: mmap.mmap) -> float:
+        written = 0
+        self._io_done = 0
+        started = time.monotonic()
+        while written < self.file_size and self._budget_left(started):
+            n = os.pwrite(fd, buf, written)
+            written += n
+            self._io_done += n
+        os.fsync(fd)
+        self.file_size = written  # дальше читаем только то, что успели записать
+        return written / MIB / max(1e-6, time.monotonic() - started)
+
+    def _sequential_read(self, fd: int, buf: mmap.mmap) -> float:
+        done = 0
+        self._io_done = 0
+        started = time.monotonic()
+        while done < self.file_size and self._budget_left(started):
+            n = os.preadv(fd, [buf], done)
+            if n <= 0:
+                break
+            done += n
+            self._io_done += n
+        return done / MIB / max(1e-6, time.monotonic() - started)
+
+    def _random(self, fd: int, buf: mmap.mmap, write: bool) -> Dict[str, float]:
+        blocks = max(1, self.file_size // RAND_BLOCK)
+        self._io_done = 0
+        ops = 0
+        started = time.monotonic()
+        rng = random.Random(0)
+        # view держит экспорт буфера: без release() mmap.close() падает с BufferError
+        with memoryview(buf) as whole, whole[:RAND_BLOCK] as view:
+            while self._budget_left(started):
+                offset = rng.randrange(blocks) * RAND_BLOCK
+                if write:
+                    os.pwrite(fd, view, offset)
+                else:
+                    os.preadv(fd, [view], offset)
+                ops += 1
+                self._io_done += RAND_BLOCK
+        if write:
+            os.fsync(fd)
+        elapsed = max(1e-6, time.monotonic() - started)
+        return {"iops": round(ops / elapsed), "mb_s": round(ops * RAND_BLOCK / MIB / elapsed, 1)}
+
+    def run(self) -> Dict[str, Any]:
+        file_path = os.path.join(self.path, TEST_FILE_NAME)
+        buf = mmap.mmap(-1, SEQ_BLOCK)  # выровнен по странице — требование O_DIRECT
+        buf.write(os.urandom(SEQ_BLOCK))
+        fd, direct = self._open(file_path)
+        try:
+            seq_write = self._sequential_write(fd, buf)
+            self._drop_cache(fd, direct)
+            seq_read = self._sequential_read(fd, buf)
+            self._drop_cache(fd, direct)
+            rand_read = self._random(fd, buf, write=False)
+            rand_write = self._random(fd, buf, write=True)
+        finally:
+            os.close(fd)
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+            try:
+                buf.close()
+            except BufferError as e:
+                print(f"[WARNING] Disk benchmark buffer still in use: {e}")
+        return {
+            "path": self.path,
+            "device": block_device_for(self.path),
+            "direct_io": direct,
+            "file_size_mb": self.file_size // MIB,
+            "seq_read_mb_s": round(seq_read, 1),
+            "seq_write_mb_s": round(seq_write, 1),
+            "rand_read_iops": rand_read["iops"],
+            "rand_write_iops": rand_write["iops"],
+            "rand_read_mb_s": rand_read["mb_s"],
+            "rand_write_mb_s": rand_write["mb_s"],
+            "measured_at": int(time.time()),
+        }
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="disk throughput self-benchmark")
+    p.add_argument("--path", default=None, help="каталог для тестового файла (по умолчанию data-root Docker)")
+    p.add_argument("--file-size-mb", type=int, default=256)
+    p.add_argument("--phase-max-s", type=float, default=5.0)
+    p.add_argument("--max-io-mb", type=int, default=2048)
+    args = p.parse_args()
+    bench = DiskBenchmark(args.path or docker_data_root(), args.file_size_mb, args.phase_max_s, args.max_io_mb)
+    print(json.dumps(bench.run(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
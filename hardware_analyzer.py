@@ -5,28 +5,242 @@ import platform
 import subprocess
 import re
 import os
+import select
 import socket
+import threading
 import time
 import psutil
-import requests
-from typing import List, Dict, Optional, Tuple, Any
+from typing import List, Dict, Optional, Tuple, Any, Callable
+
+from command_runner import RUNNER
+from ip_location import IpLocationCache, external_ip, local_source_ip, lookup_location
+from linux_inventory import LinuxInventory, LinkEventSocket
+
+
+# Сколько держать в кэше вывод read-only команд инвентаризации (lscpu, nvidia-smi -L, lspci)
+READONLY_CACHE_TTL_S = 60.0
+
+# Через сколько секунд перепроверять категорию. На Linux по истечении TTL сравнивается дешёвый отпечаток
+# (список PCI-устройств, /sys/block, /sys/class/net, ...), и полный скан идёт только если он изменился;
+# там, где отпечатка нет, по истечении TTL категория просто сканируется заново.
+HARDWARE_CACHE_TTL_S: Dict[str, float] = {
+    "cpu": 3600.0,
+    "gpu": 60.0,
+    "disk": 300.0,
+    "network": 300.0,
+    "ram": 3600.0,
+}
+
+
+class _CacheEntry:
+    __slots__ = ("value", "fingerprint", "checked_at", "dirty")
+
+    def __init__(self, value: Any, fingerprint: Optional[Tuple], checked_at: float):
+        self.value = value
+        self.fingerprint = fingerprint
+        self.checked_at = checked_at
+        self.dirty = False
 
 
 class HardwareAnalyzer:
     """Класс для анализа характеристик компьютера"""
     
-    def __init__(self):
+    def __init__(self, use_sysfs: bool = True, cache_ttl_s: Optional[Dict[str, float]] = None,
+                 change_callback: Optional[Callable[[str], None]] = None, ip_cache_path: Optional[str] = None,
+                 state_store=None):
         self.system = platform.system()
-        self._cpu_info_cache = None
-        self._gpu_info_cache = None
-        self._disk_info_cache = None
-        self._network_info_cache = None
-        self._ram_info_cache = None
+        # На Linux CPU, диски и сеть читаются из /proc и /sys; lscpu/lsblk/ip — только запасной путь
+        self._inventory = LinuxInventory() if self.system == "Linux" and use_sysfs else None
+        self._fingerprints = LinuxInventory() if self.system == "Linux" else None
+        self.cache_ttl_s = dict(HARDWARE_CACHE_TTL_S, **(cache_ttl_s or {}))
+        # Вызывается с именем категории, когда пересканированные данные отличаются от прежних
+        self.change_callback = change_callback
+        self._cache: Dict[str, _CacheEntry] = {}
+        self._cache_lock = threading.RLock()
+        # Пересканирование категории идёт под её собственным замком, _cache_lock держится только на чтение/запись записей
+        self._scan_locks: Dict[str, threading.RLock] = {}
+        self._invalidated_during_scan: set = set()
+        self._watch_thread: Optional[threading.Thread] = None
+        self._watch_stop = threading.Event()
+        # Измеренные скорости дисков по имени устройства: (read_mb_s, write_mb_s)
+        self._disk_speeds: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+        # Результаты самопроверки канала по интерфейсу: measured_up_mbps, measured_down_mbps, rtt_ms
+        self._link_measurements: Dict[str, Dict[str, Any]] = {}
+        # Сервис доступных ресурсов; агент подставляет свой, с сэмплером и индексом контейнеров
+        self.resource_availability = None
+        # Внешний IP и геолокация; с базой состояния или ip_cache_path переживают перезапуск
+        self.ip_cache = IpLocationCache(ip_cache_path, state_store=state_store)
+        self._location_lookups: Dict[str, threading.Thread] = {}
     
+    def _fresh_entry(self, category: str) -> Tuple[Optional[_CacheEntry], bool]:
+        """(запись, не истёк ли TTL); вызывается под _cache_lock"""
+        entry = self._cache.get(category)
+        fresh = (entry is not None and not entry.dirty
+                 and time.monotonic() - entry.checked_at < self.cache_ttl_s.get(category, 0))
+        return entry, fresh
+
+    def _cached(self, category: str, scan: Callable[[], Any]) -> Any:
+        """Значение категории из кэша; по истечении TTL пересканирует, только если изменился отпечаток.
+        Сканирование (lspci, nvidia-smi, dmidecode) идёт без _cache_lock: читатели других категорий,
+        cached_value и определение IP/локации его не ждут; одну категорию одновременно сканирует один поток.
+        """
+        with self._cache_lock:
+            entry, fresh = self._fresh_entry(category)
+            if fresh:
+                return entry.value
+            scan_lock = self._scan_locks.setdefault(category, threading.RLock())
+
+        with scan_lock:
+            with self._cache_lock:
+                # Пока ждали замок, категорию мог пересканировать другой поток
+                entry, fresh = self._fresh_entry(category)
+                if fresh:
+                    return entry.value
+                self._invalidated_during_scan.discard(category)
+
+            fingerprint = None
+            if self._fingerprints is not None:
+                try:
+                    fingerprint = self._fingerprints.fingerprint(category)
+                except Exception:
+                    fingerprint = None
+            if entry is not None and fingerprint is not None and fingerprint == entry.fingerprint:
+                with self._cache_lock:
+                    entry.checked_at = time.monotonic()
+                    entry.dirty = category in self._invalidated_during_scan
+                return entry.value
+
+            if entry is not None:
+                # Устройство изменилось — не отдаём закэшированный вывод lspci/nvidia-smi
+                RUNNER.clear_cache()
+            value = scan()
+            with self._cache_lock:
+                new_entry = _CacheEntry(value, fingerprint, time.monotonic())
+                # invalidate() во время сканирования относится к уже устаревшему результату — перепроверим
+                new_entry.dirty = category in self._invalidated_during_scan
+                self._cache[category] = new_entry
+            changed = entry is not None and value != entry.value
+        if changed:
+            print(f"[INFO] Hardware change detected: {category}")
+            if self.change_callback is not None:
+                try:
+                    self.change_callback(category)
+                except Exception as e:
+                    print(f"[WARNING] Hardware change callback failed: {e}")
+        return value
+
+    def cached_value(self, category: str) -> Any:
+        """Последнее значение категории без перепроверки (None, если ещё не сканировалась)"""
+        entry = self._cache.get(category)
+        return entry.value if entry is not None else None
+
+    def invalidate(self, category: str) -> None:
+        """Помечает категорию для перепроверки при следующем обращении (без ожидания TTL)"""
+        with self._cache_lock:
+            entry = self._cache.get(category)
+            if entry is not None:
+                entry.dirty = True
+            # Идущее сейчас сканирование могло прочитать устройство до изменения
+            self._invalidated_during_scan.add(category)
+
+    def check_for_changes(self) -> None:
+        """Проходит по всем категориям; пересканирует те, у которых истёк TTL и сменился отпечаток"""
+        for category, getter in (("cpu", self.get_cpu_info), ("gpu", self.get_gpu_info), ("disk", self.get_disk_info),
+                                 ("network", self.get_network_info), ("ram", self.get_ram_info)):
+            try:
+                getter()
+            except Exception as e:
+                print(f"[WARNING] Hardware {category} re-check failed: {e}")
+
+    def start_watch(self, interval_s: float = 10.0) -> threading.Thread:
+        """Фоновый поток: каждые interval_s сверяет отпечатки, события netlink о NIC — сразу"""
+        self._watch_stop.clear()
+        self._watch_thread = threading.Thread(target=self._watch_loop, args=(interval_s,), name="hardware-watch", daemon=True)
+        self._watch_thread.start()
+        return self._watch_thread
+
+    def stop_watch(self) -> None:
+        self._watch_stop.set()
+        if self._watch_thread is not None:
+            self._watch_thread.join(timeout=5)
+            self._watch_thread = None
+
+    def _watch_loop(self, interval_s: float) -> None:
+        link_events = None
+        if self.system == "Linux":
+            try:
+                link_events = LinkEventSocket()
+            except OSError as e:
+                print(f"[WARNING] Netlink link events unavailable, NIC changes are checked every {interval_s:.0f}s: {e}")
+        try:
+            while not self._watch_stop.is_set():
+                if link_events is not None:
+                    ready, _, _ = select.select([link_events], [], [], interval_s)
+                    if ready and link_events.drain():
+                        self.invalidate("network")
+                        # Даём событиям одной перестройки (bond, vlan) осесть
+                        self._watch_stop.wait(1.0)
+                        link_events.drain()
+                elif self._watch_stop.wait(interval_s):
+                    break
+                if not self._watch_stop.is_set():
+                    self.check_for_changes()
+        finally:
+            if link_events is not None:
+                link_events.close()
+
     def get_cpu_info(self) -> List[Dict[str, Any]]:
         """Получает детальную информацию о CPU"""
-        if self._cpu_info_cache is not None:
-            return self._cpu_info_cache
+        return self._cached("cpu", self._scan_cpu_info)
+
+    def get_gpu_info(self) -> List[Dict[str, Any]]:
+        """Получает детальную информацию о GPU"""
+        return self._cached("gpu", self._scan_gpu_info)
+
+    def get_disk_info(self) -> List[Dict[str, Any]]:
+        """Получает информацию о дисках"""
+        disks = self._cached("disk", self._scan_disk_info)
+        if not self._disk_speeds:
+            return disks
+        result = []
+        for disk in disks:
+            speeds = self._disk_speeds.get(disk.get("name"))
+            if speeds:
+                disk = dict(disk, read_speed_mb_s=speeds[0], write_speed_mb_s=speeds[1])
+            result.append(disk)
+        return result
+
+    def set_disk_speed(self, device: Optional[str], read_mb_s: Optional[float], write_mb_s: Optional[float]) -> None:
+        """Запоминает измеренные скорости диска; они подставляются в get_disk_info"""
+        if device:
+            self._disk_speeds[device] = (read_mb_s, write_mb_s)
+
+    def get_network_info(self) -> List[Dict[str, Any]]:
+        """Получает информацию о сетевых интерфейсах"""
+        networks = self._cached("network", self._scan_network_info)
+        if not self._link_measurements:
+            return networks
+        return [dict(net, **self._link_measurements[net.get("ports")]) if net.get("ports") in self._link_measurements else net
+                for net in networks]
+
+    def set_link_measurement(self, iface: Optional[str], result: Dict[str, Any]) -> None:
+        """Запоминает измеренную скорость и RTT интерфейса; они подставляются в get_network_info рядом со скоростью линка"""
+        if iface:
+            self._link_measurements[iface] = {k: result.get(k) for k in ("measured_up_mbps", "measured_down_mbps", "rtt_ms")}
+
+    def get_ram_info(self) -> Tuple[int, str]:
+        """Получает информацию о RAM"""
+        return self._cached("ram", self._scan_ram_info)
+    
+    def _scan_cpu_info(self) -> List[Dict[str, Any]]:
+        """Полный скан CPU без кэша"""
+        if self._inventory is not None:
+            try:
+                result = self._inventory.cpu_info()
+                if result:
+                    return result
+            except Exception as e:
+                print(f"[WARNING] sysfs CPU detection failed, using fallback: {e}")
             
         cpu_info = []
         
@@ -34,17 +248,17 @@ class HardwareAnalyzer:
             if self.system == "Darwin":
                 # macOS
                 try:
-                    model = subprocess.check_output(['sysctl', '-n', 'machdep.cpu.brand_string']).decode().strip()
+                    model = RUNNER.check_output(['sysctl', '-n', 'machdep.cpu.brand_string']).decode().strip()
                     cores = psutil.cpu_count(logical=False)
                     threads = psutil.cpu_count(logical=True)
                     
                     # Получаем частоту через sysctl
                     freq = None
                     try:
-                        freq_mhz = subprocess.check_output(['sysctl', '-n', 'hw.cpufrequency_max']).decode().strip()
+                        freq_mhz = RUNNER.check_output(['sysctl', '-n', 'hw.cpufrequency_max']).decode().strip()
                         if freq_mhz.isdigit():
                             freq = float(freq_mhz) / 1000000000  # Конвертируем в GHz
-                    except:
+                    except Exception:
                         pass
                     
                     cpu_info.append({
@@ -67,7 +281,7 @@ class HardwareAnalyzer:
             elif self.system == "Windows":
                 # Windows
                 try:
-                    wmic_output = subprocess.check_output(['wmic', 'cpu', 'get', 'Name,NumberOfCores,NumberOfLogicalProcessors,MaxClockSpeed'], shell=True).decode(errors='ignore')
+                    wmic_output = RUNNER.check_output(['wmic', 'cpu', 'get', 'Name,NumberOfCores,NumberOfLogicalProcessors,MaxClockSpeed'], shell=True).decode(errors='ignore')
                     lines = wmic_output.strip().split('\n')[1:]  # Пропускаем заголовок
                     
                     cpu_groups = {}
@@ -102,7 +316,7 @@ class HardwareAnalyzer:
                         
                 except Exception as e:
                     print(f"[WARNING] Windows CPU detection failed: {e}")
-                    model = subprocess.check_output(['wmic', 'cpu', 'get', 'Name'], shell=True).decode(errors='ignore').split('\n')[1].strip()
+                    model = RUNNER.check_output(['wmic', 'cpu', 'get', 'Name'], shell=True).decode(errors='ignore').split('\n')[1].strip()
                     cores = psutil.cpu_count(logical=False)
                     threads = psutil.cpu_count(logical=True)
                     freq = psutil.cpu_freq().max / 1000 if psutil.cpu_freq() else None
@@ -117,7 +331,7 @@ class HardwareAnalyzer:
             elif self.system == "Linux":
                 # Linux
                 try:
-                    lscpu_output = subprocess.check_output(['lscpu']).decode()
+                    lscpu_output = RUNNER.check_output(['lscpu'], cache_ttl_s=READONLY_CACHE_TTL_S).decode()
                     
                     sockets_match = re.search(r'Socket\(s\):\s+(\d+)', lscpu_output)
                     sockets = int(sockets_match.group(1)) if sockets_match else 1
@@ -195,7 +409,7 @@ class HardwareAnalyzer:
                         try:
                             cpu_freq = psutil.cpu_freq()
                             freq = cpu_freq.max / 1000 if cpu_freq else None
-                        except:
+                        except Exception:
                             pass
                         
                         cpu_info.append({
@@ -230,20 +444,17 @@ class HardwareAnalyzer:
                     "count": 1
                 })
         
-        self._cpu_info_cache = cpu_info
         return cpu_info
     
-    def get_gpu_info(self) -> List[Dict[str, Any]]:
-        """Получает детальную информацию о GPU"""
-        if self._gpu_info_cache is not None:
-            return self._gpu_info_cache
+    def _scan_gpu_info(self) -> List[Dict[str, Any]]:
+        """Полный скан GPU без кэша"""
             
         gpus = []
         
         try:
             if self.system == "Darwin":
                 # macOS
-                sp = subprocess.check_output(['system_profiler', 'SPDisplaysDataType']).decode()
+                sp = RUNNER.check_output(['system_profiler', 'SPDisplaysDataType']).decode()
                 for block in sp.split('\n\n'):
                     model = re.search(r'Chipset Model: (.+)', block)
                     vram = re.search(r'VRAM.*: (\d+)\s*MB', block)
@@ -263,7 +474,7 @@ class HardwareAnalyzer:
                         
             elif self.system == "Windows":
                 # Windows
-                out = subprocess.check_output(['wmic', 'path', 'win32_VideoController', 'get', 'Name,AdapterRAM,PNPDeviceID,DriverVersion'], shell=True).decode(errors='ignore')
+                out = RUNNER.check_output(['wmic', 'path', 'win32_VideoController', 'get', 'Name,AdapterRAM,PNPDeviceID,DriverVersion'], shell=True).decode(errors='ignore')
                 for line in out.split('\n')[1:]:
                     if line.strip():
                         parts = line.split()
@@ -283,7 +494,7 @@ class HardwareAnalyzer:
             elif self.system == "Linux":
                 # Linux - NVIDIA GPU
                 try:
-                    nvidia_output = subprocess.check_output(['nvidia-smi', '-L'], stderr=subprocess.DEVNULL, timeout=10).decode(errors='ignore')
+                    nvidia_output = RUNNER.check_output(['nvidia-smi', '-L'], stderr=subprocess.DEVNULL, timeout=10, cache_ttl_s=READONLY_CACHE_TTL_S).decode(errors='ignore')
                     for line in nvidia_output.strip().split('\n'):
                         if line:
                             match = re.search(r'GPU (\d+): (.+?) \(UUID:', line)
@@ -295,7 +506,7 @@ class HardwareAnalyzer:
                                 vram_gb = None
                                 cuda_version = None
                                 try:
-                                    nvidia_detailed = subprocess.check_output(['nvidia-smi', '--query-gpu=memory.total,driver_version', '--format=csv,noheader', '-i', str(gpu_index)], stderr=subprocess.DEVNULL, timeout=5).decode(errors='ignore')
+                                    nvidia_detailed = RUNNER.check_output(['nvidia-smi', '--query-gpu=memory.total,driver_version', '--format=csv,noheader', '-i', str(gpu_index)], stderr=subprocess.DEVNULL, timeout=5, cache_ttl_s=READONLY_CACHE_TTL_S).decode(errors='ignore')
                                     if nvidia_detailed.strip():
                                         parts = nvidia_detailed.strip().split(',')
                                         if len(parts) >= 2:
@@ -315,7 +526,7 @@ class HardwareAnalyzer:
                                             cuda_match = re.search(r'CUDA Version: (\d+\.\d+)', driver_version)
                                             if cuda_match:
                                                 cuda_version = cuda_match.group(1)
-                                except:
+                                except Exception:
                                     pass
                                 
                                 gpus.append({
@@ -327,12 +538,12 @@ class HardwareAnalyzer:
                                     "vendor": "NVIDIA",
                                     "count": 1
                                 })
-                except:
+                except Exception:
                     pass
                 
                 # Linux - другие GPU через lspci
                 try:
-                    lspci_output = subprocess.check_output(['lspci', '-nn'], timeout=5).decode(errors='ignore')
+                    lspci_output = RUNNER.check_output(['lspci', '-nn'], timeout=5, cache_ttl_s=READONLY_CACHE_TTL_S).decode(errors='ignore')
                     for line in lspci_output.split('\n'):
                         if 'VGA compatible controller' in line or '3D controller' in line or 'Display controller' in line:
                             parts = line.split(':')
@@ -371,7 +582,7 @@ class HardwareAnalyzer:
                                         "vendor": vendor,
                                         "count": 1
                                     })
-                except:
+                except Exception:
                     pass
         except Exception as e:
             print(f"[ERROR] GPU info failed: {e}")
@@ -400,24 +611,28 @@ class HardwareAnalyzer:
                 gpu_groups[key]["count"] = 1
         
         filtered_gpus = list(gpu_groups.values())
-        self._gpu_info_cache = filtered_gpus
         return filtered_gpus
     
-    def get_disk_info(self) -> List[Dict[str, Any]]:
-        """Получает информацию о дисках"""
-        if self._disk_info_cache is not None:
-            return self._disk_info_cache
+    def _scan_disk_info(self) -> List[Dict[str, Any]]:
+        """Полный скан дисков без кэша"""
+        if self._inventory is not None:
+            try:
+                result = self._inventory.disk_info()
+                if result:
+                    return result
+            except Exception as e:
+                print(f"[WARNING] sysfs disk detection failed, using fallback: {e}")
             
         disks = []
         
         try:
             if self.system == "Darwin":
                 # macOS
-                disk_list = subprocess.check_output(['diskutil', 'list']).decode()
+                disk_list = RUNNER.check_output(['diskutil', 'list']).decode()
                 for match in re.finditer(r'/dev/(disk\d+)', disk_list):
                     disk = match.group(1)
                     try:
-                        info = subprocess.check_output(['diskutil', 'info', disk]).decode()
+                        info = RUNNER.check_output(['diskutil', 'info', disk]).decode()
                         model = re.search(r'Device / Media Name: (.+)', info)
                         size = re.search(r'Total Size:.*\((\d+(?:\.\d+)?)\s+GB\)', info)
                         dtype = re.search(r'Protocol: (.+)', info)
@@ -433,7 +648,7 @@ class HardwareAnalyzer:
                         
             elif self.system == "Windows":
                 # Windows
-                out = subprocess.check_output(['wmic', 'diskdrive', 'get', 'Model,Size,MediaType,InterfaceType'], shell=True).decode(errors='ignore')
+                out = RUNNER.check_output(['wmic', 'diskdrive', 'get', 'Model,Size,MediaType,InterfaceType'], shell=True).decode(errors='ignore')
                 for line in out.split('\n')[1:]:
                     if line.strip():
                         parts = line.split()
@@ -453,7 +668,7 @@ class HardwareAnalyzer:
             elif self.system == "Linux":
                 # Linux
                 try:
-                    lsblk_output = subprocess.check_output(['lsblk', '-d', '-o', 'NAME,MODEL,SIZE,TYPE'], stderr=subprocess.DEVNULL).decode(errors='ignore')
+                    lsblk_output = RUNNER.check_output(['lsblk', '-d', '-o', 'NAME,MODEL,SIZE,TYPE'], stderr=subprocess.DEVNULL, cache_ttl_s=READONLY_CACHE_TTL_S).decode(errors='ignore')
                     lines = lsblk_output.split('\n')
                     
                     header_index = -1
@@ -532,7 +747,7 @@ class HardwareAnalyzer:
                                         with open(f'/sys/block/{name.replace("/dev/", "")}/queue/rotational', 'r') as f:
                                             rotational = f.read().strip()
                                             disk_type = "SSD" if rotational == "0" else "HDD"
-                                except:
+                                except Exception:
                                     pass
                                 
                                 disks.append({
@@ -572,25 +787,29 @@ class HardwareAnalyzer:
                 "write_speed_mb_s": None
             })
         
-        self._disk_info_cache = disks
         return disks
     
-    def get_network_info(self) -> List[Dict[str, Any]]:
-        """Получает информацию о сетевых интерфейсах"""
-        if self._network_info_cache is not None:
-            return self._network_info_cache
+    def _scan_network_info(self) -> List[Dict[str, Any]]:
+        """Полный скан сетевых интерфейсов без кэша"""
+        if self._inventory is not None:
+            try:
+                result = self._inventory.network_info()
+                if result:
+                    return result
+            except Exception as e:
+                print(f"[WARNING] sysfs network detection failed, using fallback: {e}")
             
         networks = []
         
         try:
             if self.system == "Darwin":
                 # macOS
-                sp = subprocess.check_output(['networksetup', '-listallhardwareports']).decode()
+                sp = RUNNER.check_output(['networksetup', '-listallhardwareports']).decode()
                 for match in re.finditer(r'Hardware Port: (.+?)\nDevice: (.+?)\n', sp):
                     port, device = match.groups()
                     up_mbps = None
                     try:
-                        info = subprocess.check_output(['ifconfig', device]).decode()
+                        info = RUNNER.check_output(['ifconfig', device]).decode()
                         up = re.search(r'media:.*\((\d+)baseT', info)
                         up_mbps = int(up.group(1)) if up else None
                     except Exception:
@@ -604,7 +823,7 @@ class HardwareAnalyzer:
             elif self.system == "Windows":
                 # Windows
                 try:
-                    out = subprocess.check_output(['wmic', 'nic', 'get', 'Name,Speed'], shell=True).decode(errors='ignore')
+                    out = RUNNER.check_output(['wmic', 'nic', 'get', 'Name,Speed'], shell=True).decode(errors='ignore')
                     for line in out.split('\n')[1:]:
                         if line.strip():
                             parts = line.split()
@@ -621,7 +840,7 @@ class HardwareAnalyzer:
             elif self.system == "Linux":
                 # Linux
                 try:
-                    ip_link_output = subprocess.check_output(['ip', '-o', 'link', 'show'], stderr=subprocess.DEVNULL).decode(errors='ignore')
+                    ip_link_output = RUNNER.check_output(['ip', '-o', 'link', 'show'], stderr=subprocess.DEVNULL).decode(errors='ignore')
                     
                     for line in ip_link_output.split('\n'):
                         if line.strip():
@@ -644,7 +863,7 @@ class HardwareAnalyzer:
                                                 if speed != '-1' and speed.isdigit():
                                                     up_mbps = int(speed)
                                                     down_mbps = int(speed)
-                                    except:
+                                    except Exception:
                                         pass
                                     
                                     # Определяем тип интерфейса
@@ -681,25 +900,22 @@ class HardwareAnalyzer:
         except Exception as e:
             print(f"[ERROR] Network info failed: {e}")
         
-        self._network_info_cache = networks
         return networks
     
-    def get_ram_info(self) -> Tuple[int, str]:
-        """Получает информацию о RAM"""
-        if self._ram_info_cache is not None:
-            return self._ram_info_cache
+    def _scan_ram_info(self) -> Tuple[int, str]:
+        """Полный скан RAM без кэша"""
             
         total_ram_gb = round(psutil.virtual_memory().total / (1024 ** 3))
         ram_type = "Unknown"
         
         try:
             if self.system == "Darwin":
-                ram_type_out = subprocess.check_output(["system_profiler", "SPMemoryDataType"]).decode()
+                ram_type_out = RUNNER.check_output(["system_profiler", "SPMemoryDataType"]).decode()
                 match = re.search(r'Type: (\w+)', ram_type_out)
                 if match:
                     ram_type = match.group(1)
             elif self.system == "Windows":
-                ram_type_out = subprocess.check_output(['wmic', 'memorychip', 'get', 'MemoryType'], shell=True).decode(errors='ignore')
+                ram_type_out = RUNNER.check_output(['wmic', 'memorychip', 'get', 'MemoryType'], shell=True).decode(errors='ignore')
                 if '24' in ram_type_out:
                     ram_type = 'DDR3'
                 elif '26' in ram_type_out:
@@ -707,24 +923,23 @@ class HardwareAnalyzer:
             elif self.system == "Linux":
                 try:
                     try:
-                        ram_type_out = subprocess.check_output(['sudo', 'dmidecode', '-t', 'memory'], stderr=subprocess.DEVNULL).decode(errors='ignore')
+                        ram_type_out = RUNNER.check_output(['sudo', '-n', 'dmidecode', '-t', 'memory'], stderr=subprocess.DEVNULL, cache_ttl_s=READONLY_CACHE_TTL_S).decode(errors='ignore')
                         match = re.search(r'Type:\s+(DDR\w*)', ram_type_out)
                         if match:
                             ram_type = match.group(1)
-                    except:
+                    except Exception:
                         try:
-                            lshw_output = subprocess.check_output(['lshw', '-class', 'memory'], stderr=subprocess.DEVNULL).decode(errors='ignore')
+                            lshw_output = RUNNER.check_output(['lshw', '-class', 'memory'], stderr=subprocess.DEVNULL, cache_ttl_s=READONLY_CACHE_TTL_S).decode(errors='ignore')
                             match = re.search(r'DDR(\w*)', lshw_output)
                             if match:
                                 ram_type = f"DDR{match.group(1)}"
-                        except:
+                        except Exception:
                             pass
                 except Exception as e:
                     print(f"[WARNING] RAM type detection error: {e}")
         except Exception as e:
             print(f"[ERROR] RAM info failed: {e}")
         
-        self._ram_info_cache = (total_ram_gb, ram_type)
         return total_ram_gb, ram_type
     
     def get_ip_address(self) -> Optional[str]:
@@ -733,7 +948,7 @@ class HardwareAnalyzer:
             # Метод 1: Для Linux - используем ip route get
             if self.system == "Linux":
                 try:
-                    route_output = subprocess.check_output(['ip', 'route', 'get', '1.1.1.1'], stderr=subprocess.DEVNULL).decode(errors='ignore')
+                    route_output = RUNNER.check_output(['ip', 'route', 'get', '1.1.1.1'], stderr=subprocess.DEVNULL).decode(errors='ignore')
                     if 'src ' in route_output:
                         src_match = re.search(r'src (\d+\.\d+\.\d+\.\d+)', route_output)
                         if src_match:
@@ -743,32 +958,21 @@ class HardwareAnalyzer:
                     print(f"[DEBUG] Failed to get IP from route: {e}")
                     pass
             
-            # Метод 2: Внешний сервис
-            try:
-                response = requests.get('https://api.ipify.org', timeout=5)
-                if response.status_code == 200:
-                    external_ip = response.text.strip()
-                    if external_ip and external_ip != '127.0.0.1':
-                        return external_ip
-            except Exception as e:
-                print(f"[DEBUG] Failed to get IP from api.ipify.org: {e}")
-                pass
-            
-            # Метод 3: Альтернативный сервис
-            try:
-                response = requests.get('https://ifconfig.me', timeout=5)
-                if response.status_code == 200:
-                    external_ip = response.text.strip()
-                    if external_ip and external_ip != '127.0.0.1':
-                        return external_ip
-            except Exception as e:
-                print(f"[DEBUG] Failed to get IP from ifconfig.me: {e}")
-                pass
+            # Метод 2: Внешние сервисы — из кэша, пока не сменился локальный адрес, иначе опрашиваются одновременно
+            source_ip = local_source_ip()
+            cached_ip = self.ip_cache.external_ip(source_ip)
+            if cached_ip:
+                return cached_ip
+            if not self.ip_cache.lookup_failed_recently(source_ip):
+                ip = external_ip()
+                self.ip_cache.set_external_ip(source_ip, ip)
+                if ip:
+                    return ip
             
-            # Метод 4: Для macOS
+            # Метод 3: Для macOS
             if self.system == "Darwin":
                 try:
-                    ifconfig_output = subprocess.check_output(['ifconfig']).decode(errors='ignore')
+                    ifconfig_output = RUNNER.check_output(['ifconfig']).decode(errors='ignore')
                     for line in ifconfig_output.split('\n'):
                         if 'inet ' in line and '127.0.0.1' not in line:
                             parts = line.strip().split()
@@ -778,13 +982,13 @@ class HardwareAnalyzer:
                                         ip = parts[i + 1]
                                         if ip != '127.0.0.1':
                                             return ip
-                except:
+                except Exception:
                     pass
             
-            # Метод 5: Для Windows
+            # Метод 4: Для Windows
             elif self.system == "Windows":
                 try:
-                    ipconfig_output = subprocess.check_output(['ipconfig'], shell=True).decode(errors='ignore')
+                    ipconfig_output = RUNNER.check_output(['ipconfig'], shell=True).decode(errors='ignore')
                     for line in ipconfig_output.split('\n'):
                         if 'IPv4 Address' in line:
                             ip_match = re.search(r'(\d+\.\d+\.\d+\.\d+)', line)
@@ -792,16 +996,16 @@ class HardwareAnalyzer:
                                 ip = ip_match.group(1)
                                 if ip != '127.0.0.1':
                                     return ip
-                except:
+                except Exception:
                     pass
             
-            # Метод 6: Fallback
+            # Метод 5: Fallback
             try:
                 hostname = socket.gethostname()
                 ip = socket.gethostbyname(hostname)
                 if ip != '127.0.0.1':
                     return ip
-            except:
+            except Exception:
                 pass
             
             return None
@@ -815,140 +1019,53 @@ class HardwareAnalyzer:
         return platform.node()
     
     def get_location_from_ip(self, ip_address: str) -> str:
-        """Определяет локацию по IP адресу"""
+        """Определяет локацию по IP адресу (из кэша, иначе запросом к сервисам геолокации)"""
+        location = self.ip_cache.location(ip_address)
+        if location:
+            return location
         try:
-            response = requests.get(f"http://ip-api.com/json/{ip_address}", timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('status') == 'success':
-                    country = data.get('country', 'Unknown')
-                    city = data.get('city', 'Unknown')
-                    return f"{city}, {country}"
-                else:
-                    return "Unknown"
-            else:
-                return "Unknown"
+            location = lookup_location(ip_address)
         except Exception as e:
             print(f"[WARNING] Failed to get location from IP: {e}")
+            location = None
+        if not location:
             return "Unknown"
+        self.ip_cache.set_location(ip_address, location)
+        return location
+
+    def cached_location(self, ip_address: str) -> Optional[str]:
+        """Локация из кэша без сетевых запросов (None — неизвестна или устарела)"""
+        return self.ip_cache.location(ip_address)
+
+    def resolve_location_async(self, ip_address: str, callback: Callable[[str, str], None]) -> None:
+        """Определяет локацию в фоне и вызывает callback(ip_address, location), если она найдена"""
+        def resolve():
+            location = self.get_location_from_ip(ip_address)
+            with self._cache_lock:
+                self._location_lookups.pop(ip_address, None)
+            if location != "Unknown":
+                try:
+                    callback(ip_address, location)
+                except Exception as e:
+                    print(f"[WARNING] Location callback failed: {e}")
+
+        with self._cache_lock:
+            if ip_address in self._location_lookups:
+                return
+            thread = threading.Thread(target=resolve, name="geolocation", daemon=True)
+            self._location_lookups[ip_address] = thread
+        thread.start()
 
     def get_available_resources(self) -> Optional[Dict[str, Any]]:
         """Получает информацию о доступных ресурсах системы с учетом уже запущенных контейнеров"""
         try:
-            # CPU
-            cpu_count = psutil.cpu_count(logical=True)
-            cpu_percent = psutil.cpu_percent(interval=1)
-            
-            # RAM
-            memory = psutil.virtual_memory()
-            total_ram_gb = memory.total / (1024**3)
-            available_ram_gb = memory.available / (1024**3)
-            
-            # GPU (если есть)
-            gpu_count = 0
-            try:
-                gpu_info = self.get_gpu_info()
-                gpu_count = len(gpu_info) if gpu_info else 0
-            except:
-                pass
-            
-            # Disk
-            disk_usage = psutil.disk_usage('/')
-            total_disk_gb = disk_usage.total / (1024**3)
-            available_disk_gb = disk_usage.free / (1024**3)
-            
-            # Проверяем уже запущенные контейнеры и вычитаем их ресурсы
-            running_containers_resources = self._get_running_containers_resources()
-            
-            # Вычитаем ресурсы уже запущенных контейнеров
-            if running_containers_resources:
-                available_ram_gb = max(1, available_ram_gb - running_containers_resources.get('ram_gb', 0))
-                available_disk_gb = max(10, available_disk_gb - running_containers_resources.get('disk_gb', 0))
-                # GPU считаем как общее количество, так как Docker может использовать все GPU
-                # CPU также считаем как общее количество, так как Docker может ограничивать по ядрам
-            
-            print(f"[INFO] System resources:")
-            print(f"  Total CPU cores: {cpu_count}")
-            print(f"  Available RAM: {available_ram_gb:.1f}GB")
-            print(f"  Available disk: {available_disk_gb:.1f}GB")
-            print(f"  GPU count: {gpu_count}")
-            if running_containers_resources:
-                print(f"  Running containers using: {running_containers_resources.get('ram_gb', 0):.1f}GB RAM, {running_containers_resources.get('disk_gb', 0):.1f}GB disk")
-            
-            return {
-                'cpu_count': cpu_count,
-                'cpu_usage_percent': cpu_percent,
-                'total_ram_gb': total_ram_gb,
-                'available_ram_gb': available_ram_gb,
-                'gpu_count': gpu_count,
-                'total_disk_gb': total_disk_gb,
-                'available_disk_gb': available_disk_gb
-            }
+            if self.resource_availability is None:
+                from resource_availability import ResourceAvailability
+                self.resource_availability = ResourceAvailability(self)
+            return self.resource_availability.available()
         except Exception as e:
             print(f"[ERROR] Failed to get available resources: {e}")
             return None
-
-    def _get_running_containers_resources(self) -> Optional[Dict[str, Any]]:
-        """Получает информацию о ресурсах уже запущенных Docker контейнеров"""
-        try:
-            import subprocess
-            
-            # Получаем список запущенных контейнеров
-            result = subprocess.run(['docker', 'ps', '--format', '{{.Names}}'], 
-                                  capture_output=True, text=True, timeout=10)
-            
-            if result.returncode != 0:
-                return None
-            
-            container_names = result.stdout.strip().split('\n') if result.stdout.strip() else []
-            
-            total_ram_gb = 0
-            total_disk_gb = 0
-            
-            for container_name in container_names:
-                if not container_name:
-                    continue
-                
-                # Получаем информацию о контейнере
-                try:
-                    # Получаем использование памяти
-                    mem_result = subprocess.run(['docker', 'stats', '--no-stream', '--format', '{{.MemUsage}}', container_name], 
-                                              capture_output=True, text=True, timeout=5)
-                    if mem_result.returncode == 0 and mem_result.stdout.strip():
-                        mem_str = mem_result.stdout.strip()
-                        # Парсим строку вида "1.234MiB / 2GiB"
-                        mem_match = re.search(r'(\d+(?:\.\d+)?)([KMGT]iB)', mem_str)
-                        if mem_match:
-                            mem_value = float(mem_match.group(1))
-                            mem_unit = mem_match.group(2)
-                            # Конвертируем в GB
-                            if mem_unit == 'KiB':
-                                mem_gb = mem_value / (1024**2)
-                            elif mem_unit == 'MiB':
-                                mem_gb = mem_value / 1024
-                            elif mem_unit == 'GiB':
-                                mem_gb = mem_value
-                            else:
-                                mem_gb = mem_value / (1024**3)
-                            total_ram_gb += mem_gb
-                    
-                    # Получаем использование диска (упрощенно)
-                    # Docker не предоставляет простой способ получить использование диска
-                    # Поэтому используем приблизительную оценку
-                    total_disk_gb += 1  # Примерно 1GB на контейнер
-                    
-                except Exception as e:
-                    print(f"[WARNING] Failed to get resources for container {container_name}: {e}")
-                    continue
-            
-            return {
-                'ram_gb': total_ram_gb,
-                'disk_gb': total_disk_gb
-            }
-            
-        except Exception as e:
-            print(f"[WARNING] Failed to get running containers resources: {e}")
-            return None
     
     def get_system_info(self) -> Dict[str, Any]:
         """Получает полную системную информацию"""
@@ -1031,8 +1148,6 @@ class HardwareAnalyzer:
     
     def clear_cache(self):
         """Очищает кэш данных"""
-        self._cpu_info_cache = None
-        self._gpu_info_cache = None
-        self._disk_info_cache = None
-        self._network_info_cache = None
-        self._ram_info_cache = None
+        with self._cache_lock:
+            self._cache.clear()
+        RUNNER.clear_cache()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import platform
+import time
+from typing import Dict, Any, Optional, List
+
+from ip_location import local_source_ip
+from linux_inventory import LinuxInventory
+
+
+# Поля, которые меняются между замерами и не описывают само железо
+VOLATILE_KEYS = ("read_speed_mb_s", "write_speed_mb_s", "disk_benchmark", "measured_up_mbps", "measured_down_mbps", "rtt_ms")
+# Полная пересылка system_data не реже, чем раз в сутки (внешний IP мог смениться за NAT)
+FULL_REFRESH_S = 24 * 3600
+
+
+def _digest(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str).encode()).hexdigest()
+
+
+def _normalize_list(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    cleaned = [{k: v for k, v in item.items() if k not in VOLATILE_KEYS} for item in items or []]
+    return sorted(cleaned, key=lambda item: json.dumps(item, sort_keys=True, default=str))
+
+
+def sections_of(system_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Нормализованные секции system_data, из которых считается отпечаток"""
+    hardware = system_data.get("hardware_info") or {}
+    return {
+        "cpus": _normalize_list(hardware.get("cpus")),
+        "gpus": _normalize_list(hardware.get("gpus")),
+        "disks": _normalize_list(hardware.get("disks")),
+        "networks": _normalize_list(hardware.get("networks")),
+        "ram": {"total_ram_gb": system_data.get("total_ram_gb"), "ram_type": system_data.get("ram_type")},
+        "identity": {"hostname": system_data.get("hostname"), "ip_address": system_data.get("ip_address"),
+                     "location": system_data.get("location")},
+    }
+
+
+def section_payload(system_data: Dict[str, Any], names: List[str]) -> Dict[str, Any]:
+    """Часть system_data с исходной структурой полей, содержащая только секции names"""
+    payload: Dict[str, Any] = {}
+    hardware = system_data.get("hardware_info") or {}
+    for name in names:
+        if name in ("cpus", "gpus", "disks", "networks"):
+            payload.setdefault("hardware_info", {})[name] = hardware.get(name, [])
+        elif name == "ram":
+            payload["total_ram_gb"] = system_data.get("total_ram_gb")
+            payload["ram_type"] = system_data.get("ram_type")
+        elif name == "identity":
+            for key in ("hostname", "ip_address", "location"):
+                payload[key] = system_data.get(key)
+    return payload
+
+
+def compute(system_data: Dict[str, Any]) -> Dict[str, Any]:
+    """{"fingerprint": sha256, "sections": {имя: sha256}}"""
+    section_hashes = {name: _digest(value) for name, value in sections_of(system_data).items()}
+    return {"fingerprint": _digest(section_hashes), "sections": section_hashes}
+
+
+def precheck(inventory: Optional[LinuxInventory] = None) -> Optional[str]:
+    """Дешёвая проверка «ничего не изменилось»: отпечатки /proc и /sys, hostname и локальный IP.
+    Без подпроцессов и сетевых запросов; None — проверка недоступна (не Linux).
+    """
+    if inventory is None:
+        if platform.system() != "Linux":
+            return None
+        inventory = LinuxInventory()
+    parts = {category: inventory.fingerprint(category) for category in ("cpu", "gpu", "disk", "network", "ram")}
+    parts["hostname"] = platform.node()
+    parts["source_ip"] = local_source_ip()
+    return _digest(parts)
+
+
+class FingerprintStore:
+    """Отпечаток железа, отправленный серверу последним.
+    С state_store хранится в базе состояния (probes/fingerprint), старый JSON-файл path переносится туда;
+    без неё — в JSON-файле path.
+    """
+
+    PROBE_NAME = "fingerprint"
+
+    def __init__(self, path: str = ".agent_fingerprint.json", state_store=None):
+        self.path = path
+        self.state_store = state_store
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        try:
+            if self.state_store is not None:
+                record = self.state_store.import_json_probe(self.PROBE_NAME, self.path)
+            else:
+                with open(self.path, "r") as f:
+                    record = json.load(f)
+            return record if isinstance(record, dict) and record.get("fingerprint") else None
+        except (OSError, ValueError):
+            return None
+
+    def save(self, fingerprint: Dict[str, Any], precheck_digest: Optional[str], extra: Optional[Dict[str, Any]] = None) -> None:
+        self._write(dict(fingerprint, precheck=precheck_digest, saved_at=time.time(), **(extra or {})))
+
+    def update(self, **fields) -> bool:
+        """Дописывает поля в сохранённую запись, не трогая отпечаток и saved_at"""
+        record = self.load()
+        if record is None:
+            return False
+        record.update(fields)
+        self._write(record)
+        return True
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        if self.state_store is not None:
+            self.state_store.put_probe(self.PROBE_NAME, record)
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def is_fresh(record: Dict[str, Any]) -> bool:
+        return time.time() - record.get("saved_at", 0) < FULL_REFRESH_S
+
+
+def changed_sections(previous: Optional[Dict[str, Any]], current: Dict[str, Any]) -> List[str]:
+    if not previous:
+        return list(current["sections"])
+    old = previous.get("sections") or {}
+    return [name for name, digest in current["sections"].items() if old.get(name) != digest]
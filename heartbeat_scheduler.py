@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+import time
+from typing import List, Optional, Tuple
+
+
+class HeartbeatScheduler:
+    """Планировщик heartbeat на monotonic-часах.
+    Периодические heartbeat идут по сетке start + phase + k * period и не дрейфуют от
+    длительности сбора данных; фаза случайна, чтобы агенты, запущенные одновременно,
+    не слали heartbeat синхронно. trigger() вызывает внеочередной heartbeat.
+    """
+
+    def __init__(self, period_s: float = 300.0, phase_s: Optional[float] = None, min_event_gap_s: float = 10.0):
+        self.period_s = max(1.0, float(period_s))
+        self.min_event_gap_s = max(0.0, float(min_event_gap_s))
+        if phase_s is None:
+            phase_s = random.uniform(0, self.period_s)
+        self._next_due = time.monotonic() + phase_s
+        self._last_event_sent = float('-inf')
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._reasons: List[str] = []
+        self._stopped = False
+
+    def trigger(self, reason: str) -> None:
+        """Запросить внеочередной heartbeat (потокобезопасно)"""
+        with self._lock:
+            if reason not in self._reasons:
+                self._reasons.append(reason)
+        self._event.set()
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._event.set()
+
+    def _drain(self) -> List[str]:
+        with self._lock:
+            reasons, self._reasons = self._reasons, []
+        return reasons
+
+    def wait(self) -> Optional[Tuple[str, List[str]]]:
+        """Блокирует до следующего heartbeat.
+        Возвращает ("periodic" | "event", причины) или None после stop().
+        """
+        while not self._stopped:
+            now = time.monotonic()
+            if now >= self._next_due:
+                # Пропущенные слоты (например, после suspend) не отправляем пачкой
+                while self._next_due <= now:
+                    self._next_due += self.period_s
+                return "periodic", self._drain()
+
+            with self._lock:
+                pending = bool(self._reasons)
+            if pending:
+                ready_at = self._last_event_sent + self.min_event_gap_s
+                if now >= ready_at:
+                    self._event.clear()
+                    self._last_event_sent = now
+                    return "event", self._drain()
+                # Слишком часто — копим причины до конца паузы; stop() и новые причины её прерывают
+                self._event.clear()
+                if self._stopped:
+                    break
+                self._event.wait(max(0.0, min(self._next_due, ready_at) - now))
+                continue
+
+            self._event.wait(self._next_due - now)
+            self._event.clear()
+        return None
+
+    def seconds_until_next(self) -> float:
+        return max(0.0, self._next_due - time.monotonic())
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import ipaddress
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from typing import Dict, Any, Optional, Callable, List, Tuple
+
+import requests
+
+
+# Сервисы определения внешнего IP; опрашиваются одновременно, берётся первый валидный ответ
+EXTERNAL_IP_SERVICES = ("https://api.ipify.org", "https://ifconfig.me")
+# Внешний IP из сервисов считается актуальным, пока не сменился локальный адрес источника
+EXTERNAL_IP_TTL_S = 6 * 3600.0
+# Если сервисы недоступны (закрытый egress), не опрашиваем их снова при каждом старте
+FAILED_LOOKUP_TTL_S = 3600.0
+# Геолокация адреса меняется редко
+LOCATION_TTL_S = 7 * 24 * 3600.0
+LOOKUP_TIMEOUT_S = 5.0
+
+
+def local_source_ip() -> Optional[str]:
+    """Адрес, с которого уходит трафик наружу (UDP connect не шлёт пакетов)"""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("1.1.1.1", 80))
+            return s.getsockname()[0]
+    except OSError:
+        return None
+
+
+def _valid_ip(text: str) -> Optional[str]:
+    try:
+        ip = ipaddress.ip_address(text.strip())
+    except ValueError:
+        return None
+    return None if ip.is_loopback or ip.is_unspecified else str(ip)
+
+
+def race(lookups: List[Callable[[], Optional[str]]], timeout_s: float) -> Optional[str]:
+    """Запускает lookups параллельно и возвращает первый непустой результат (None — все не ответили за timeout_s).
+    Отставшие потоки не ждём: у каждого свой таймаут запроса. Ошибки отдельных сервисов не печатаются —
+    одно предупреждение, только если не ответил ни один.
+    """
+    results: "queue.Queue[Tuple[Optional[str], Optional[Exception]]]" = queue.Queue()
+
+    def worker(lookup: Callable[[], Optional[str]]) -> None:
+        try:
+            results.put((lookup(), None))
+        except Exception as e:
+            results.put((None, e))
+
+    for lookup in lookups:
+        threading.Thread(target=worker, args=(lookup,), name="ip-lookup", daemon=True).start()
+    deadline = time.monotonic() + timeout_s
+    errors = []
+    for _ in lookups:
+        try:
+            value, error = results.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            errors.append(f"timed out after {timeout_s:.1f}s")
+            break
+        if value:
+            return value
+        errors.append(str(error) if error is not None else "no result")
+    if errors:
+        print(f"[WARNING] All {len(lookups)} lookups failed: {'; '.join(errors)}")
+    return None
+
+
+def _service_ip(url: str, timeout_s: float) -> Optional[str]:
+    response = requests.get(url, timeout=timeout_s, headers={"Accept": "text/plain"})
+    return _valid_ip(response.text) if response.status_code == 200 else None
+
+
+def external_ip(timeout_s: float = LOOKUP_TIMEOUT_S) -> Optional[str]:
+    return race([lambda url=url: _service_ip(url, timeout_s) for url in EXTERNAL_IP_SERVICES], timeout_s)
+
+
+def _location_ip_api(ip_address: str, timeout_s: float) -> Optional[str]:
+    data = requests.get(f"http://ip-api.com/json/{ip_address}", timeout=timeout_s).json()
+    if data.get("status") != "success":
+        return None
+    return f"{data.get('city', 'Unknown')}, {data.get('country', 'Unknown')}"
+
+
+def _location_ipwho(ip_address: str, timeout_s: float) -> Optional[str]:
+    data = requests.get(f"https://ipwho.is/{ip_address}", timeout=timeout_s).json()
+    if not data.get("success"):
+        return None
+    return f"{data.get('city', 'Unknown')}, {data.get('country', 'Unknown')}"
+
+
+def lookup_location(ip_address: str, timeout_s: float = LOOKUP_TIMEOUT_S) -> Optional[str]:
+    """"Город, Страна" по IP из первого ответившего сервиса"""
+    return race([lambda: _location_ip_api(ip_address, timeout_s), lambda: _location_ipwho(ip_address, timeout_s)], timeout_s)
+
+
+class IpLocationCache:
+    """Кэш внешнего IP и геолокации.
+    Внешний IP привязан к локальному адресу источника: пока тот не сменился и TTL не истёк,
+    сервисы не опрашиваются. Локация хранится по IP-адресу. С state_store запись лежит в базе
+    состояния (probes/ip_location), иначе — в JSON-файле path; path=None — только в памяти.
+    """
+
+    PROBE_NAME = "ip_location"
+
+    def __init__(self, path: Optional[str] = None, ip_ttl_s: float = EXTERNAL_IP_TTL_S, location_ttl_s: float = LOCATION_TTL_S,
+                 state_store=None):
+        self.path = path
+        self.ip_ttl_s = ip_ttl_s
+        self.location_ttl_s = location_ttl_s
+        self.state_store = state_store
+        self._lock = threading.Lock()
+        self._record: Dict[str, Any] = self._load()
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            if self.state_store is not None:
+                record = self.state_store.import_json_probe(self.PROBE_NAME, self.path) if self.path else self.state_store.get_probe(self.PROBE_NAME)
+            elif self.path:
+                with open(self.path, "r") as f:
+                    record = json.load(f)
+            else:
+                return {}
+            return record if isinstance(record, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self) -> None:
+        if self.state_store is not None:
+            try:
+                self.state_store.put_probe(self.PROBE_NAME, self._record)
+            except Exception as e:
+                print(f"[WARNING] Failed to save IP cache: {e}")
+            return
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self._record, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[WARNING] Failed to save IP cache: {e}")
+
+    def external_ip(self, source_ip: Optional[str]) -> Optional[str]:
+        with self._lock:
+            cached = self._record.get("external_ip") or {}
+        if not cached.get("ip") or cached.get("source_ip") != source_ip:
+            return None
+        if time.time() - cached.get("resolved_at", 0) >= self.ip_ttl_s:
+            return None
+        return cached["ip"]
+
+    def set_external_ip(self, source_ip: Optional[str], ip_address: Optional[str]) -> None:
+        """ip_address=None — сервисы не ответили; запоминается на FAILED_LOOKUP_TTL_S"""
+        with self._lock:
+            self._record["external_ip"] = {"ip": ip_address, "source_ip": source_ip, "resolved_at": time.time()}
+            self._write()
+
+    def lookup_failed_recently(self, source_ip: Optional[str]) -> bool:
+        with self._lock:
+            cached = self._record.get("external_ip") or {}
+        return (not cached.get("ip") and "resolved_at" in cached and cached.get("source_ip") == source_ip
+                and time.time() - cached["resolved_at"] < FAILED_LOOKUP_TTL_S)
+
+    def location(self, ip_address: str) -> Optional[str]:
+        with self._lock:
+            cached = (self._record.get("locations") or {}).get(ip_address) or {}
+        if not cached.get("location") or time.time() - cached.get("resolved_at", 0) >= self.location_ttl_s:
+            return None
+        return cached["location"]
+
+    def set_location(self, ip_address: str, location: str) -> None:
+        with self._lock:
+            # Храним только текущий адрес: старые записи после смены IP не нужны
+            self._record["locations"] = {ip_address: {"location": location, "resolved_at": time.time()}}
+            self._write()
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="external IP and geolocation lookup timing")
+    p.add_argument("--timeout", type=float, default=LOOKUP_TIMEOUT_S)
+    args = p.parse_args()
+    started = time.perf_counter()
+    ip = external_ip(args.timeout)
+    print(f"external ip: {ip} ({(time.perf_counter() - started) * 1000:.0f} ms)")
+    if ip:
+        started = time.perf_counter()
+        print(f"location: {lookup_location(ip, args.timeout)} ({(time.perf_counter() - started) * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
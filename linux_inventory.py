@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import glob
+import json
+import os
+import socket
+import time
+from typing import Dict, Any, Optional, List, Tuple
+
+
+# Блочные устройства, которые lsblk -d не показывает как TYPE=disk
+SKIP_BLOCK_PREFIXES = ("loop", "ram", "zram", "dm-", "md", "sr", "fd", "nbd")
+# Интерфейсы, которые не отправляются на сервер (как в прежнем разборе ip -o link)
+SKIP_IFACE_PREFIXES = ("lo", "virbr", "docker", "veth")
+RTMGRP_LINK = 1  # netlink-группа событий создания/удаления/изменения интерфейсов
+SECTOR_BYTES = 512  # /sys/block/*/size всегда в 512-байтных секторах
+GIB = 1024 ** 3
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _read_int(path: str) -> Optional[int]:
+    value = _read(path)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class LinuxInventory:
+    """Инвентаризация CPU, дисков и сетевых интерфейсов напрямую из /proc и /sys, без подпроцессов.
+    Корни файловых систем задаются параметрами, поэтому разбор проверяется на снятых копиях деревьев (capture_fixture).
+    Форматы результатов совпадают с HardwareAnalyzer.get_cpu_info / get_disk_info / get_network_info.
+    """
+
+    def __init__(self, proc_root: str = "/proc", sysfs_root: str = "/sys"):
+        self.proc_root = proc_root
+        self.sysfs_root = sysfs_root
+
+    # --- CPU ---
+
+    def _cpuinfo_blocks(self) -> List[Dict[str, str]]:
+        text = _read(os.path.join(self.proc_root, "cpuinfo")) or ""
+        blocks = []
+        for chunk in text.split("\n\n"):
+            block = {}
+            for line in chunk.splitlines():
+                key, sep, value = line.partition(":")
+                if sep:
+                    block[key.strip()] = value.strip()
+            if block:
+                blocks.append(block)
+        return blocks
+
+    def _topology(self) -> List[Tuple[str, str]]:
+        """(package_id, core_id) для каждого логического CPU с топологией в sysfs"""
+        topology = []
+        for cpu_dir in glob.glob(os.path.join(self.sysfs_root, "devices/system/cpu/cpu[0-9]*")):
+            package = _read(os.path.join(cpu_dir, "topology", "physical_package_id"))
+            core = _read(os.path.join(cpu_dir, "topology", "core_id"))
+            if package is not None and core is not None:
+                topology.append((package, core))
+        return topology
+
+    def _max_freq_ghz(self, blocks: List[Dict[str, str]]) -> Optional[float]:
+        freqs = [v for v in (_read_int(p) for p in glob.glob(
+            os.path.join(self.sysfs_root, "devices/system/cpu/cpu[0-9]*/cpufreq/cpuinfo_max_freq"))) if v]
+        if freqs:
+            return max(freqs) / 1_000_000  # кГц → ГГц
+        mhz = []
+        for block in blocks:
+            try:
+                mhz.append(float(block.get("cpu MHz", "")))
+            except ValueError:
+                continue
+        return max(mhz) / 1000 if mhz else None
+
+    def cpu_info(self) -> List[Dict[str, Any]]:
+        blocks = [b for b in self._cpuinfo_blocks() if "processor" in b]
+        if not blocks:
+            raise RuntimeError("no processors in cpuinfo")
+
+        model = None
+        for block in blocks:
+            model = block.get("model name") or block.get("Model") or block.get("Hardware")
+            if model:
+                break
+
+        topology = self._topology()
+        if topology:
+            sockets = len({package for package, _ in topology})
+            total_cores = len(set(topology))
+            total_threads = len(topology)
+        else:
+            # Без sysfs-топологии (некоторые контейнеры) — по полям cpuinfo
+            sockets = len({b["physical id"] for b in blocks if "physical id" in b}) or 1
+            cores = {(b.get("physical id", "0"), b["core id"]) for b in blocks if "core id" in b}
+            total_cores = len(cores) or len(blocks)
+            total_threads = len(blocks)
+
+        sockets = max(1, sockets)
+        if total_cores % sockets or total_threads % sockets:
+            sockets = 1
+        freq = self._max_freq_ghz(blocks)
+        return [{
+            "model": model or "Unknown CPU",
+            "cores": total_cores // sockets,
+            "threads": total_threads // sockets,
+            "freq_ghz": round(freq, 2) if freq else None,
+            "count": sockets,
+        }]
+
+    # --- Диски ---
+
+    def disk_info(self) -> List[Dict[str, Any]]:
+        disks = []
+        for block_dir in sorted(glob.glob(os.path.join(self.sysfs_root, "block", "*"))):
+            name = os.path.basename(block_dir)
+            if name.startswith(SKIP_BLOCK_PREFIXES):
+                continue
+            sectors = _read_int(os.path.join(block_dir, "size"))
+            if not sectors:
+                continue
+            size_bytes = sectors * SECTOR_BYTES
+            model = _read(os.path.join(block_dir, "device", "model")) or _read(os.path.join(block_dir, "device", "name"))
+            rotational = _read(os.path.join(block_dir, "queue", "rotational"))
+            disk_type = {"0": "SSD", "1": "HDD"}.get(rotational, "Unknown")
+            disks.append({
+                "name": name,
+                "model": model or "Unknown",
+                "type": disk_type,
+                "size_bytes": size_bytes,
+                "size_gb": round(size_bytes / GIB, 1),
+                "read_speed_mb_s": None,
+                "write_speed_mb_s": None,
+            })
+        return disks
+
+    # --- Сеть ---
+
+    def network_info(self) -> List[Dict[str, Any]]:
+        networks = []
+        net_root = os.path.join(self.sysfs_root, "class", "net")
+        for iface_dir in sorted(glob.glob(os.path.join(net_root, "*"))):
+            name = os.path.basename(iface_dir)
+            if name.startswith(SKIP_IFACE_PREFIXES):
+                continue
+
+            if os.path.exists(os.path.join(iface_dir, "wireless")) or os.path.exists(os.path.join(iface_dir, "phy80211")) \
+                    or name.startswith("wl"):
+                interface_type = "WiFi"
+            elif "eth" in name or "en" in name:
+                interface_type = "Ethernet"
+            else:
+                interface_type = "Unknown"
+
+            # speed = -1 или ошибка чтения у интерфейсов без линка и у виртуальных
+            speed = _read_int(os.path.join(iface_dir, "speed"))
+            if speed is None or speed <= 0:
+                speed = 300 if interface_type == "WiFi" else 1000
+
+            networks.append({
+                "up_mbps": speed,
+                "down_mbps": speed,
+                "ports": name,
+                "type": interface_type,
+            })
+        return networks
+
+
+    # --- Отпечатки для инвалидации кэша ---
+
+    def fingerprint(self, category: str) -> Optional[Tuple]:
+        """Дешёвый отпечаток категории: изменился — нужно пересканировать. None — отпечаток недоступен."""
+        if category == "cpu":
+            return (_read(os.path.join(self.sysfs_root, "devices/system/cpu/online")),)
+        if category == "gpu":
+            # Список PCI-устройств меняется при hot-plug и при выпадении GPU с шины
+            try:
+                pci = tuple(sorted(os.listdir(os.path.join(self.sysfs_root, "bus/pci/devices"))))
+            except OSError:
+                return None
+            try:
+                nvidia = tuple(sorted(os.listdir(os.path.join(self.proc_root, "driver/nvidia/gpus"))))
+            except OSError:
+                nvidia = ()
+            return pci, nvidia
+        if category == "disk":
+            return tuple(
+                (os.path.basename(d), _read(os.path.join(d, "size")))
+                for d in sorted(glob.glob(os.path.join(self.sysfs_root, "block", "*")))
+                if not os.path.basename(d).startswith(SKIP_BLOCK_PREFIXES)
+            )
+        if category == "network":
+            return tuple(
+                (os.path.basename(d), _read(os.path.join(d, "speed")), _read(os.path.join(d, "operstate")))
+                for d in sorted(glob.glob(os.path.join(self.sysfs_root, "class", "net", "*")))
+                if not os.path.basename(d).startswith(SKIP_IFACE_PREFIXES)
+            )
+        if category == "ram":
+            meminfo = _read(os.path.join(self.proc_root, "meminfo")) or ""
+            return (meminfo.split("\n", 1)[0],)  # MemTotal
+        return None
+
+
+class LinkEventSocket:
+    """Netlink-сокет с событиями интерфейсов (RTMGRP_LINK): появление/исчезновение NIC, смена линка.
+    Неблокирующий; fileno() можно ждать через select.
+    """
+
+    def __init__(self):
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        self._sock.bind((0, RTMGRP_LINK))
+        self._sock.setblocking(False)
+
+    def fileno(self) -> int:
+        return self._sock.fileno()
+
+    def drain(self) -> bool:
+        """Вычитывает накопленные события; True, если они были"""
+        got = False
+        while True:
+            try:
+                if not self._sock.recv(65536):
+                    return got
+                got = True
+            except BlockingIOError:
+                return got
+            except OSError:
+                # ENOBUFS: события потеряны при переполнении — считаем, что что-то изменилось
+                return True
+
+    def close(self) -> None:
+        self._sock.close()
+
+
+# Файлы, которые читает LinuxInventory (относительно корней /proc и /sys)
+_PROC_FILES = ("cpuinfo",)
+_SYS_GLOBS = (
+    "devices/system/cpu/cpu[0-9]*/topology/physical_package_id",
+    "devices/system/cpu/cpu[0-9]*/topology/core_id",
+    "devices/system/cpu/cpu[0-9]*/cpufreq/cpuinfo_max_freq",
+    "block/*/size",
+    "block/*/queue/rotational",
+    "block/*/device/model",
+    "block/*/device/name",
+    "block/*/*/partition",  # разделы — подкаталоги диска, в список дисков попадать не должны
+    "block/*/*/size",
+    "class/net/*/speed",
+    "class/net/*/wireless",
+    "class/net/*/phy80211",
+)
+
+
+def capture_fixture(dest: str, proc_root: str = "/proc", sysfs_root: str = "/sys") -> int:
+    """Снимает копию нужных файлов /proc и /sys в dest/{proc,sys} для проверки разбора на других машинах.
+    Возвращает количество скопированных файлов.
+    """
+    copied = 0
+    targets = [(os.path.join(proc_root, f), os.path.join(dest, "proc", f)) for f in _PROC_FILES]
+    for pattern in _SYS_GLOBS:
+        for src in glob.glob(os.path.join(sysfs_root, pattern)):
+            targets.append((src, os.path.join(dest, "sys", os.path.relpath(src, sysfs_root))))
+    for src, dst in targets:
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        if os.path.isdir(src):
+            os.makedirs(dst, exist_ok=True)
+            copied += 1
+            continue
+        content = _read(src)
+        if content is None:
+            # speed у интерфейсов без линка читается с ошибкой — сохраняем как -1
+            if os.path.basename(src) != "speed":
+                continue
+            content = "-1"
+        with open(dst, "w") as f:
+            f.write(content + "\n")
+        copied += 1
+    return copied
+
+
+def _bench(iterations: int) -> None:
+    from command_runner import RUNNER
+    from hardware_analyzer import HardwareAnalyzer
+
+    inventory = LinuxInventory()
+    for name in ("cpu_info", "disk_info", "network_info"):
+        method = getattr(inventory, name)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            method()
+        print(f"sysfs {name}: avg {(time.perf_counter() - started) / iterations * 1000:.3f} ms")
+
+    analyzer = HardwareAnalyzer(use_sysfs=False)
+    for name in ("get_cpu_info", "get_disk_info", "get_network_info"):
+        method = getattr(analyzer, name)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            analyzer.clear_cache()
+            RUNNER.clear_cache()
+            method()
+        print(f"subprocess {name}: avg {(time.perf_counter() - started) / iterations * 1000:.3f} ms")
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Linux /proc и /sys инвентаризация")
+    p.add_argument("--proc-root", default="/proc")
+    p.add_argument("--sys-root", default="/sys")
+    p.add_argument("--capture", metavar="DIR", help="снять копию нужных файлов в DIR/{proc,sys}")
+    p.add_argument("--bench", action="store_true", help="сравнить с путём через lscpu/lsblk/ip")
+    p.add_argument("--iterations", type=int, default=20)
+    args = p.parse_args()
+
+    if args.capture:
+        count = capture_fixture(args.capture, args.proc_root, args.sys_root)
+        print(f"[INFO] Captured {count} files into {args.capture}")
+    elif args.bench:
+        _bench(args.iterations)
+    else:
+        inventory = LinuxInventory(args.proc_root, args.sys_root)
+        print(json.dumps({
+            "cpus": inventory.cpu_info(),
+            "disks": inventory.disk_info(),
+            "networks": inventory.network_info(),
+        }, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
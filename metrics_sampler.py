@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import math
+import subprocess
+import threading
+import time
+from array import array
+from typing import Dict, Any, Optional, List, Callable, Set
+
+import psutil
+
+from network_monitor import NetworkRateTracker
+from thermal import query_gpus
+
+
+class RingBuffer:
+    """Кольцевой буфер фиксированной ёмкости для пар (timestamp, value).
+    Память выделяется один раз при создании, запись не делает аллокаций.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, int(capacity))
+        self._ts = array('d', bytes(8 * self.capacity))
+        self._values = array('d', bytes(8 * self.capacity))
+        self._pos = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def append(self, ts: float, value: float) -> None:
+        self._ts[self._pos] = ts
+        self._values[self._pos] = value
+        self._pos = (self._pos + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def latest(self) -> Optional[float]:
+        if not self._size:
+            return None
+        return self._values[(self._pos - 1) % self.capacity]
+
+    def values_since(self, since: float) -> List[float]:
+        """Значения с timestamp >= since (от новых к старым)"""
+        out = []
+        idx = self._pos
+        for _ in range(self._size):
+            idx = (idx - 1) % self.capacity
+            if self._ts[idx] < since:
+                break
+            out.append(self._values[idx])
+        return out
+
+
+def aggregate(values: List[float]) -> Optional[Dict[str, float]]:
+    """min/avg/p95/max по списку значений (p95 — nearest-rank)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    n = len(ordered)
+    p95 = ordered[max(0, math.ceil(0.95 * n) - 1)]
+    return {
+        "min": round(ordered[0], 2),
+        "avg": round(sum(ordered) / n, 2),
+        "p95": round(p95, 2),
+        "max": round(ordered[-1], 2),
+        "samples": n,
+    }
+
+
+class MetricsSampler:
+    """Фоновый сэмплер метрик хоста (CPU, RAM, GPU, диск, сеть) в кольцевые буферы"""
+
+    def __init__(self, interval_s: float = 1.0, history_s: float = 360.0, gpu_interval_s: float = 5.0, net_tracker: Optional[NetworkRateTracker] = None,
+                 event_callback: Optional[Callable[[str], None]] = None, disk_full_percent: float = 95.0,
+                 container_index=None, container_check_interval_s: float = 5.0, thermal_monitor=None):
+        self.interval_s = max(0.1, float(interval_s))
+        self.gpu_interval_s = max(self.interval_s, float(gpu_interval_s))
+        self.capacity = int(math.ceil(history_s / self.interval_s)) + 1
+        self._buffers: Dict[str, RingBuffer] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.net_tracker = net_tracker or NetworkRateTracker()
+        self._last_disk = None  # (ts, read_bytes, write_bytes)
+        self._last_gpu_ts = 0.0
+        self._gpu_available = True
+        self._gpu_count_max = 0
+        self.gpu_names: Dict[str, str] = {}  # gpu<index> → имя из nvidia-smi, по последнему опросу
+
+        # Важные события (edge-triggered): диск заполнен, ошибка GPU, выход контейнера
+        self.event_callback = event_callback
+        self.disk_full_percent = disk_full_percent
+        self.container_index = container_index
+        self.container_check_interval_s = container_check_interval_s
+        self._active_alerts: Set[str] = set()
+        self._known_containers: Optional[Set[str]] = None
+        self._last_container_check = 0.0
+        self.thermal_monitor = thermal_monitor
+
+        # Статистика стоимости самого сэмплирования
+        self.sample_count = 0
+        self.sample_time_total_s = 0.0
+        self.sample_time_max_s = 0.0
+
+    def _record(self, name: str, ts: float, value: float) -> None:
+        buf = self._buffers.get(name)
+        if buf is None:
+            buf = RingBuffer(self.capacity)
+            self._buffers[name] = buf
+        buf.append(ts, value)
+
+    def _sample_gpu(self) -> Dict[str, float]:
+        """Загрузка GPU по индексам; тот же запуск nvidia-smi отдаёт ThermalMonitor температуры и троттлинг"""
+        usage = {}
+        if not self._gpu_available:
+            return usage
+        try:
+            gpus = query_gpus()
+            if self.thermal_monitor is not None:
+                self.thermal_monitor.update_gpus(gpus)
+            self.gpu_names = {f"gpu{index}": gpu["name"] for index, gpu in gpus.items()}
+            for index, gpu in gpus.items():
+                if gpu["utilization"] is not None:
+                    usage[f"gpu{index}"] = gpu["utilization"]
+            # GPU пропал с шины — число устройств меньше, чем видели раньше
+            self._gpu_count_max = max(self._gpu_count_max, len(gpus))
+            self._set_alert("gpu_error", len(gpus) < self._gpu_count_max)
+        except FileNotFoundError:
+            # nvidia-smi нет — больше не пытаемся
+            self._gpu_available = False
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+            # Зависший nvidia-smi — тоже признак сбоя GPU
+            self._set_alert("gpu_error", True)
+        except Exception:
+            pass
+        return usage
+
+    def _emit(self, reason: str) -> None:
+        if self.event_callback is None:
+            return
+        try:
+            self.event_callback(reason)
+        except Exception as e:
+            print(f"[WARNING] Event callback failed: {e}")
+
+    def _set_alert(self, key: str, active: bool) -> None:
+        """Сообщает о событии только при переходе в активное состояние"""
+        if active and key not in self._active_alerts:
+            self._active_alerts.add(key)
+            self._emit(key)
+        elif not active:
+            self._active_alerts.discard(key)
+
+    def _check_containers(self, ts: float) -> None:
+        if self.container_index is None or ts - self._last_container_check < self.container_check_interval_s:
+            return
+        self._last_container_check = ts
+        try:
+            names = {info["name"] for info in self.container_index.containers().values()}
+        except Exception:
+            return
+        if self._known_containers is not None:
+            for name in sorted(self._known_containers - names):
+                self._emit(f"container_exit:{name}")
+        self._known_containers = names
+
+    def sample_once(self) -> Dict[str, float]:
+        """Снимает один срез метрик и записывает его в буферы"""
+        started = time.perf_counter()
+        ts = time.monotonic()
+        sample = {}
+
+        try:
+            sample["cpu_usage"] = psutil.cpu_percent()
+        except Exception:
+            pass
+        try:
+            sample["memory_usage"] = psutil.virtual_memory().percent
+        except Exception:
+            pass
+        try:
+            sample["disk_usage"] = psutil.disk_usage('/').percent
+        except Exception:
+            pass
+
+        try:
+            io = psutil.disk_io_counters()
+            if io is not None:
+                if self._last_disk is not None:
+                    dt = ts - self._last_disk[0]
+                    if dt > 0:
+                        sample["disk_read_mb_s"] = max(0, io.read_bytes - self._last_disk[1]) / dt / (1024 * 1024)
+                        sample["disk_write_mb_s"] = max(0, io.write_bytes - self._last_disk[2]) / dt / (1024 * 1024)
+                self._last_disk = (ts, io.read_bytes, io.write_bytes)
+        except Exception:
+            pass
+
+        try:
+            # Только физические интерфейсы: docker0/veth/lo не должны раздувать трафик хоста
+            net = self.net_tracker.sample()
+            sample["net_up_mbps"] = net["up_mbps"]
+            sample["net_down_mbps"] = net["down_mbps"]
+        except Exception:
+            pass
+
+        # nvidia-smi дорогой — опрашиваем реже основного интервала
+        if ts - self._last_gpu_ts >= self.gpu_interval_s:
+            self._last_gpu_ts = ts
+            sample.update(self._sample_gpu())
+
+        if self.thermal_monitor is not None:
+            try:
+                self.thermal_monitor.sample(poll_gpus=False)
+                cpu_temperature = self.thermal_monitor.cpu_temperature()
+                if cpu_temperature is not None:
+                    sample["cpu_temperature"] = cpu_temperature
+                for index, gpu in self.thermal_monitor.gpus.items():
+                    if gpu.get("temperature") is not None:
+                        sample[f"gpu{index}_temperature"] = gpu["temperature"]
+                self._set_alert("thermal_throttling", self.thermal_monitor.is_throttling())
+            except Exception:
+                pass
+
+        with self._lock:
+            for name, value in sample.items():
+                self._record(name, ts, value)
+
+        if "disk_usage" in sample:
+            self._set_alert("disk_nearly_full", sample["disk_usage"] >= self.disk_full_percent)
+        self._check_containers(ts)
+
+        elapsed = time.perf_counter() - started
+        self.sample_count += 1
+        self.sample_time_total_s += elapsed
+        self.sample_time_max_s = max(self.sample_time_max_s, elapsed)
+        return sample
+
+    def _loop(self) -> None:
+        next_tick = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.sample_once()
+            except Exception as e:
+                print(f"[WARNING] Metrics sampling error: {e}")
+            next_tick += self.interval_s
+            wait = next_tick - time.monotonic()
+            if wait < 0:
+                # Отстали (долгий сэмпл) — не пытаемся догонять пачкой
+                next_tick = time.monotonic()
+                wait = 0
+            self._stop_event.wait(wait)
+
+    def start(self) -> threading.Thread:
+        """Запускает поток сэмплирования"""
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+        self._stop_event.clear()
+        # Первый вызов cpu_percent() без интервала всегда 0 — прогреваем
+        psutil.cpu_percent()
+        self._thread = threading.Thread(target=self._loop, name="metrics-sampler", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval_s * 2 + 5)
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def latest(self, name: str) -> Optional[float]:
+        with self._lock:
+            buf = self._buffers.get(name)
+            return buf.latest() if buf is not None else None
+
+    def cpu_usage(self) -> float:
+        """Загрузка CPU из буфера сэмплера.
+
+        psutil.cpu_percent() без интервала считает от предыдущего вызова, поэтому его вызывает только
+        сэмплер; пока буфер пуст, меряем отдельным коротким окном, не завязанным на чужой замер.
+        """
+        value = self.latest("cpu_usage")
+        if value is not None:
+            return value
+        return psutil.cpu_percent(interval=0.1)
+
+    def latest_all(self) -> Dict[str, float]:
+        """Последние значения всех метрик"""
+        with self._lock:
+            return {name: buf.latest() for name, buf in self._buffers.items() if len(buf)}
+
+    def average(self, name: str, window_s: float) -> Optional[float]:
+        """Среднее одной метрики за последние window_s секунд без сортировки и копирования всех буферов"""
+        since = time.monotonic() - window_s
+        with self._lock:
+            buf = self._buffers.get(name)
+            values = buf.values_since(since) if buf is not None else []
+        return sum(values) / len(values) if values else None
+
+    def summary(self, window_s: float) -> Dict[str, Dict[str, float]]:
+        """min/avg/p95/max по каждой метрике за последние window_s секунд"""
+        since = time.monotonic() - window_s
+        with self._lock:
+            snapshot = {name: buf.values_since(since) for name, buf in self._buffers.items()}
+        result = {}
+        for name, values in snapshot.items():
+            stats = aggregate(values)
+            if stats is not None:
+                result[name] = stats
+        return result
+
+    def memory_bytes(self) -> int:
+        """Объём памяти, занятый буферами"""
+        with self._lock:
+            return sum(buf._ts.itemsize * buf.capacity * 2 for buf in self._buffers.values())
+
+
+def _bench(iterations: int) -> None:
+    sampler = MetricsSampler(interval_s=1.0, gpu_interval_s=1.0)
+    psutil.cpu_percent()
+    for _ in range(iterations):
+        sampler.sample_once()
+    avg_ms = sampler.sample_time_total_s / max(1, sampler.sample_count) * 1000
+    print(f"sample_once: {sampler.sample_count} samples, avg {avg_ms:.3f} ms, max {sampler.sample_time_max_s * 1000:.3f} ms")
+
+    # Заполняем буферы полностью и меряем агрегацию за окно heartbeat
+    now = time.monotonic()
+    for name in ("cpu_usage", "memory_usage", "disk_usage", "net_up_mbps", "net_down_mbps"):
+        for i in range(sampler.capacity):
+            sampler._record(name, now - sampler.capacity + i, float(i % 100))
+    started = time.perf_counter()
+    sampler.summary(300)
+    print(f"summary(300s): {(time.perf_counter() - started) * 1000:.3f} ms over {len(sampler._buffers)} metrics")
+    print(f"buffers memory: {sampler.memory_bytes()} bytes (capacity {sampler.capacity} per metric)")
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="metrics sampler benchmark")
+    p.add_argument("--iterations", type=int, default=200, help="количество сэмплов")
+    args = p.parse_args()
+    _bench(args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, List
+
+import wire_codec
+
+
+class MockBackend:
+    """Локальная замена backend для проверки и замеров: confirm, init, pull, status, heartbeat, logs, sync.
+    batch=True — pull отдаёт до max_tasks задач в {"tasks": [...]}, иначе одну задачу в прежнем формате.
+    sync=False — сервер без режима sync (404 на /sync).
+    idle_timeout_s — закрывать соединение после стольких секунд простоя (как keepalive_timeout у nginx).
+    encodings — типы тел, объявляемые в Accept-Post (например ["application/msgpack; schema=1"]);
+    на бинарный запрос сервер отвечает той же кодировкой, на неизвестный тип — 415.
+    Считает запросы по endpoint и хранит полученные статусы, heartbeat и логи.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, batch: bool = True, latency_s: float = 0.0,
+                 sync: bool = True, idle_timeout_s: Optional[float] = None, encodings: Optional[List[str]] = None):
+        self.host = host
+        self.port = port
+        self.batch = batch
+        self.latency_s = latency_s
+        self.sync = sync
+        self.idle_timeout_s = idle_timeout_s
+        self.encodings = list(encodings or [])
+        self.content_types: Dict[str, int] = defaultdict(int)  # полученные тела по Content-Type
+        self.agent_id = "mock-agent"
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.heartbeats: List[Dict[str, Any]] = []
+        self.logs: List[str] = []
+        self.monitoring: Dict[str, Any] = {}  # состояние, собранное из изменений в sync
+        self.directives: List[Dict[str, Any]] = []  # уйдут в ответе ближайшего sync
+        self._tasks: deque = deque()
+        self._lock = threading.Lock()
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    def add_tasks(self, tasks: List[Dict[str, Any]]) -> None:
+        """tasks — записи в формате pull: {"task_id", "task_data", "container_info"}"""
+        with self._lock:
+            self._tasks.extend(tasks)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._tasks)
+
+    def _take(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [self._tasks.popleft() for _ in range(min(limit, len(self._tasks)))]
+
+    def add_directive(self, directive: Dict[str, Any]) -> None:
+        with self._lock:
+            self.directives.append(directive)
+
+    def _sync(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            for status in body.get("statuses") or []:
+                self.statuses[str(status.get("task_id"))].append(status)
+            self.logs.extend(entry.get("message", "") for entry in body.get("logs") or [])
+            if "monitoring" in body:
+                if body.get("monitoring_full"):
+                    self.monitoring = {}
+                self.monitoring.update(body["monitoring"])
+                self.heartbeats.append(dict(self.monitoring))
+            directives, self.directives = self.directives, []
+        tasks = self._take(max(1, int(body.get("max_tasks") or 1)))
+        return {"exception": 0, "data": {"tasks": tasks, "directives": directives, "has_more": self.pending() > 0}}
+
+    def handle(self, endpoint: str, path: str, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Ответ на запрос endpoint (None — 404); подклассы добавляют свои endpoint"""
+        if endpoint == "confirm":
+            return {"exception": 0, "data": {"agent_id": self.agent_id}}
+        if endpoint == "pull":
+            if self.batch:
+                tasks = self._take(max(1, int(body.get("max_tasks") or 1)))
+                return {"exception": 0, "data": {"tasks": tasks, "has_more": self.pending() > 0}}
+            tasks = self._take(1)
+            return {"exception": 0, "data": tasks[0] if tasks else {"task_id": None, "message": "No tasks"}}
+        if endpoint == "status":
+            task_id = path.rstrip("/").split("/")[-2]
+            with self._lock:
+                self.statuses[task_id].append(body)
+        elif endpoint == "heartbeat":
+            with self._lock:
+                self.heartbeats.append(body)
+        elif endpoint == "logs":
+            with self._lock:
+                self.logs.append(body.get("message", ""))
+        elif endpoint == "sync":
+            return self._sync(body) if self.sync else None
+        return {"exception": 0, "data": {}}
+
+    @staticmethod
+    def endpoint_of(path: str) -> str:
+        if path.endswith("/confirm"):
+            return "confirm"
+        match = re.search(r"/v1/agents/[^/]+/(tasks/pull|tasks/[^/]+/status|[a-z_]+)$", path)
+        if not match:
+            return "unknown"
+        name = match.group(1)
+        return "pull" if name == "tasks/pull" else "status" if name.endswith("/status") else name
+
+    def _make_handler(self):
+        backend = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # заголовки и тело уходят разными write
+            timeout = backend.idle_timeout_s
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(length) if length else b""
+                content_type = (self.headers.get("Content-Type") or wire_codec.JSON).split(";")[0].strip()
+                path = self.path.split("?")[0]
+                endpoint = backend.endpoint_of(path)
+                with backend._lock:
+                    backend.requests[endpoint] += 1
+                    backend.content_types[content_type] += 1
+                accepted = [t.split(";")[0].strip() for t in backend.encodings]
+                if content_type != wire_codec.JSON and content_type not in accepted:
+                    self.send_error(415)
+                    return
+                try:
+                    body = wire_codec.decode(raw, content_type) if raw else {}
+                except ValueError:
+                    body = {}
+                if backend.latency_s:
+                    time.sleep(backend.latency_s)
+                result = backend.handle(endpoint, path, body) if endpoint != "unknown" else None
+                if result is None:
+                    self.send_error(404)
+                    return
+                if content_type == wire_codec.JSON:
+                    payload = json.dumps(result).encode()
+                else:
+                    payload = wire_codec.encode(result, content_type)
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                if backend.encodings:
+                    self.send_header("Accept-Post", ", ".join(backend.encodings + [wire_codec.JSON]))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> str:
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name="mock-backend", daemon=True).start()
+        return f"http://{self.host}:{self.port}"
+
+    def stop(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+
+def make_task(task_id: int) -> Dict[str, Any]:
+    return {
+        "task_id": task_id,
+        "task_data": {"operation": "start", "docker_image": "ubuntu:22.04", "gpu_required": 0},
+        "container_info": {"ssh_username": "root", "ssh_password": "secret", "ssh_port": 42000 + task_id % 1000,
+                           "ssh_host": "203.0.113.10"},
+    }
+
+
+def _time_to_dispatch(burst: int, batch: bool, poll_interval_s: float, batch_size: int) -> Dict[str, Any]:
+    import contextlib
+    import io
+    from api_client import APIClient
+
+    backend = MockBackend(batch=batch)
+    url = backend.start()
+    client = APIClient(base_url=url, agent_id=backend.agent_id, secret_key="mock-secret")
+    client.poll_interval_s = poll_interval_s
+    client.pull_batch_size = batch_size
+    dispatched = []
+    all_done = threading.Event()
+
+    def dispatch(task, poll_started_us, poll_dur_us):
+        dispatched.append(time.perf_counter())
+        if len(dispatched) >= burst:
+            all_done.set()
+
+    backend.add_tasks([make_task(i) for i in range(burst)])
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        thread = threading.Thread(target=client.poll_for_tasks, args=(None, dispatch), daemon=True)
+        thread.start()
+        all_done.wait(timeout=max(60.0, burst * poll_interval_s * 2))
+        client.close()
+        thread.join(timeout=poll_interval_s + 5)
+    backend.stop()
+    elapsed = (dispatched[-1] - started) if dispatched else float("nan")
+    return {"dispatched": len(dispatched), "seconds": elapsed, "pulls": backend.requests["pull"]}
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="mock backend / batch pull time-to-dispatch benchmark")
+    p.add_argument("--serve", action="store_true", help="только запустить mock backend")
+    p.add_argument("--port", type=int, default=0)
+    p.add_argument("--single", action="store_true", help="pull в прежнем формате (одна задача)")
+    p.add_argument("--bursts", default="1,10,100")
+    p.add_argument("--poll-interval", type=float, default=10.0)
+    p.add_argument("--batch-size", type=int, default=20)
+    args = p.parse_args()
+
+    if args.serve:
+        backend = MockBackend(port=args.port, batch=not args.single)
+        print(f"[INFO] Mock backend listening on {backend.start()}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            backend.stop()
+        return
+
+    print(f"poll interval {args.poll_interval}s, batch size {args.batch_size}")
+    print(f"{'burst':>6} {'mode':>8} {'pulls':>6} {'dispatch, s':>12} {'sleep-after-each-task, s':>25}")
+    for burst in (int(b) for b in args.bursts.split(",")):
+        for batch in (False, True):
+            result = _time_to_dispatch(burst, batch, args.poll_interval, args.batch_size)
+            # Прежний клиент засыпал на poll_interval после каждой задачи
+            legacy = (burst - 1) * args.poll_interval
+            print(f"{burst:>6} {'batch' if batch else 'single':>8} {result['pulls']:>6} {result['seconds']:>12.3f} {legacy:>25.0f}")
+
+
+if __name__ == "__main__":
+    main()
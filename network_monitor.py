@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+from typing import Dict, Any, Optional
+
+import psutil
+
+
+# Префиксы виртуальных интерфейсов для систем без sysfs
+VIRTUAL_IFACE_PREFIXES = ("lo", "docker", "br-", "virbr", "veth", "tun", "tap", "vxlan", "flannel", "cni", "cali", "ifb", "dummy")
+CONTAINER_IFACE_PREFIXES = ("veth",)
+
+
+def _mbps(delta_bytes: int, dt: float) -> float:
+    return round(max(0, delta_bytes) * 8 / dt / 1_000_000, 3)
+
+
+class NetworkRateTracker:
+    """Неблокирующий подсчёт скорости сети по интерфейсам.
+    Скорость считается по разнице счётчиков с предыдущим сэмплом, без sleep.
+    """
+
+    def __init__(self, sysfs_net: str = "/sys/class/net", min_interval_s: float = 0.2):
+        self.sysfs_net = sysfs_net
+        self.min_interval_s = min_interval_s
+        self._lock = threading.Lock()
+        self._kinds: Dict[str, str] = {}
+        self._prev_ts: Optional[float] = None
+        self._prev: Dict[str, Any] = {}
+        self._last_result: Dict[str, Any] = self._empty()
+
+    @staticmethod
+    def _empty() -> Dict[str, Any]:
+        return {"up_mbps": 0.0, "down_mbps": 0.0, "physical": {}, "virtual": {}, "containers": {}}
+
+    def classify(self, iface: str) -> str:
+        """physical | virtual | container (veth-пара контейнера)"""
+        kind = self._kinds.get(iface)
+        if kind is not None:
+            return kind
+        if iface.startswith(CONTAINER_IFACE_PREFIXES):
+            kind = "container"
+        elif os.path.isdir(self.sysfs_net):
+            # У физических NIC есть ссылка на устройство шины
+            kind = "physical" if os.path.exists(os.path.join(self.sysfs_net, iface, "device")) else "virtual"
+        else:
+            kind = "virtual" if iface.startswith(VIRTUAL_IFACE_PREFIXES) else "physical"
+        self._kinds[iface] = kind
+        return kind
+
+    def sample(self) -> Dict[str, Any]:
+        """Возвращает rx/tx (Мбит/с) по интерфейсам с момента предыдущего сэмпла.
+        Первый вызов возвращает нули: для скорости нужна пара замеров.
+        """
+        with self._lock:
+            ts = time.monotonic()
+            if self._prev_ts is not None and ts - self._prev_ts < self.min_interval_s:
+                return self._last_result
+
+            counters = psutil.net_io_counters(pernic=True)
+            result = self._empty()
+            dt = ts - self._prev_ts if self._prev_ts is not None else 0.0
+
+            for iface, stats in counters.items():
+                prev = self._prev.get(iface)
+                if prev is None or dt <= 0:
+                    rx_mbps = tx_mbps = 0.0
+                else:
+                    # Счётчик меньше прежнего — интерфейс пересоздан, скорость не считаем
+                    rx_mbps = _mbps(stats.bytes_recv - prev.bytes_recv, dt) if stats.bytes_recv >= prev.bytes_recv else 0.0
+                    tx_mbps = _mbps(stats.bytes_sent - prev.bytes_sent, dt) if stats.bytes_sent >= prev.bytes_sent else 0.0
+
+                kind = self.classify(iface)
+                bucket = {"physical": "physical", "virtual": "virtual", "container": "containers"}[kind]
+                result[bucket][iface] = {"rx_mbps": rx_mbps, "tx_mbps": tx_mbps}
+                if kind == "physical":
+                    result["down_mbps"] += rx_mbps
+                    result["up_mbps"] += tx_mbps
+
+            result["down_mbps"] = round(result["down_mbps"], 3)
+            result["up_mbps"] = round(result["up_mbps"], 3)
+
+            # Исчезнувшие интерфейсы не держим в кэше классификации
+            for iface in list(self._kinds):
+                if iface not in counters:
+                    del self._kinds[iface]
+
+            self._prev = counters
+            self._prev_ts = ts
+            self._last_result = result
+            return result
+
+    def last(self) -> Dict[str, Any]:
+        """Последний посчитанный результат без нового замера"""
+        with self._lock:
+            return self._last_result
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, Iterator
+from urllib.parse import urlsplit
+
+import psutil
+import requests
+
+
+CHUNK = 64 * 1024
+
+
+class NetworkSelfTest:
+    """Ограниченный замер канала до endpoint: RTT (TCP connect), скорость скачивания и загрузки.
+    Протокол endpoint: GET /download?bytes=N отдаёт N байт, POST /upload принимает тело и отвечает
+    {"bytes": N}. Каждое направление — не больше max_bytes и max_duration_s.
+    """
+
+    def __init__(self, url: str, max_bytes: int = 25 * 1024 * 1024, max_duration_s: float = 5.0,
+                 rtt_probes: int = 5, timeout_s: float = 10.0):
+        self.url = url.rstrip("/")
+        self.max_bytes = max_bytes
+        self.max_duration_s = max_duration_s
+        self.rtt_probes = rtt_probes
+        self.timeout_s = timeout_s
+        parts = urlsplit(self.url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+
+    def measure_rtt_ms(self) -> Optional[float]:
+        """Медиана времени установки TCP-соединения"""
+        samples = []
+        for _ in range(self.rtt_probes):
+            started = time.perf_counter()
+            try:
+                with socket.create_connection((self.host, self.port), timeout=self.timeout_s):
+                    samples.append((time.perf_counter() - started) * 1000)
+            except OSError:
+                continue
+        return round(statistics.median(samples), 2) if samples else None
+
+    def measure_download_mbps(self, session: requests.Session) -> float:
+        received = 0
+        started = time.perf_counter()
+        with session.get(f"{self.url}/download", params={"bytes": self.max_bytes}, stream=True, timeout=self.timeout_s) as resp:
+            resp.raise_for_status()
+            for chunk in resp.iter_content(CHUNK):
+                received += len(chunk)
+                if received >= self.max_bytes or time.perf_counter() - started >= self.max_duration_s:
+                    break
+        return round(received * 8 / 1_000_000 / max(1e-6, time.perf_counter() - started), 2)
+
+    def _upload_body(self, counter: Dict[str, int], deadline: float) -> Iterator[bytes]:
+        payload = os.urandom(CHUNK)
+        while counter["sent"] < self.max_bytes and time.perf_counter() < deadline:
+            counter["sent"] += CHUNK
+            yield payload
+
+    def measure_upload_mbps(self, session: requests.Session) -> float:
+        counter = {"sent": 0}
+        started = time.perf_counter()
+        resp = session.post(f"{self.url}/upload", data=self._upload_body(counter, started + self.max_duration_s),
+                            timeout=self.timeout_s)
+        resp.raise_for_status()
+        elapsed = time.perf_counter() - started
+        try:
+            received = int(resp.json().get("bytes", counter["sent"]))
+        except ValueError:
+            received = counter["sent"]
+        return round(received * 8 / 1_000_000 / max(1e-6, elapsed), 2)
+
+    def run(self) -> Dict[str, Any]:
+        with requests.Session() as session:
+            rtt_ms = self.measure_rtt_ms()
+            down = self.measure_download_mbps(session)
+            up = self.measure_upload_mbps(session)
+        return {
+            "endpoint": self.url,
+            "interface": interface_for_destination(self.host, self.port),
+            "rtt_ms": rtt_ms,
+            "measured_down_mbps": down,
+            "measured_up_mbps": up,
+            "measured_at": int(time.time()),
+        }
+
+
+def interface_for_destination(host: str, port: int = 80) -> Optional[str]:
+    """Интерфейс, через который уходит трафик к host (по адресу источника)"""
+    try:
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        with socket.socket(family, socket.SOCK_DGRAM) as s:
+            s.connect((host, port))
+            source = s.getsockname()[0]
+    except OSError:
+        return None
+    for iface, addrs in psutil.net_if_addrs().items():
+        if any(a.address.split("%")[0] == source for a in addrs):
+            return iface
+    return None
+
+
+class SelfTestServer:
+    """Локальная замена endpoint для проверки и отладки (тот же протокол /download, /upload)"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    @staticmethod
+    def _make_handler():
+        payload = os.urandom(CHUNK)
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                path, _, query = self.path.partition("?")
+                params = dict(p.split("=", 1) for p in query.split("&") if "=" in p)
+                if path != "/download":
+                    self.send_error(404)
+                    return
+                total = int(params.get("bytes", CHUNK))
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(total))
+                self.end_headers()
+                sent = 0
+                try:
+                    while sent < total:
+                        n = min(CHUNK, total - sent)
+                        self.wfile.write(payload[:n])
+                        sent += n
+                except (BrokenPipeError, ConnectionResetError):
+                    # Клиент прекратил скачивание по лимиту времени
+                    self.close_connection = True
+
+            def do_POST(self):
+                if self.path != "/upload":
+                    self.send_error(404)
+                    return
+                received = 0
+                if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                    while True:
+                        size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                        if size == 0:
+                            self.rfile.readline()
+                            break
+                        received += len(self.rfile.read(size))
+                        self.rfile.readline()
+                else:
+                    remaining = int(self.headers.get("Content-Length", 0))
+                    while remaining > 0:
+                        chunk = self.rfile.read(min(CHUNK, remaining))
+                        if not chunk:
+                            break
+                        received += len(chunk)
+                        remaining -= len(chunk)
+                body = json.dumps({"bytes": received}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> str:
+        self._httpd = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name="selftest-server", daemon=True).start()
+        return f"http://{self.host}:{self.port}"
+
+    def stop(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="network link self-test")
+    p.add_argument("--url", default=None, help="endpoint самопроверки; без него поднимается локальный сервер")
+    p.add_argument("--serve", action="store_true", help="только запустить сервер самопроверки")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=0)
+    p.add_argument("--max-mb", type=int, default=25)
+    p.add_argument("--max-duration", type=float, default=5.0)
+    args = p.parse_args()
+
+    server = None
+    url = args.url
+    if args.serve or not url:
+        server = SelfTestServer(args.host, args.port)
+        url = server.start()
+        print(f"[INFO] Self-test server listening on {url}")
+    try:
+        if args.serve:
+            while True:
+                time.sleep(3600)
+        result = NetworkSelfTest(url, max_bytes=args.max_mb * 1024 * 1024, max_duration_s=args.max_duration).run()
+        print(json.dumps(result, indent=2))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Any, Optional, Tuple
+
+
+class SamplingProfiler:
+    """Сэмплирующий профайлер всех потоков процесса по запросу.
+    В выключенном состоянии ничего не делает: поток сэмплирования живёт только во время профилирования.
+    Результат — collapsed stacks (для flamegraph.pl / speedscope) и сводка по функциям.
+    """
+
+    def __init__(self, output_dir: str = "profiles", interval_s: float = 0.01, default_duration_s: float = 30.0):
+        self.output_dir = output_dir
+        self.interval_s = interval_s
+        self.default_duration_s = default_duration_s
+        self._lock = threading.Lock()
+        self._running = False
+
+    @staticmethod
+    def _frame_label(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self, stacks: Counter, self_ident: int) -> None:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self_ident:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(self._frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(ident, f"thread-{ident}"))
+            stacks[tuple(reversed(labels))] += 1
+
+    def profile(self, duration_s: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Профилирует процесс duration_s секунд (блокирует вызывающий поток).
+        Возвращает пути к файлам и сводку или None, если профилирование уже идёт.
+        """
+        with self._lock:
+            if self._running:
+                return None
+            self._running = True
+        try:
+            duration_s = duration_s or self.default_duration_s
+            stacks: Counter = Counter()
+            self_ident = threading.get_ident()
+            samples = 0
+            deadline = time.monotonic() + duration_s
+            while time.monotonic() < deadline:
+                self._sample(stacks, self_ident)
+                samples += 1
+                time.sleep(self.interval_s)
+            return self._write(stacks, samples, duration_s)
+        finally:
+            with self._lock:
+                self._running = False
+
+    def start_background(self, duration_s: Optional[float] = None) -> bool:
+        """Запускает профилирование в отдельном потоке"""
+        if self._running:
+            return False
+        thread = threading.Thread(target=self._profile_and_report, args=(duration_s,), name="profiler", daemon=True)
+        thread.start()
+        return True
+
+    def _profile_and_report(self, duration_s: Optional[float]) -> None:
+        try:
+            result = self.profile(duration_s)
+            if result:
+                print(f"[INFO] Profile written: {result['collapsed_path']}, {result['summary_path']}")
+        except Exception as e:
+            print(f"[WARNING] Profiling failed: {e}")
+
+    @staticmethod
+    def summarize(stacks: Counter, top: int = 30) -> Tuple[Counter, Counter]:
+        """Сэмплы по функциям: собственные (верх стека) и включающие"""
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        for stack, count in stacks.items():
+            frames = stack[1:]  # без имени потока
+            if frames:
+                self_counts[frames[-1]] += count
+            for label in set(frames):
+                total_counts[label] += count
+        return self_counts, total_counts
+
+    def _write(self, stacks: Counter, samples: int, duration_s: float) -> Dict[str, Any]:
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        collapsed_path = os.path.join(self.output_dir, f"profile-{stamp}.collapsed")
+        summary_path = os.path.join(self.output_dir, f"profile-{stamp}.txt")
+
+        with open(collapsed_path, "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(";".join(s.replace(";", ":") for s in stack) + f" {count}\n")
+
+        self_counts, total_counts = self.summarize(stacks)
+        total = sum(stacks.values()) or 1
+        lines = [f"# {samples} sampling rounds over {duration_s:.1f}s, {total} thread samples", "",
+                 f"{'self%':>7} {'total%':>7}  function"]
+        for label, count in self_counts.most_common(30):
+            lines.append(f"{count * 100 / total:7.2f} {total_counts[label] * 100 / total:7.2f}  {label}")
+        summary = "\n".join(lines) + "\n"
+        with open(summary_path, "w") as f:
+            f.write(summary)
+
+        return {"collapsed_path": collapsed_path, "summary_path": summary_path, "summary": summary, "samples": samples}
+
+    def install_signal_handler(self, signum: int = getattr(signal, "SIGUSR2", 0)) -> bool:
+        """kill -USR2 <pid> запускает профилирование на default_duration_s. Только из главного потока."""
+        if not signum:
+            return False
+        try:
+            signal.signal(signum, lambda *_: self.start_background())
+            return True
+        except (ValueError, OSError) as e:
+            print(f"[WARNING] Failed to install profiler signal handler: {e}")
+            return False
+
+    def http_route(self, params: Dict[str, str]) -> Tuple[int, str, bytes]:
+        """GET /debug/profile?seconds=N для MetricsServer: профилирует и возвращает сводку"""
+        try:
+            duration_s = float(params.get("seconds", self.default_duration_s))
+        except ValueError:
+            return 400, "text/plain; charset=utf-8", b"bad seconds\n"
+        duration_s = max(1.0, min(duration_s, 300.0))
+        result = self.profile(duration_s)
+        if result is None:
+            return 409, "text/plain; charset=utf-8", b"profiling already in progress\n"
+        body = f"collapsed: {result['collapsed_path']}\nsummary: {result['summary_path']}\n\n{result['summary']}"
+        return 200, "text/plain; charset=utf-8", body.encode()
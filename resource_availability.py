@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import time
+from typing import Dict, Any
+
+import psutil
+
+
+GIB = 1024 ** 3
+
+
+class ResourceAvailability:
+    """Ресурсы, доступные для новых задач, без блокирующих замеров и подпроцессов.
+    CPU — среднее из фонового сэмплера, GPU — из кэша HardwareAnalyzer, выделенное контейнерам —
+    из лимитов в ContainerIndex (docker вызывается только при смене набора контейнеров).
+    Дёшево вызывать на каждой проверке допуска задачи.
+    """
+
+    def __init__(self, hardware_analyzer, container_index=None, sampler=None, disk_path: str = "/", cpu_window_s: float = 60.0):
+        self.hardware_analyzer = hardware_analyzer
+        self.container_index = container_index
+        self.sampler = sampler
+        self.disk_path = disk_path
+        self.cpu_window_s = cpu_window_s
+        self.cpu_count = psutil.cpu_count(logical=True) or 1
+        if sampler is None:
+            psutil.cpu_percent(interval=None)  # база для неблокирующего замера без сэмплера
+
+    def _cpu_usage(self) -> float:
+        if self.sampler is not None:
+            avg = self.sampler.average("cpu_usage", self.cpu_window_s)
+            if avg is not None:
+                return round(avg, 2)
+            return self.sampler.cpu_usage()
+        # Загрузка с момента предыдущего вызова, без sleep
+        return psutil.cpu_percent(interval=None)
+
+    def _gpu_count(self) -> int:
+        gpus = self.hardware_analyzer.cached_value("gpu")
+        if gpus is None:
+            gpus = self.hardware_analyzer.get_gpu_info()
+        return sum(int(g.get("count", 1) or 1) for g in gpus or [])
+
+    def allocations(self) -> Dict[str, Any]:
+        """Суммарные лимиты запущенных контейнеров задач"""
+        result = {"containers": 0, "memory_bytes": 0, "cpus": 0.0, "storage_bytes": 0, "gpus": 0, "all_gpus": False}
+        if self.container_index is None:
+            return result
+        for info in self.container_index.containers().values():
+            limits = info.get("limits") or {}
+            result["containers"] += 1
+            result["memory_bytes"] += limits.get("memory_bytes") or 0
+            result["cpus"] += limits.get("cpus") or 0.0
+            result["storage_bytes"] += limits.get("storage_bytes") or 0
+            if limits.get("gpus") == "all":
+                result["all_gpus"] = True
+            else:
+                result["gpus"] += limits.get("gpus") or 0
+        return result
+
+    def available(self) -> Dict[str, Any]:
+        alloc = self.allocations()
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage(self.disk_path)
+        gpu_count = self._gpu_count()
+
+        # MemAvailable уже не включает то, что контейнеры используют; лимиты ограничивают сверху то,
+        # что можно пообещать новым задачам, даже если контейнеры ещё не добрали свою память
+        available_ram = min(memory.available, max(0, memory.total - alloc["memory_bytes"]))
+        available_disk = min(disk.free, max(0, disk.total - alloc["storage_bytes"]))
+        # NVIDIA_VISIBLE_DEVICES=all ставится контейнерам без явного списка GPU и не резервирует их
+        available_gpus = max(0, gpu_count - alloc["gpus"])
+
+        return {
+            "cpu_count": self.cpu_count,
+            "cpu_usage_percent": self._cpu_usage(),
+            "available_cpu_count": round(max(0.0, self.cpu_count - alloc["cpus"]), 2),
+            "total_ram_gb": memory.total / GIB,
+            "available_ram_gb": available_ram / GIB,
+            "gpu_count": gpu_count,
+            "available_gpu_count": available_gpus,
+            "total_disk_gb": disk.total / GIB,
+            "available_disk_gb": available_disk / GIB,
+            "allocated": {
+                "containers": alloc["containers"],
+                "cpus": alloc["cpus"],
+                "ram_gb": alloc["memory_bytes"] / GIB,
+                "disk_gb": alloc["storage_bytes"] / GIB,
+                "gpus": "all" if alloc["all_gpus"] else alloc["gpus"],
+            },
+        }
+
+
+def _bench(iterations: int) -> None:
+    from container_monitor import ContainerIndex
+    from hardware_analyzer import HardwareAnalyzer
+
+    analyzer = HardwareAnalyzer()
+    resources = ResourceAvailability(analyzer, ContainerIndex())
+    resources.available()  # прогрев: первичный скан GPU и индекса контейнеров
+    started = time.perf_counter()
+    for _ in range(iterations):
+        resources.available()
+    print(f"available(): avg {(time.perf_counter() - started) / iterations * 1_000_000:.1f} us over {iterations} calls")
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="resource availability benchmark")
+    p.add_argument("--iterations", type=int, default=10000)
+    args = p.parse_args()
+    _bench(args.iterations)
+
+
+if __name__ == "__main__":
+    main()
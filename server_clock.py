@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional
+
+from metrics import REGISTRY
+
+
+CLOCK_OFFSET_SECONDS = REGISTRY.gauge("gpuniq_agent_clock_offset_seconds", "Смещение часов backend относительно локальных (server - local)")
+CLOCK_OFFSET_UNCERTAINTY_SECONDS = REGISTRY.gauge("gpuniq_agent_clock_offset_uncertainty_seconds", "Полуширина интервала оценки смещения часов")
+
+CLOCK_WINDOW_SAMPLES = 64
+CLOCK_WINDOW_S = 3600.0
+
+
+class ServerClock:
+    """Смещение часов backend по заголовку Date.
+    Date округлён вниз до секунды, поэтому каждый ответ даёт интервал
+    offset ∈ [Date - t_recv, Date + 1 - t_send]. Пересечение интервалов за последний час сужает
+    оценку до долей секунды; пустое пересечение значит, что какие-то часы перевели, — окно начинается заново.
+    """
+
+    def __init__(self):
+        self._samples: deque = deque(maxlen=CLOCK_WINDOW_SAMPLES)
+        self._low: Optional[float] = None
+        self._high: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def observe(self, date_header: Optional[str], sent_at: float, received_at: float) -> None:
+        if not date_header:
+            return
+        try:
+            server_s = parsedate_to_datetime(date_header).timestamp()
+        except (TypeError, ValueError):
+            return
+        sample = (received_at, server_s - received_at, server_s + 1.0 - sent_at)
+        with self._lock:
+            while self._samples and received_at - self._samples[0][0] > CLOCK_WINDOW_S:
+                self._samples.popleft()
+            self._samples.append(sample)
+            low = max(s[1] for s in self._samples)
+            high = min(s[2] for s in self._samples)
+            if low > high:
+                print(f"[INFO] Clock offset changed, restarting estimate (was {self._offset_locked():+.2f}s)")
+                self._samples.clear()
+                self._samples.append(sample)
+                low, high = sample[1], sample[2]
+            self._low, self._high = low, high
+        CLOCK_OFFSET_SECONDS.set((low + high) / 2)
+        CLOCK_OFFSET_UNCERTAINTY_SECONDS.set((high - low) / 2)
+
+    def _offset_locked(self) -> float:
+        return 0.0 if self._low is None else (self._low + self._high) / 2
+
+    def offset(self) -> Optional[float]:
+        with self._lock:
+            return None if self._low is None else self._offset_locked()
+
+    def now(self) -> float:
+        """Текущее время по часам backend (локальное, пока оценки нет)"""
+        return time.time() + (self.offset() or 0.0)
+
+    def report(self) -> Dict[str, Any]:
+        """Для heartbeat: время сбора по часам backend и оценка смещения"""
+        local = time.time()
+        with self._lock:
+            if self._low is None:
+                return {"local_time": local}
+            offset = self._offset_locked()
+            return {
+                "local_time": local,
+                "server_time": local + offset,
+                "offset_s": round(offset, 3),
+                "uncertainty_s": round((self._high - self._low) / 2, 3),
+            }
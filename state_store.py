@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Iterator
+
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS identity (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    operation TEXT NOT NULL,
+    status TEXT NOT NULL,
+    container_id TEXT,
+    result TEXT,
+    received_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_updated_at ON tasks (updated_at);
+CREATE TABLE IF NOT EXISTS containers (
+    container_id TEXT PRIMARY KEY,
+    container_name TEXT,
+    task_id TEXT,
+    image TEXT,
+    created_at REAL NOT NULL,
+    removed_at REAL
+);
+CREATE INDEX IF NOT EXISTS containers_task_id ON containers (task_id);
+CREATE TABLE IF NOT EXISTS allocations (
+    container_id TEXT PRIMARY KEY,
+    task_id TEXT,
+    gpus TEXT,
+    cpuset TEXT,
+    memory_gb INTEGER,
+    storage_gb INTEGER,
+    allocated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS allocations_task_id ON allocations (task_id);
+CREATE TABLE IF NOT EXISTS status_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS status_queue_task_id ON status_queue (task_id);
+CREATE TABLE IF NOT EXISTS probes (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Поля результата задачи, которые не сохраняются на диск
+SECRET_RESULT_KEYS = ("ssh_password", "jupyter_token")
+
+
+class StateStore:
+    """Состояние агента во встроенной SQLite (WAL): идентичность, задачи, контейнеры, выделенные ресурсы,
+    очередь неотправленных статусов и результаты замеров (отпечаток железа, кэш IP).
+    Одно соединение на процесс под локом; каждая операция — отдельная транзакция.
+    synchronous=NORMAL в режиме WAL не теряет согласованность при падении процесса,
+    при отключении питания может потеряться только последняя транзакция.
+    """
+
+    def __init__(self, path: str = ".agent_state.db", synchronous: str = "NORMAL"):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={synchronous}")
+        self._conn.executescript(SCHEMA)
+        self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Несколько записей одной транзакцией (одна синхронизация WAL вместо нескольких)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _query(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            return cursor.fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # Идентичность агента
+
+    def get_identity(self, key: str) -> Optional[str]:
+        rows = self._query("SELECT value FROM identity WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    def set_identity(self, key: str, value: str) -> None:
+        with self.transaction() as conn:
+            conn.execute("INSERT INTO identity (key, value, updated_at) VALUES (?, ?, ?) "
+                         "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                         (key, str(value), time.time()))
+
+    # Задачи
+
+    def record_task(self, task_id: Any, operation: str, status: str, container_id: Optional[str] = None,
+                    result: Optional[Dict[str, Any]] = None) -> None:
+        with self.transaction() as conn:
+            self._upsert_task(conn, task_id, operation, status, container_id, result)
+
+    @staticmethod
+    def _upsert_task(conn: sqlite3.Connection, task_id: Any, operation: str, status: str,
+                     container_id: Optional[str], result: Optional[Dict[str, Any]]) -> None:
+        now = time.time()
+        if result is not None:
+            result = {k: v for k, v in result.items() if k not in SECRET_RESULT_KEYS}
+        conn.execute(
+            "INSERT INTO tasks (task_id, operation, status, container_id, result, received_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(task_id) DO UPDATE SET operation = excluded.operation, status = excluded.status, "
+            "container_id = COALESCE(excluded.container_id, tasks.container_id), "
+            "result = excluded.result, updated_at = excluded.updated_at",
+            (str(task_id), operation, status, container_id,
+             json.dumps(result, default=str) if result is not None else None, now, now))
+
+    def get_task(self, task_id: Any) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT task_id, operation, status, container_id, result, received_at, updated_at "
+                           "FROM tasks WHERE task_id = ?", (str(task_id),))
+        if not rows:
+            return None
+        task_id, operation, status, container_id, result, received_at, updated_at = rows[0]
+        return {"task_id": task_id, "operation": operation, "status": status, "container_id": container_id,
+                "result": json.loads(result) if result else None, "received_at": received_at, "updated_at": updated_at}
+
+    def record_task_result(self, task_id: Any, operation: str, result: Optional[Dict[str, Any]],
+                           image: Optional[str] = None) -> None:
+        """Итог задачи вместе с контейнером и ресурсами — одной транзакцией"""
+        status = (result.get("status") or "running") if result else "failed"
+        container_id = (result or {}).get("container_id") or None
+        now = time.time()
+        with self.transaction() as conn:
+            self._upsert_task(conn, task_id, operation, status, container_id, result)
+            if not container_id:
+                return
+            if operation in ("stop", "stop_remove"):
+                if status == "completed" and operation == "stop_remove":
+                    conn.execute("UPDATE containers SET removed_at = ? WHERE container_id = ?", (now, container_id))
+                    conn.execute("DELETE FROM allocations WHERE container_id = ?", (container_id,))
+                return
+            conn.execute("INSERT INTO containers (container_id, container_name, task_id, image, created_at) VALUES (?, ?, ?, ?, ?) "
+                         "ON CONFLICT(container_id) DO UPDATE SET container_name = excluded.container_name, "
+                         "task_id = excluded.task_id, image = excluded.image, removed_at = NULL",
+                         (container_id, result.get("container_name"), str(task_id), image, now))
+            resources = result.get("allocated_resources") or {}
+            conn.execute("INSERT OR REPLACE INTO allocations (container_id, task_id, gpus, cpuset, memory_gb, storage_gb, allocated_at) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (container_id, str(task_id), resources.get("gpu_devices"), resources.get("cpu_cpuset"),
+                          resources.get("ram_gb"), resources.get("storage_gb"), now))
+
+    def prune_tasks(self, older_than_s: float) -> int:
+        with self.transaction() as conn:
+            return conn.execute("DELETE FROM tasks WHERE updated_at < ?", (time.time() - older_than_s,)).rowcount
+
+    # Контейнеры и выделенные ресурсы
+
+    def container(self, container_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT container_id, container_name, task_id, image, created_at, removed_at "
+                           "FROM containers WHERE container_id = ?", (container_id,))
+        if not rows:
+            return None
+        return dict(zip(("container_id", "container_name", "task_id", "image", "created_at", "removed_at"), rows[0]))
+
+    def containers_for_task(self, task_id: Any) -> List[str]:
+        return [row[0] for row in self._query("SELECT container_id FROM containers WHERE task_id = ?", (str(task_id),))]
+
+    def allocations(self) -> List[Dict[str, Any]]:
+        rows = self._query("SELECT container_id, task_id, gpus, cpuset, memory_gb, storage_gb, allocated_at FROM allocations")
+        keys = ("container_id", "task_id", "gpus", "cpuset", "memory_gb", "storage_gb", "allocated_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    # Очередь неотправленных статусов задач
+
+    def enqueue_status(self, task_id: Any, payload: Dict[str, Any]) -> int:
+        with self.transaction() as conn:
+            return conn.execute("INSERT INTO status_queue (task_id, payload, created_at) VALUES (?, ?, ?)",
+                                (str(task_id), json.dumps(payload, default=str), time.time())).lastrowid
+
+    def drop_statuses(self, task_id: Any) -> None:
+        """Убирает из очереди статусы задачи (их заменяет более новый)"""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM status_queue WHERE task_id = ?", (str(task_id),))
+
+    def pending_statuses(self, limit: int = 100) -> List[Dict[str, Any]]:
+        rows = self._query("SELECT id, task_id, payload, attempts FROM status_queue ORDER BY id LIMIT ?", (limit,))
+        return [{"id": row[0], "task_id": row[1], "payload": json.loads(row[2]), "attempts": row[3]} for row in rows]
+
+    def ack_status(self, entry_id: int) -> None:
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM status_queue WHERE id = ?", (entry_id,))
+
+    def retry_status(self, entry_id: int) -> None:
+        with self.transaction() as conn:
+            conn.execute("UPDATE status_queue SET attempts = attempts + 1 WHERE id = ?", (entry_id,))
+
+    # Результаты замеров
+
+    def get_probe(self, name: str) -> Optional[Any]:
+        rows = self._query("SELECT value FROM probes WHERE name = ?", (name,))
+        if not rows:
+            return None
+        try:
+            return json.loads(rows[0][0])
+        except ValueError:
+            return None
+
+    def put_probe(self, name: str, value: Any) -> None:
+        with self.transaction() as conn:
+            conn.execute("INSERT INTO probes (name, value, updated_at) VALUES (?, ?, ?) "
+                         "ON CONFLICT(name) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                         (name, json.dumps(value, default=str), time.time()))
+
+    def import_json_probe(self, name: str, legacy_path: str) -> Optional[Any]:
+        """Переносит запись из старого JSON-файла, если в базе её ещё нет"""
+        value = self.get_probe(name)
+        if value is not None or not os.path.exists(legacy_path):
+            return value
+        try:
+            with open(legacy_path, "r") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self.put_probe(name, value)
+        print(f"[INFO] Migrated {legacy_path} into state store")
+        return value
+
+
+def _bench(path: str, iterations: int, synchronous: str) -> None:
+    store = StateStore(path, synchronous=synchronous)
+    result = {
+        "status": "running", "container_id": "c" * 64, "container_name": "task_0", "ssh_port": 2222,
+        "ssh_host": "203.0.113.10", "ssh_password": "secret",
+        "allocated_resources": {"cpu_cpuset": "0-7", "ram_gb": 32, "gpu_devices": "0,1", "storage_gb": 100},
+    }
+    received, finished = [], []
+    for i in range(iterations):
+        started = time.perf_counter()
+        store.record_task(i, "start", "received")
+        received.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        store.record_task_result(i, "start", dict(result, container_id=f"{i:064d}", container_name=f"task_{i}"), image="ubuntu:22.04")
+        finished.append(time.perf_counter() - started)
+    lookup_started = time.perf_counter()
+    for i in range(iterations):
+        store.get_task(i)
+    lookup = (time.perf_counter() - lookup_started) / iterations
+    store.close()
+
+    def fmt(samples: List[float]) -> str:
+        samples = sorted(samples)
+        return (f"avg {statistics.mean(samples) * 1e6:.0f} us, p50 {samples[len(samples) // 2] * 1e6:.0f} us, "
+                f"p99 {samples[int(len(samples) * 0.99)] * 1e6:.0f} us")
+
+    print(f"synchronous={synchronous}, {iterations} tasks")
+    print(f"  task received:        {fmt(received)}")
+    print(f"  task result (3 rows): {fmt(finished)}")
+    print(f"  lookup by task id:    {lookup * 1e6:.1f} us")
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="state store write-throughput benchmark")
+    p.add_argument("--path", default=None, help="файл базы (по умолчанию временный)")
+    p.add_argument("--iterations", type=int, default=2000)
+    p.add_argument("--synchronous", default="NORMAL", choices=("OFF", "NORMAL", "FULL"))
+    args = p.parse_args()
+    if args.path:
+        _bench(args.path, args.iterations, args.synchronous)
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        _bench(os.path.join(tmp, "state.db"), args.iterations, args.synchronous)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import itertools
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Optional, Callable, List, Tuple
+
+from metrics import REGISTRY
+from api_client import POLL_TASKS, POLL_BATCH_SIZE, MIN_PULL_GAP_S
+from task_trace import now_us
+
+
+SYNC_DIRECTIVES = REGISTRY.counter("gpuniq_agent_sync_directives_total", "Управляющие директивы из ответов sync по типу")
+
+SYNC_INTERVAL_RANGE_S = (1.0, 300.0)  # допустимые значения директивы sync_interval
+MAX_BUFFERED_LOGS = 200
+MAX_STATUSES_PER_SYNC = 100
+
+
+def monitoring_delta(base: Optional[Dict[str, Any]], current: Dict[str, Any]) -> Dict[str, Any]:
+    """Ключи верхнего уровня, изменившиеся относительно base. Отсутствующие в current ключи не передаются:
+    сервер накладывает изменения на последнее принятое состояние (hardware_info и т.п. приходят не в каждом heartbeat).
+    """
+    if base is None:
+        return dict(current)
+    return {key: value for key, value in current.items() if base.get(key) != value}
+
+
+class SyncSession:
+    """Режим sync: один периодический запрос POST /v1/agents/{id}/sync вместо pull, heartbeat и logs.
+    Запрос несёт изменения мониторинга относительно последнего принятого сервером heartbeat,
+    неотправленные статусы задач и накопленные лог-сообщения; ответ — новые задачи и директивы.
+    Статусы хранятся в очереди базы состояния (или в памяти) до подтверждения сервером.
+    Если сервер не знает /sync (404), режим выключается и клиент возвращается к pull.
+    """
+
+    def __init__(self, client, interval_s: float = 10.0):
+        self.client = client
+        self.interval_s = interval_s
+        self.supported = True
+        # Директивы, которые сессия не обрабатывает сама (heartbeat_now, full_report, ...)
+        self.on_directive: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._logs: deque = deque(maxlen=MAX_BUFFERED_LOGS)
+        self._memory_statuses: List[Dict[str, Any]] = []
+        self._status_ids = itertools.count(1)
+        self._heartbeat: Optional[Dict[str, Any]] = None
+        self._heartbeat_done: Optional[threading.Event] = None
+        self._heartbeat_ok = False
+        self._baseline: Optional[Dict[str, Any]] = None
+
+    # Исходящие данные
+
+    def add_log(self, message: str) -> None:
+        with self._lock:
+            self._logs.append({"message": message, "ts": self.client.transport.clock.now()})
+
+    def add_status(self, task_id: Any, payload: Dict[str, Any]) -> None:
+        store = self.client.state_store
+        if store is not None:
+            store.drop_statuses(task_id)
+            store.enqueue_status(task_id, payload)
+        else:
+            with self._lock:
+                self._memory_statuses = [s for s in self._memory_statuses if s["task_id"] != str(task_id)]
+                self._memory_statuses.append({"id": next(self._status_ids), "task_id": str(task_id), "payload": payload})
+        self._wake.set()
+
+    def submit_heartbeat(self, data: Dict[str, Any], timeout_s: float = 30.0) -> bool:
+        """Передаёт данные heartbeat ближайшему sync и ждёт его результата"""
+        done = threading.Event()
+        with self._lock:
+            self._heartbeat = data
+            self._heartbeat_done = done
+        self._wake.set()
+        return done.wait(timeout_s) and self._heartbeat_ok
+
+    def _pending_statuses(self) -> List[Dict[str, Any]]:
+        store = self.client.state_store
+        if store is not None:
+            return store.pending_statuses(MAX_STATUSES_PER_SYNC)
+        with self._lock:
+            return list(self._memory_statuses[:MAX_STATUSES_PER_SYNC])
+
+    def _ack_statuses(self, entries: List[Dict[str, Any]]) -> None:
+        store = self.client.state_store
+        if store is not None:
+            for entry in entries:
+                store.ack_status(entry["id"])
+            return
+        sent = {entry["id"] for entry in entries}
+        with self._lock:
+            self._memory_statuses = [s for s in self._memory_statuses if s["id"] not in sent]
+
+    def build_body(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Тело sync-запроса и то, что нужно подтвердить после успешного ответа"""
+        statuses = self._pending_statuses()
+        with self._lock:
+            logs = list(self._logs)
+            heartbeat, done = self._heartbeat, self._heartbeat_done
+            self._heartbeat = self._heartbeat_done = None
+            baseline = self._baseline
+        body: Dict[str, Any] = {"max_tasks": self.client.pull_batch_size}
+        if heartbeat is not None:
+            body["monitoring"] = monitoring_delta(baseline, heartbeat)
+            body["monitoring_full"] = baseline is None
+        if statuses:
+            body["statuses"] = [dict(entry["payload"], task_id=entry["task_id"]) for entry in statuses]
+        if logs:
+            body["logs"] = logs
+        return body, {"statuses": statuses, "logs": len(logs), "heartbeat": heartbeat, "done": done}
+
+    def _settle(self, sent: Dict[str, Any], ok: bool) -> None:
+        if ok:
+            self._ack_statuses(sent["statuses"])
+            with self._lock:
+                for _ in range(min(sent["logs"], len(self._logs))):
+                    self._logs.popleft()
+                if sent["heartbeat"] is not None:
+                    self._baseline = dict(self._baseline or {}, **sent["heartbeat"])
+        elif sent["heartbeat"] is not None:
+            # Heartbeat не дошёл — следующий придёт полным, сервер мог не принять предыдущую базу
+            with self._lock:
+                self._baseline = None
+        if sent["done"] is not None:
+            self._heartbeat_ok = ok
+            sent["done"].set()
+
+    # Цикл
+
+    def _apply_directives(self, directives: List[Dict[str, Any]]) -> None:
+        for directive in directives:
+            if not isinstance(directive, dict):
+                continue
+            kind = directive.get("type", "unknown")
+            SYNC_DIRECTIVES.inc(type=kind)
+            if kind == "sync_interval":
+                try:
+                    low, high = SYNC_INTERVAL_RANGE_S
+                    self.interval_s = min(high, max(low, float(directive.get("seconds"))))
+                    print(f"[INFO] Sync interval set to {self.interval_s}s by server")
+                except (TypeError, ValueError):
+                    pass
+                continue
+            if kind == "full_report":
+                with self._lock:
+                    self._baseline = None
+            if self.on_directive is not None:
+                try:
+                    self.on_directive(directive)
+                except Exception as e:
+                    print(f"[WARNING] Directive {kind} failed: {e}")
+
+    def sync_once(self, dispatch: Callable[..., Any]) -> bool:
+        """Один sync-запрос; возвращает True, если на сервере, вероятно, ждут ещё задачи
+        (полный пакет новых задач, см. APIClient.more_tasks_waiting). Бросает исключения транспорта.
+        """
+        url = f"{self.client.base_url}/v1/agents/{self.client.agent_id}/sync"
+        body, sent = self.build_body()
+        started_us = now_us()
+        started = time.perf_counter()
+        try:
+            response = self.client._post("sync", url, headers=self.client._get_headers(), json=body)
+        except Exception:
+            self._settle(sent, False)
+            raise
+        dur_us = int((time.perf_counter() - started) * 1_000_000)
+        if response.status_code == 404:
+            print("[WARNING] Server does not support sync mode, falling back to pull + heartbeat")
+            self.supported = False
+            self._settle(sent, False)
+            return False
+        ok = response.status_code == 200
+        resp_json = self.client.codec.decode(response) if ok else {}
+        ok = ok and resp_json.get('exception') == 0
+        self._settle(sent, ok)
+        if not ok:
+            print(f"[WARNING] Sync failed: status {response.status_code} {resp_json.get('message', '')}")
+            return False
+        data = resp_json.get('data') or {}
+        self._apply_directives(data.get('directives') or [])
+        tasks, invalid = self.client.tasks_from_pull(data)
+        if invalid:
+            print(f"[WARNING] Invalid task data received: {invalid}")
+        more_waiting = self.client.more_tasks_waiting(tasks)
+        if tasks:
+            POLL_TASKS.inc(len(tasks))
+            POLL_BATCH_SIZE.observe(len(tasks))
+            ops = ", ".join(f"id={t['id']} op={(t['task_data'].get('operation') or 'start').strip().lower()}" for t in tasks)
+            self.add_log(f"task received: {ops}")
+        for task in tasks:
+            print(f"[INFO] New task received via sync: {task['id']}")
+            dispatch(task, started_us, dur_us)
+        return more_waiting
+
+    def run(self, dispatch: Callable[..., Any], stop_event: threading.Event) -> None:
+        """Цикл sync до stop_event или до отказа сервера от режима"""
+        errors = 0
+        while not stop_event.is_set() and self.supported:
+            more_waiting = False
+            try:
+                more_waiting = self.sync_once(dispatch)
+                errors = 0
+            except Exception as e:
+                errors += 1
+                print(f"[WARNING] Sync request failed: {e}")
+            if not self.supported:
+                continue
+            if more_waiting:
+                stop_event.wait(MIN_PULL_GAP_S)
+                continue
+            self._wake.wait(60.0 if errors >= 5 else self.interval_s)
+            self._wake.clear()
+
+    def wake(self) -> None:
+        self._wake.set()
+
+
+def _simulate(mode: str, duration_s: float, scale: float, task_every_s: float, agents: int) -> Dict[str, Any]:
+    """Несколько агентов на mock backend: задачи приходят раз в task_every_s, heartbeat — раз в 300 с.
+    Все интервалы делятся на scale, результаты пересчитываются обратно в реальное время.
+    """
+    import contextlib
+    import io
+    from api_client import APIClient
+    from mock_backend import MockBackend, make_task
+
+    backend = MockBackend()
+    url = backend.start()
+    clients, threads = [], []
+    added_at: Dict[str, float] = {}
+    delivery: List[float] = []
+    stop = threading.Event()
+
+    def make_dispatch(client):
+        def dispatch(task, *args):
+            delivery.append(time.monotonic() - added_at[str(task['id'])])
+            client.send_log(f"task received: id={task['id']}")
+            client.send_task_status(task['id'], {"status": "running", "container_id": f"c{task['id']}"})
+        return dispatch
+
+    def heartbeat_loop(client):
+        while not stop.wait(300.0 / scale):
+            client.send_heartbeat({"cpu_usage": 10, "memory_usage": 20, "gpu_usage": {"gpu0": 0}})
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(agents):
+            client = APIClient(base_url=url, agent_id=backend.agent_id, secret_key="mock-secret")
+            client.poll_interval_s = 10.0 / scale
+            if mode == "sync":
+                client.enable_sync(10.0 / scale)
+            clients.append(client)
+            threads.append(threading.Thread(target=client.poll_for_tasks, args=(None, make_dispatch(client)), daemon=True))
+            threads.append(threading.Thread(target=heartbeat_loop, args=(client,), daemon=True))
+        for thread in threads:
+            thread.start()
+        started = time.monotonic()
+        next_id = itertools.count()
+        while time.monotonic() - started < duration_s / scale:
+            for _ in range(agents):
+                task = make_task(next(next_id))
+                added_at[str(task["task_id"])] = time.monotonic()
+                backend.add_tasks([task])
+            time.sleep(task_every_s / scale)
+        time.sleep(20.0 / scale)
+        stop.set()
+        for client in clients:
+            client.close()
+    backend.stop()
+    minutes = duration_s / 60.0
+    total = sum(backend.requests.values())
+    return {
+        "requests_per_agent_min": total / agents / minutes,
+        "by_endpoint": dict(backend.requests),
+        "task_delivery_s": sorted(delivery)[len(delivery) // 2] * scale if delivery else float("nan"),
+        "statuses": sum(len(v) for v in backend.statuses.values()),
+    }
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="sync mode vs pull + heartbeat: request rate and latency on a mock backend")
+    p.add_argument("--duration", type=float, default=1800.0, help="моделируемое время, сек")
+    p.add_argument("--scale", type=float, default=100.0, help="ускорение времени")
+    p.add_argument("--task-every", type=float, default=120.0, help="период поступления задач на агента, сек")
+    p.add_argument("--agents", type=int, default=5)
+    args = p.parse_args()
+    print(f"{args.agents} agents, {args.duration:.0f}s simulated, one task per agent every {args.task_every:.0f}s")
+    for mode in ("pull", "sync"):
+        result = _simulate(mode, args.duration, args.scale, args.task_every, args.agents)
+        endpoints = ", ".join(f"{k}={v}" for k, v in sorted(result["by_endpoint"].items()))
+        print(f"{mode:>5}: {result['requests_per_agent_min']:.2f} req/agent/min, median task delivery "
+              f"{result['task_delivery_s']:.1f}s, statuses {result['statuses']} ({endpoints})")
+
+
+if __name__ == "__main__":
+    main()
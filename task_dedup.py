@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from typing import Dict, Any, Optional, Callable, Tuple
+
+from metrics import REGISTRY
+
+
+TASK_DEDUP_TOTAL = REGISTRY.counter("gpuniq_agent_task_dedup_total", "Повторно доставленные задачи по источнику ответа")
+
+# Сколько помнить итог задачи для ответа на повторную доставку
+TASK_DEDUP_WINDOW_S = 24 * 3600.0
+
+
+class _InFlight:
+    __slots__ = ("done", "result")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+
+
+class TaskDedupIndex:
+    """Идемпотентная обработка задач по task id.
+    Итог задачи берётся из базы состояния (таблица tasks): если задача уже завершилась в пределах
+    window_s, повторная доставка получает сохранённый результат без операций с docker.
+    Повтор задачи, которая ещё выполняется, ждёт первого выполнения и получает его результат.
+    Задачи без итога (обработка вернула None или агент упал посреди неё) выполняются заново.
+    """
+
+    def __init__(self, state_store, window_s: float = TASK_DEDUP_WINDOW_S):
+        self.state_store = state_store
+        self.window_s = window_s
+        self._in_flight: Dict[str, _InFlight] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, task_id: Any) -> Optional[Dict[str, Any]]:
+        """Сохранённый результат задачи, если он есть и не старше окна"""
+        try:
+            record = self.state_store.get_task(task_id)
+        except Exception as e:
+            print(f"[WARNING] Task index lookup failed: {e}")
+            return None
+        if not record or record["status"] == "received" or not record.get("result") or time.time() - record["updated_at"] >= self.window_s:
+            return None
+        return record["result"]
+
+    def is_known(self, task_id: Any) -> bool:
+        """Задача выполняется сейчас или её итог ещё в окне — повторная доставка не несёт новой работы"""
+        with self._lock:
+            if str(task_id) in self._in_flight:
+                return True
+        return self.lookup(task_id) is not None
+
+    def execute(self, task_id: Any, run: Callable[[], Optional[Dict[str, Any]]]) -> Tuple[Optional[Dict[str, Any]], str]:
+        """Выполняет run() один раз на task id. Возвращает (результат, источник): executed | index | in_flight"""
+        key = str(task_id)
+        with self._lock:
+            pending = self._in_flight.get(key)
+            if pending is None:
+                stored = self.lookup(task_id)
+                if stored is not None:
+                    TASK_DEDUP_TOTAL.inc(source="index")
+                    return stored, "index"
+                pending = self._in_flight[key] = _InFlight()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            TASK_DEDUP_TOTAL.inc(source="in_flight")
+            pending.done.wait()
+            return pending.result, "in_flight"
+
+        try:
+            pending.result = run()
+            return pending.result, "executed"
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            pending.done.set()
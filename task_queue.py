@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, Any, Optional, Callable, List
+
+from metrics import REGISTRY
+from task_trace import now_us
+
+
+TASK_QUEUE_DEPTH = REGISTRY.gauge("gpuniq_agent_task_queue_depth", "Задачи в локальной очереди по классу приоритета")
+TASK_QUEUE_WAIT_SECONDS = REGISTRY.histogram("gpuniq_agent_task_queue_wait_seconds", "Ожидание задачи в очереди по классу приоритета")
+TASK_CANCELLED = REGISTRY.counter("gpuniq_agent_task_cancelled_total", "Запуски контейнеров, отменённые управляющей задачей")
+
+# Классы приоритета: меньше — раньше
+PRIORITY_CONTROL = 0       # stop / stop_remove
+PRIORITY_START_CACHED = 1  # запуск из локального образа
+PRIORITY_START_PULL = 2    # запуск, которому нужен docker pull
+PRIORITY_NAMES = {PRIORITY_CONTROL: "control", PRIORITY_START_CACHED: "start_cached", PRIORITY_START_PULL: "start_pull"}
+
+CONTROL_OPERATIONS = ("stop", "stop_remove")
+
+
+def task_operation(task: Dict[str, Any]) -> str:
+    return ((task.get('task_data') or {}).get('operation') or 'start').strip().lower()
+
+
+class QueuedTask:
+    """Задача в очереди вместе с её событием отмены и временем ожидания"""
+
+    __slots__ = ("task", "priority", "container_name", "container_id", "classified", "seq", "cancel_event", "cancels",
+                 "started", "done", "enqueued_at", "enqueued_us", "poll_started_us", "poll_dur_us")
+
+    def __init__(self, task: Dict[str, Any], priority: int, container_name: Optional[str], container_id: Optional[str] = None,
+                 poll_started_us: Optional[int] = None, poll_dur_us: int = 0):
+        self.task = task
+        self.priority = priority
+        self.container_name = container_name
+        self.container_id = container_id
+        # Нужен ли запуску docker pull, выясняет исполнитель: проверка образа не должна блокировать pull
+        self.classified = priority == PRIORITY_CONTROL
+        self.seq = 0
+        self.cancel_event = threading.Event()
+        # Запуски контейнеров, которые эта управляющая задача отменила
+        self.cancels: List["QueuedTask"] = []
+        self.started = False
+        self.done = threading.Event()
+        self.enqueued_at = time.monotonic()
+        self.enqueued_us = now_us()
+        self.poll_started_us = poll_started_us
+        self.poll_dur_us = poll_dur_us
+
+    def keys(self) -> List[str]:
+        """Имя и id контейнера — по любому из них управляющая задача находит запуск"""
+        return [key for key in (self.container_name, self.container_id) if key]
+
+
+class TaskQueue:
+    """Локальная очередь задач между pull и исполнением.
+    Порядок: stop/stop_remove, затем запуски из локальных образов, затем запуски с docker pull;
+    внутри класса — по порядку поступления. Один исполнитель берёт только управляющие задачи, чтобы
+    остановка не ждала запуска, который качает образ. Управляющая задача при постановке в очередь
+    отменяет запуск того же контейнера (по имени или id): ждущий в очереди — сразу, выполняющийся — через
+    cancel_event (docker pull прерывается, контейнер не создаётся).
+    submit() не обращается к docker: запуск встаёт в очередь как start_cached, а исполнитель, взяв его,
+    проверяет образ и, если нужен pull, а впереди есть более быстрые задачи, возвращает его в очередь как start_pull.
+    """
+
+    def __init__(self, execute: Callable[[QueuedTask], None], workers: int = 2,
+                 image_cached: Optional[Callable[[str], bool]] = None,
+                 container_name_of: Optional[Callable[[Dict[str, Any]], Optional[str]]] = None):
+        self.execute = execute
+        self.workers = max(1, workers)
+        self.image_cached = image_cached
+        self.container_name_of = container_name_of or (lambda task: None)
+        self._heap: List[Any] = []
+        self._seq = itertools.count()
+        self._active: Dict[str, QueuedTask] = {}  # запуски в очереди и в работе по имени и по id контейнера
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._stopped = False
+
+    def classify(self, task: Dict[str, Any]) -> int:
+        """Класс по образу: вызывает docker image inspect, поэтому выполняется в исполнителе"""
+        if task_operation(task) in CONTROL_OPERATIONS:
+            return PRIORITY_CONTROL
+        image = (task.get('task_data') or {}).get('docker_image')
+        if image and self.image_cached is not None:
+            try:
+                if not self.image_cached(image):
+                    return PRIORITY_START_PULL
+            except Exception as e:
+                print(f"[WARNING] Image cache check failed for {image}: {e}")
+        return PRIORITY_START_CACHED
+
+    def submit(self, task: Dict[str, Any], poll_started_us: Optional[int] = None, poll_dur_us: int = 0) -> QueuedTask:
+        task_data = task.get('task_data') or {}
+        container_info = task.get('container_info') or {}
+        container_id = task_data.get('container_id') or container_info.get('container_id')
+        if task_operation(task) in CONTROL_OPERATIONS:
+            priority = PRIORITY_CONTROL
+            container_name = task_data.get('container_name') or container_info.get('container_name')
+        else:
+            priority = PRIORITY_START_CACHED
+            container_name = self.container_name_of(task)
+        item = QueuedTask(task, priority, container_name, container_id, poll_started_us, poll_dur_us)
+        with self._cond:
+            if priority == PRIORITY_CONTROL:
+                start = next((self._active[key] for key in item.keys() if key in self._active), None)
+                if start is not None and not start.cancel_event.is_set():
+                    start.cancel_event.set()
+                    item.cancels.append(start)
+                    if not start.started:
+                        self._promote(start)
+                    TASK_CANCELLED.inc()
+                    print(f"[INFO] Task {task.get('id')} cancels pending start of {start.container_name} (task {start.task.get('id')})")
+            else:
+                for key in item.keys():
+                    self._active[key] = item
+            item.seq = next(self._seq)
+            heapq.heappush(self._heap, (priority, item.seq, item))
+            TASK_QUEUE_DEPTH.inc(priority=PRIORITY_NAMES[priority])
+            kind = PRIORITY_NAMES[priority] if item.classified else "start"
+            print(f"[INFO] Task {task.get('id')} queued as {kind} ({len(self._heap)} in queue)")
+            self._cond.notify_all()
+        return item
+
+    def _promote(self, item: QueuedTask) -> None:
+        """Отменённый запуск из очереди — в класс control: он завершится сразу и не задержит остановку"""
+        for i, (priority, seq, queued) in enumerate(self._heap):
+            if queued is item:
+                self._heap[i] = (PRIORITY_CONTROL, seq, item)
+                item.classified = True
+                heapq.heapify(self._heap)
+                TASK_QUEUE_DEPTH.dec(priority=PRIORITY_NAMES[priority])
+                TASK_QUEUE_DEPTH.inc(priority=PRIORITY_NAMES[PRIORITY_CONTROL])
+                item.priority = PRIORITY_CONTROL
+                return
+
+    def has_task(self, task_id: Any) -> bool:
+        """Задача с таким id ждёт в очереди"""
+        key = str(task_id)
+        with self._cond:
+            return any(str(item.task.get('id')) == key for _, _, item in self._heap)
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def _take(self, control_only: bool) -> Optional[QueuedTask]:
+        with self._cond:
+            while not self._stopped:
+                if self._heap and (not control_only or self._heap[0][0] == PRIORITY_CONTROL):
+                    item = heapq.heappop(self._heap)[2]
+                    item.started = True
+                    TASK_QUEUE_DEPTH.dec(priority=PRIORITY_NAMES[item.priority])
+                    return item
+                self._cond.wait()
+        return None
+
+    def _defer_pull(self, item: QueuedTask) -> bool:
+        """Проверяет образ взятого запуска. Если нужен docker pull, а в очереди ждут задачи приоритетнее,
+        возвращает запуск в очередь классом start_pull (True) — исполнитель берёт следующую задачу.
+        """
+        item.classified = True
+        if item.cancel_event.is_set() or self.classify(item.task) != PRIORITY_START_PULL:
+            return False
+        with self._cond:
+            item.priority = PRIORITY_START_PULL
+            if not self._heap or self._heap[0][0] >= PRIORITY_START_PULL or item.cancel_event.is_set():
+                return False
+            item.started = False
+            heapq.heappush(self._heap, (PRIORITY_START_PULL, item.seq, item))
+            TASK_QUEUE_DEPTH.inc(priority=PRIORITY_NAMES[PRIORITY_START_PULL])
+            self._cond.notify_all()
+        return True
+
+    def _worker(self, control_only: bool) -> None:
+        while True:
+            item = self._take(control_only)
+            if item is None:
+                return
+            if not item.classified and self._defer_pull(item):
+                continue
+            TASK_QUEUE_WAIT_SECONDS.observe(time.monotonic() - item.enqueued_at, priority=PRIORITY_NAMES[item.priority])
+            try:
+                self.execute(item)
+            except Exception as e:
+                print(f"[ERROR] Queued task {item.task.get('id')} failed: {e}")
+            finally:
+                with self._cond:
+                    for key in item.keys():
+                        if self._active.get(key) is item:
+                            del self._active[key]
+                item.done.set()
+
+    def start(self) -> None:
+        self._stopped = False
+        threads = [threading.Thread(target=self._worker, args=(True,), name="task-control", daemon=True)]
+        threads += [threading.Thread(target=self._worker, args=(False,), name=f"task-worker-{i}", daemon=True)
+                    for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        self._threads = threads
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
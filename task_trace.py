@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import glob
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List
+
+
+def now_us() -> int:
+    """Текущее время в микросекундах (шкала trace-event)"""
+    return time.time_ns() // 1000
+
+
+class _TaskTrace:
+    __slots__ = ("task_id", "events", "threads")
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.events: List[Dict[str, Any]] = []
+        self.threads: Dict[int, str] = {}
+
+
+class TaskTracer:
+    """Таймлайн жизненного цикла задачи в формате Chrome trace-event (Perfetto / chrome://tracing).
+    Трасса привязана к потоку, который обрабатывает задачу; span() вне активной трассы ничего не стоит.
+    Файлы хранятся кольцом: остаются только max_files последних задач.
+    """
+
+    def __init__(self, output_dir: str = "traces", max_files: int = 50):
+        self.output_dir = output_dir
+        self.max_files = max_files
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+    def configure(self, output_dir: str, max_files: int) -> None:
+        self.output_dir = output_dir
+        self.max_files = max_files
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_files > 0
+
+    def _current(self) -> Optional[_TaskTrace]:
+        return getattr(self._local, "trace", None)
+
+    def begin(self, task_id: Any) -> None:
+        """Начинает трассу задачи в текущем потоке"""
+        if not self.enabled:
+            return
+        self._local.trace = _TaskTrace(str(task_id))
+
+    def add_complete(self, name: str, cat: str, start_us: int, dur_us: int, **args) -> None:
+        """Добавляет завершённый интервал (ph=X) с известным началом и длительностью"""
+        trace = self._current()
+        if trace is None:
+            return
+        thread = threading.current_thread()
+        trace.threads[thread.ident] = thread.name
+        trace.events.append({
+            "name": name, "cat": cat, "ph": "X",
+            "ts": start_us, "dur": max(0, dur_us),
+            "pid": self._pid, "tid": thread.ident,
+            "args": args,
+        })
+
+    @contextmanager
+    def span(self, name: str, cat: str, **args):
+        """with TRACER.span("docker pull", "subprocess", argv=...) as args: args["rc"] = 0"""
+        if self._current() is None:
+            yield args
+            return
+        start = now_us()
+        started = time.perf_counter()
+        try:
+            yield args
+        except Exception as e:
+            args["error"] = str(e)
+            raise
+        finally:
+            self.add_complete(name, cat, start, int((time.perf_counter() - started) * 1_000_000), **args)
+
+    def instant(self, name: str, cat: str, **args) -> None:
+        trace = self._current()
+        if trace is None:
+            return
+        trace.events.append({
+            "name": name, "cat": cat, "ph": "i", "s": "t",
+            "ts": now_us(), "pid": self._pid, "tid": threading.get_ident(),
+            "args": args,
+        })
+
+    def end(self) -> Optional[str]:
+        """Завершает трассу текущего потока и пишет её на диск; возвращает путь к файлу"""
+        trace = self._current()
+        self._local.trace = None
+        if trace is None or not trace.events:
+            return None
+        try:
+            return self._write(trace)
+        except Exception as e:
+            print(f"[WARNING] Failed to write task trace: {e}")
+            return None
+
+    def _write(self, trace: _TaskTrace) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        events = [
+            {"name": "process_name", "ph": "M", "pid": self._pid, "args": {"name": "gpuniq-agent"}},
+            *({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}}
+              for tid, name in trace.threads.items()),
+            *trace.events,
+        ]
+        safe_id = re.sub(r'[^A-Za-z0-9_.-]', '_', trace.task_id)
+        path = os.path.join(self.output_dir, f"task-{safe_id}.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"task_id": trace.task_id}}, f)
+        os.replace(tmp_path, path)
+        self._prune()
+        return path
+
+    def _prune(self) -> None:
+        files = glob.glob(os.path.join(self.output_dir, "task-*.json"))
+        if len(files) <= self.max_files:
+            return
+        files.sort(key=lambda p: os.path.getmtime(p))
+        for path in files[:len(files) - self.max_files]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# Трассировщик по умолчанию, общий для всех модулей агента
+TRACER = TaskTracer()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from linux_inventory import LinuxInventory, capture_fixture
+
+
+# Два сокета × 2 ядра × 2 потока, NVMe SSD с двумя разделами, SATA HDD, loop-устройство,
+# NIC на 25 Гбит/с, NIC без линка, мост br0, docker0, veth и lo
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "linux_2s_nvme_sata")
+
+
+def _inventory(root: str = FIXTURE, sysfs: bool = True) -> LinuxInventory:
+    sysfs_root = os.path.join(root, "sys") if sysfs else os.path.join(root, "missing-sys")
+    return LinuxInventory(proc_root=os.path.join(root, "proc"), sysfs_root=sysfs_root)
+
+
+class CpuInfoTest(unittest.TestCase):
+    def test_two_sockets_from_topology(self):
+        self.assertEqual(_inventory().cpu_info(), [{
+            "model": "Intel(R) Xeon(R) Gold 6230 CPU @ 2.10GHz",
+            "cores": 2,
+            "threads": 4,
+            "freq_ghz": 3.5,
+            "count": 2,
+        }])
+
+    def test_two_sockets_from_cpuinfo_without_sysfs(self):
+        cpus = _inventory(sysfs=False).cpu_info()
+        self.assertEqual((cpus[0]["count"], cpus[0]["cores"], cpus[0]["threads"]), (2, 2, 4))
+        self.assertEqual(cpus[0]["freq_ghz"], 2.1)  # cpu MHz вместо cpufreq
+
+
+class DiskInfoTest(unittest.TestCase):
+    def test_whole_disks_only(self):
+        disks = _inventory().disk_info()
+        # loop0 пропускается, разделы nvme0n1p* не считаются дисками
+        self.assertEqual([d["name"] for d in disks], ["nvme0n1", "sda"])
+
+    def test_nvme_size_and_type(self):
+        nvme = _inventory().disk_info()[0]
+        self.assertEqual(nvme["size_bytes"], 1953525168 * 512)
+        self.assertEqual(nvme["size_bytes"], 1000204886016)
+        self.assertEqual(nvme["size_gb"], 931.5)
+        self.assertEqual(nvme["type"], "SSD")
+        self.assertEqual(nvme["model"], "Samsung SSD 980 PRO 1TB")
+
+    def test_sata_size_and_type(self):
+        sata = _inventory().disk_info()[1]
+        self.assertEqual(sata["size_bytes"], 4000787030016)
+        self.assertEqual(sata["size_gb"], 3726.0)
+        self.assertEqual(sata["type"], "HDD")
+        self.assertEqual(sata["model"], "ST4000NM0035-1V4")
+
+
+class NetworkInfoTest(unittest.TestCase):
+    def test_speeds_and_skipped_interfaces(self):
+        networks = {n["ports"]: n for n in _inventory().network_info()}
+        # docker0, veth* и lo на сервер не отправляются
+        self.assertEqual(sorted(networks), ["br0", "eno1", "enp65s0f1"])
+        self.assertEqual((networks["eno1"]["up_mbps"], networks["eno1"]["down_mbps"]), (25000, 25000))
+        self.assertEqual(networks["eno1"]["type"], "Ethernet")
+        # speed = -1 (нет линка, виртуальный мост) — скорость по умолчанию
+        self.assertEqual(networks["enp65s0f1"]["up_mbps"], 1000)
+        self.assertEqual((networks["br0"]["up_mbps"], networks["br0"]["type"]), (1000, "Unknown"))
+
+
+class CaptureFixtureTest(unittest.TestCase):
+    def test_capture_round_trip(self):
+        with tempfile.TemporaryDirectory() as dest:
+            self.assertGreater(capture_fixture(dest, os.path.join(FIXTURE, "proc"), os.path.join(FIXTURE, "sys")), 0)
+            self.assertTrue(os.path.exists(os.path.join(dest, "sys", "block", "nvme0n1", "nvme0n1p1", "partition")))
+            original, copy = _inventory(), _inventory(dest)
+            self.assertEqual(copy.cpu_info(), original.cpu_info())
+            self.assertEqual(copy.disk_info(), original.disk_info())
+            self.assertEqual(copy.network_info(), original.network_info())
+
+
+if __name__ == "__main__":
+    unittest.main()
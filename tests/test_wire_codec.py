@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wire_codec
+from wire_codec import pack_keys, unpack_keys, sample_payloads, FIELD_SCHEMAS, NAME_MAP_FIELDS, SCHEMA_VERSION, _FIELD_IDS
+
+
+IDS = _FIELD_IDS[SCHEMA_VERSION]
+NAMES = FIELD_SCHEMAS[SCHEMA_VERSION]
+NAME_MAPS = NAME_MAP_FIELDS[SCHEMA_VERSION]
+
+# Контейнеры, GPU и точки монтирования с именами, совпадающими с полями схемы, и числовые ключи
+TRICKY = {
+    "status": "online",
+    "gpu_usage": {"status": 12.0, "average": 12.0},
+    "disk_usage": {"ports": {"total": 10, "used": 4, "free": 6, "percent": 40.0}},
+    "network_usage": {"up_mbps": 1.0, "down_mbps": 2.0, "interfaces": {"name": {"rx_mbps": 1.0, "tx_mbps": 0.5}},
+                      "containers": {"status": {"rx_mbps": 0.25, "tx_mbps": 0.0}}},
+    "container_gpu_usage": {"ports": {"gpus": ["gpu0"], "utilization": 90.5}},
+    "thermal": {"gpus": {"0": {"temperature": 60.0}}, "cpu_throttle": {3: 1}},
+    "stats": {"cpu_usage": {"min": 1.0, "avg": 2.0, "p95": 3.0, "max": 4.0}},
+}
+
+
+def _round_trip(data):
+    return unpack_keys(pack_keys(data, IDS, NAME_MAPS), NAMES, NAME_MAPS)
+
+
+class PackKeysTest(unittest.TestCase):
+    def test_round_trip_matches_json(self):
+        self.assertEqual(_round_trip(TRICKY), json.loads(json.dumps(TRICKY)))
+        for name, payload in sample_payloads().items():
+            self.assertEqual(_round_trip(payload), json.loads(json.dumps(payload)), name)
+
+    def test_data_keys_are_not_packed(self):
+        packed = pack_keys(TRICKY, IDS, NAME_MAPS)
+        self.assertEqual(packed[IDS["status"]], "online")
+        self.assertEqual(set(packed[IDS["gpu_usage"]]), {"status", "average"})
+        self.assertIn("ports", packed[IDS["container_gpu_usage"]])
+        # Значения внутри словаря с ключами-данными — снова поля
+        self.assertIn(IDS["utilization"], packed[IDS["container_gpu_usage"]]["ports"])
+        self.assertIn("status", packed[IDS["network_usage"]][IDS["containers"]])
+
+    def test_int_keys_among_fields_become_strings(self):
+        packed = pack_keys(TRICKY, IDS, NAME_MAPS)
+        self.assertEqual(packed[IDS["thermal"]][IDS["cpu_throttle"]], {"3": 1})
+
+    def test_int_keyed_data_map_from_server_is_kept(self):
+        # Ответ сервера: номера полей снаружи, словарь GPU с числовыми ключами внутри
+        body = {IDS["data"]: {IDS["gpus"]: {1: {IDS["temperature"]: 60.0}, 2: {IDS["temperature"]: 61.0}}}}
+        self.assertEqual(unpack_keys(body, NAMES, NAME_MAPS),
+                         {"data": {"gpus": {1: {"temperature": 60.0}, 2: {"temperature": 61.0}}}})
+
+
+@unittest.skipUnless(wire_codec.available_types(), "msgpack/cbor2 not installed")
+class BinaryRoundTripTest(unittest.TestCase):
+    def test_encode_decode(self):
+        for content_type in wire_codec.available_types():
+            body = wire_codec.encode(TRICKY, content_type)
+            self.assertEqual(wire_codec.decode(body, content_type), json.loads(json.dumps(TRICKY)), content_type)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import glob
+import os
+import subprocess
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple
+
+from command_runner import RUNNER
+
+
+# Драйверы hwmon, которые отдают температуру CPU
+CPU_HWMON_DRIVERS = ("coretemp", "k10temp", "zenpower", "cpu_thermal", "soc_thermal")
+CPU_THERMAL_ZONE_TYPES = ("x86_pkg_temp", "cpu-thermal", "cpu_thermal", "soc-thermal")
+# Подписи сенсоров уровня пакета — предпочтительнее отдельных ядер
+CPU_PACKAGE_LABELS = ("Package id", "Tctl", "Tdie", "Physical id")
+
+# Биты nvidia-smi clocks_throttle_reasons.active, означающие замедление из-за перегрева или аппаратного сбоя
+GPU_THROTTLE_REASONS = {
+    0x8: "hw_slowdown",
+    0x20: "sw_thermal_slowdown",
+    0x40: "hw_thermal_slowdown",
+    0x80: "hw_power_brake_slowdown",
+}
+# Работа на пределе мощности — обычное состояние нагруженного GPU: сообщается отдельно и не считается троттлингом
+GPU_SW_POWER_CAP = 0x4
+# Один запрос nvidia-smi на все GPU: загрузка для сэмплера метрик, температура и троттлинг для ThermalMonitor
+GPU_QUERY_FIELDS = "index,name,utilization.gpu,temperature.gpu,clocks_throttle_reasons.active"
+
+
+class _Sensor:
+    __slots__ = ("key", "path", "kind", "fd")
+
+    def __init__(self, key: str, path: str, kind: str):
+        self.key = key
+        self.path = path
+        self.kind = kind  # cpu_package | cpu_core | other
+        self.fd: Optional[int] = None
+
+
+def _read_text(path: str) -> Optional[str]:
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _float_or_none(text: str) -> Optional[float]:
+    try:
+        return float(text)
+    except ValueError:
+        return None  # [N/A] у GPU без соответствующего сенсора
+
+
+def query_gpus(timeout_s: float = 5.0) -> Dict[str, Dict[str, Any]]:
+    """{индекс: {name, utilization, temperature, throttle_reasons, power_capped}} за один запуск nvidia-smi.
+    Ошибки запуска (нет nvidia-smi, таймаут, ненулевой код) пробрасываются.
+    """
+    out = RUNNER.check_output(
+        ['nvidia-smi', f'--query-gpu={GPU_QUERY_FIELDS}', '--format=csv,noheader,nounits'],
+        stderr=subprocess.DEVNULL, timeout=timeout_s
+    ).decode(errors='ignore')
+    gpus = {}
+    for line in out.strip().split('\n'):
+        parts = [p.strip() for p in line.split(',')]
+        if len(parts) < 5 or not parts[0].isdigit():
+            continue
+        try:
+            mask = int(parts[-1], 16)
+        except ValueError:
+            mask = 0
+        gpus[parts[0]] = {
+            "name": ", ".join(parts[1:-3]),  # имя модели само может содержать запятые
+            "utilization": _float_or_none(parts[-3]),
+            "temperature": _float_or_none(parts[-2]),
+            "throttle_reasons": [name for bit, name in GPU_THROTTLE_REASONS.items() if mask & bit],
+            "power_capped": bool(mask & GPU_SW_POWER_CAP),
+        }
+    return gpus
+
+
+class ThermalMonitor:
+    """Температурные сенсоры хоста, счётчики троттлинга CPU и причины троттлинга GPU.
+    Сенсоры обнаруживаются один раз, дальше читаются через открытые дескрипторы (pread).
+    """
+
+    def __init__(self, sysfs_root: str = "/sys", gpu_interval_s: float = 5.0):
+        self.sysfs_root = sysfs_root
+        self.gpu_interval_s = gpu_interval_s
+        self._lock = threading.Lock()
+        self._sensors: Optional[List[_Sensor]] = None
+        self._throttle_files: Optional[List[Tuple[str, str]]] = None
+        self._prev_throttle: Optional[Dict[str, int]] = None
+        self._gpu_available = True
+        self._last_gpu_ts = float('-inf')
+
+        self.temperatures: Dict[str, float] = {}
+        self.cpu_throttle: Dict[str, Any] = {"core_count": 0, "package_count": 0, "active": False}
+        self.gpus: Dict[str, Dict[str, Any]] = {}
+
+    def discover(self) -> List[_Sensor]:
+        """Находит все hwmon/thermal_zone сенсоры и подписи к ним"""
+        sensors = []
+        seen_paths = set()
+
+        for hwmon in sorted(glob.glob(os.path.join(self.sysfs_root, "class/hwmon/hwmon*"))):
+            driver = _read_text(os.path.join(hwmon, "name")) or os.path.basename(hwmon)
+            for temp_input in sorted(glob.glob(os.path.join(hwmon, "temp*_input"))):
+                real = os.path.realpath(temp_input)
+                if real in seen_paths:
+                    continue
+                seen_paths.add(real)
+                prefix = temp_input[:-len("_input")]
+                label = _read_text(prefix + "_label") or os.path.basename(prefix)
+                kind = "other"
+                if driver in CPU_HWMON_DRIVERS:
+                    kind = "cpu_package" if label.startswith(CPU_PACKAGE_LABELS) else "cpu_core"
+                sensors.append(_Sensor(f"{driver}/{label}", temp_input, kind))
+
+        for zone in sorted(glob.glob(os.path.join(self.sysfs_root, "class/thermal/thermal_zone*"))):
+            zone_type = _read_text(os.path.join(zone, "type")) or os.path.basename(zone)
+            kind = "cpu_package" if zone_type in CPU_THERMAL_ZONE_TYPES else "other"
+            sensors.append(_Sensor(f"{os.path.basename(zone)}/{zone_type}", os.path.join(zone, "temp"), kind))
+
+        throttle_files = []
+        for cpu_dir in glob.glob(os.path.join(self.sysfs_root, "devices/system/cpu/cpu[0-9]*")):
+            for counter in ("core_throttle_count", "package_throttle_count"):
+                path = os.path.join(cpu_dir, "thermal_throttle", counter)
+                if os.path.exists(path):
+                    package = _read_text(os.path.join(cpu_dir, "topology", "physical_package_id")) or "0"
+                    key = f"{counter}:{os.path.basename(cpu_dir)}" if counter == "core_throttle_count" else f"{counter}:{package}"
+                    throttle_files.append((key, path))
+
+        self._sensors = sensors
+        self._throttle_files = throttle_files
+        return sensors
+
+    @staticmethod
+    def _read_millidegrees(sensor: _Sensor) -> Optional[float]:
+        try:
+            if sensor.fd is None:
+                sensor.fd = os.open(sensor.path, os.O_RDONLY)
+            raw = os.pread(sensor.fd, 32, 0).strip()
+            return int(raw) / 1000.0
+        except (OSError, ValueError):
+            if sensor.fd is not None:
+                try:
+                    os.close(sensor.fd)
+                except OSError:
+                    pass
+                sensor.fd = None
+            return None
+
+    def _read_throttle_counts(self) -> Dict[str, int]:
+        counts = {}
+        for key, path in self._throttle_files or []:
+            value = _read_text(path)
+            if value and value.isdigit():
+                counts[key] = int(value)
+        return counts
+
+    @staticmethod
+    def _gpu_state(gpus: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        return {index: {"temperature": gpu["temperature"], "throttle_reasons": gpu["throttle_reasons"],
+                        "power_capped": gpu["power_capped"]} for index, gpu in gpus.items()}
+
+    def update_gpus(self, gpus: Dict[str, Dict[str, Any]]) -> None:
+        """Состояние GPU из результата query_gpus, снятого в другом месте (сэмплером метрик)"""
+        state = self._gpu_state(gpus)
+        with self._lock:
+            self.gpus = state
+            self._last_gpu_ts = time.monotonic()
+
+    def sample(self, poll_gpus: bool = True) -> Dict[str, float]:
+        """Читает все сенсоры и счётчики троттлинга; GPU — не чаще gpu_interval_s.
+        poll_gpus=False — состояние GPU приносит update_gpus (сэмплер уже опрашивает nvidia-smi).
+        """
+        with self._lock:
+            if self._sensors is None:
+                self.discover()
+
+            temperatures = {}
+            for sensor in self._sensors:
+                value = self._read_millidegrees(sensor)
+                if value is not None:
+                    temperatures[sensor.key] = value
+            self.temperatures = temperatures
+
+            counts = self._read_throttle_counts()
+            if counts:
+                core = sum(v for k, v in counts.items() if k.startswith("core_"))
+                package = sum(v for k, v in counts.items() if k.startswith("package_"))
+                prev = self._prev_throttle
+                active = prev is not None and any(counts.get(k, 0) > v for k, v in prev.items())
+                self.cpu_throttle = {"core_count": core, "package_count": package, "active": active}
+                self._prev_throttle = counts
+
+            now = time.monotonic()
+            if poll_gpus and self._gpu_available and now - self._last_gpu_ts >= self.gpu_interval_s:
+                self._last_gpu_ts = now
+                try:
+                    self.gpus = self._gpu_state(query_gpus())
+                except FileNotFoundError:
+                    self._gpu_available = False
+                except Exception:
+                    pass
+            return temperatures
+
+    def cpu_temperature(self) -> Optional[float]:
+        """Температура CPU: максимум по сенсорам пакета, иначе по ядрам"""
+        with self._lock:
+            if self._sensors is None:
+                return None
+            for kind in ("cpu_package", "cpu_core"):
+                values = [self.temperatures[s.key] for s in self._sensors if s.kind == kind and s.key in self.temperatures]
+                if values:
+                    return max(values)
+            return None
+
+    def is_throttling(self) -> bool:
+        with self._lock:
+            if self.cpu_throttle.get("active"):
+                return True
+            return any(g["throttle_reasons"] for g in self.gpus.values())
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Последнее состояние для heartbeat (без новых замеров)"""
+        cpu_temperature = self.cpu_temperature()
+        throttling = self.is_throttling()
+        with self._lock:
+            return {
+                "cpu_temperature": cpu_temperature,
+                "sensors": {k: round(v, 1) for k, v in self.temperatures.items()},
+                "cpu_throttle": dict(self.cpu_throttle),
+                "gpus": {k: dict(v) for k, v in self.gpus.items()},
+                "throttling": throttling,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            for sensor in self._sensors or []:
+                if sensor.fd is not None:
+                    try:
+                        os.close(sensor.fd)
+                    except OSError:
+                        pass
+                    sensor.fd = None
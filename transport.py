@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import ipaddress
+import socket
+import threading
+import time
+from typing import Dict, Any, Optional, List, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from adaptive_timeouts import AdaptiveTimeouts
+from metrics import REGISTRY
+from server_clock import ServerClock
+
+
+HTTP_REQUESTS = REGISTRY.counter("gpuniq_agent_http_requests_total", "Запросы к backend по endpoint и соединению (new | reused)")
+HTTP_CONNECTIONS = REGISTRY.counter("gpuniq_agent_http_connections_total",
+                                    "Новые соединения с backend (для https — с TLS handshake) по схеме и причине")
+HTTP_CONNECT_SECONDS = REGISTRY.histogram("gpuniq_agent_http_connect_seconds", "Установка соединения (TCP и TLS) по схеме")
+HTTP_CONNECTION_REUSE = REGISTRY.gauge("gpuniq_agent_http_connection_reuse_ratio", "Доля запросов по уже открытому соединению")
+DNS_LOOKUPS = REGISTRY.counter("gpuniq_agent_dns_lookups_total", "Разрешение имени backend по результату: hit | miss | stale")
+
+# Начальные (connect, read) по endpoint, пока нет образцов времени ответа; дальше — AdaptiveTimeouts
+ENDPOINT_TIMEOUTS: Dict[str, Tuple[float, float]] = {
+    "confirm": (5.0, 10.0),
+    "init": (5.0, 10.0),
+    "pull": (5.0, 15.0),
+    "sync": (5.0, 15.0),
+    "status": (5.0, 10.0),
+    "heartbeat": (5.0, 10.0),
+    "logs": (3.0, 5.0),
+}
+DEFAULT_TIMEOUT = (5.0, 10.0)
+
+DNS_TTL_S = 300.0
+POOL_MAXSIZE = 2           # соединений на хост в пуле одного потока: запрос + прогрев
+KEEPALIVE_IDLE_S = 60      # TCP keep-alive: первая проба после простоя
+KEEPALIVE_INTERVAL_S = 15
+KEEPALIVE_PROBES = 4
+
+
+def keepalive_socket_options(idle_s: int = KEEPALIVE_IDLE_S) -> List[Tuple[int, int, int]]:
+    """Опции сокета: TCP_NODELAY (как у urllib3) и TCP keep-alive там, где платформа их знает"""
+    options = list(HTTPConnection.default_socket_options) + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle_s))
+    elif hasattr(socket, "TCP_KEEPALIVE"):  # macOS
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle_s))
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, KEEPALIVE_INTERVAL_S))
+    if hasattr(socket, "TCP_KEEPCNT"):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPCNT, KEEPALIVE_PROBES))
+    return options
+
+
+class DnsCache:
+    """Кэш адресов backend на ttl_s. Если DNS недоступен, используется последний известный ответ."""
+
+    def __init__(self, ttl_s: float = DNS_TTL_S):
+        self.ttl_s = ttl_s
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host: str, port: int) -> List[str]:
+        try:
+            ipaddress.ip_address(host)
+            return [host]
+        except ValueError:
+            pass
+        key = (host, port)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl_s:
+            DNS_LOOKUPS.inc(result="hit")
+            return entry[1]
+        try:
+            infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        except socket.gaierror:
+            if entry is None:
+                raise
+            DNS_LOOKUPS.inc(result="stale")
+            print(f"[WARNING] DNS lookup for {host} failed, using cached addresses")
+            return entry[1]
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        with self._lock:
+            self._entries[key] = (time.monotonic(), addresses)
+        DNS_LOOKUPS.inc(result="miss")
+        return addresses
+
+    def forget(self, host: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == host]:
+                del self._entries[key]
+
+
+DNS_CACHE = DnsCache()
+
+# Счётчик новых соединений потока: по нему запрос помечается как new или reused
+_local = threading.local()
+
+
+class _TrackedConnectionMixin:
+    """Соединение с адресом из DNS_CACHE и учётом handshake в метриках"""
+
+    def _new_conn(self):
+        host = self._dns_host
+        try:
+            addresses = DNS_CACHE.resolve(host.rstrip("."), self.port)
+        except socket.gaierror:
+            return super()._new_conn()  # urllib3 сам превратит ошибку в NameResolutionError
+        error = None
+        for address in addresses:
+            # host (и SNI) берётся из _dns_host, поэтому адрес подменяется только на время connect
+            self._dns_host = address
+            try:
+                return super()._new_conn()
+            except OSError as e:
+                error = e
+            finally:
+                self._dns_host = host
+        DNS_CACHE.forget(host.rstrip("."))
+        raise error
+
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        scheme = "https" if isinstance(self, HTTPSConnection) else "http"
+        _local.last_connect_s = time.perf_counter() - started
+        HTTP_CONNECT_SECONDS.observe(_local.last_connect_s, scheme=scheme)
+        HTTP_CONNECTIONS.inc(scheme=scheme, reason="warmup" if getattr(_local, "warmup", False) else "request")
+        _local.connections = getattr(_local, "connections", 0) + 1
+
+
+class _HTTPConnection(_TrackedConnectionMixin, HTTPConnection):
+    pass
+
+
+class _HTTPSConnection(_TrackedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _HTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _HTTPConnection
+
+
+class _HTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _HTTPSConnection
+
+
+class _TransportAdapter(HTTPAdapter):
+    def __init__(self, socket_options: List[Tuple[int, int, int]], **kwargs):
+        self._socket_options = socket_options
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        pool_kwargs["socket_options"] = self._socket_options
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _HTTPConnectionPool, "https": _HTTPSConnectionPool}
+
+
+class Transport:
+    """HTTP-транспорт агента: своя requests.Session с явно заданным пулом на каждый поток
+    (polling, heartbeat, исполнители задач), TCP keep-alive, кэш DNS, прогрев соединения перед
+    редкими запросами (heartbeat раз в 5 минут иначе ловит закрытое сервером соединение и платит
+    за новый TCP и TLS handshake). Таймауты по endpoint подстраиваются под измеренное время ответа,
+    по заголовку Date оценивается смещение часов backend.
+    """
+
+    def __init__(self, pool_maxsize: int = POOL_MAXSIZE, keepalive_idle_s: int = KEEPALIVE_IDLE_S,
+                 timeouts: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.pool_maxsize = pool_maxsize
+        self.socket_options = keepalive_socket_options(keepalive_idle_s)
+        self.timeouts = AdaptiveTimeouts(ENDPOINT_TIMEOUTS if timeouts is None else timeouts, DEFAULT_TIMEOUT)
+        self.clock = ServerClock()
+        self._local = threading.local()
+        self._sessions: List[requests.Session] = []
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._reused = 0
+
+    def session(self) -> requests.Session:
+        """Сессия текущего потока"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = _TransportAdapter(self.socket_options, pool_connections=4, pool_maxsize=self.pool_maxsize,
+                                        max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def timeout(self, endpoint: str) -> Tuple[float, float]:
+        return self.timeouts.timeout(endpoint)
+
+    def request(self, method: str, endpoint: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout(endpoint))
+        before = getattr(_local, "connections", 0)
+        sent_at = time.time()
+        try:
+            response = self.session().request(method, url, **kwargs)
+        except requests.exceptions.Timeout as e:
+            self.timeouts.timed_out(endpoint, connect=isinstance(e, requests.exceptions.ConnectTimeout))
+            raise
+        received_at = time.time()
+        reused = getattr(_local, "connections", 0) == before
+        # elapsed — до заголовков ответа; установка нового соединения идёт в оценку connect, а не read
+        read_s = response.elapsed.total_seconds()
+        if not reused:
+            connect_s = getattr(_local, "last_connect_s", 0.0)
+            self.timeouts.observe_connect(connect_s)
+            read_s = max(0.0, read_s - connect_s)
+        self.timeouts.observe(endpoint, read_s)
+        self.clock.observe(response.headers.get("Date"), sent_at, received_at)
+        HTTP_REQUESTS.inc(endpoint=endpoint, connection="reused" if reused else "new")
+        with self._lock:
+            self._requests += 1
+            self._reused += reused
+            HTTP_CONNECTION_REUSE.set(self._reused / self._requests)
+        return response
+
+    def _pool_for(self, session: requests.Session, url: str):
+        adapter = session.get_adapter(url)
+        request = requests.Request("GET", url).prepare()
+        settings = session.merge_environment_settings(url, {}, None, None, None)
+        if hasattr(adapter, "get_connection_with_tls_context"):
+            # Тот же ключ пула (с параметрами TLS), что и у обычного запроса
+            return adapter.get_connection_with_tls_context(request, settings["verify"], settings["proxies"], settings["cert"])
+        return adapter.get_connection(url, settings["proxies"])
+
+    def warm_up(self, url: str) -> threading.Thread:
+        """В фоне открывает соединение в пуле текущего потока, если свободного живого соединения нет"""
+        session = self.session()
+
+        def connect():
+            _local.warmup = True
+            try:
+                pool = self._pool_for(session, url)
+                conn = pool._get_conn()  # закрытое сервером соединение пул сразу сбрасывает
+                try:
+                    if not conn.is_connected:
+                        conn.connect()
+                        self.timeouts.observe_connect(_local.last_connect_s)
+                finally:
+                    pool._put_conn(conn)
+            except Exception:
+                pass  # не прогрели — запрос откроет соединение сам
+
+        thread = threading.Thread(target=connect, name="http-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def close(self) -> None:
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+
+
+def _bench(url: str, requests_count: int, idle_s: float, warm_up: bool) -> Dict[str, Any]:
+    transport = Transport()
+    latencies = []
+    connections_before = HTTP_CONNECTIONS.value(scheme=url.split(":")[0], reason="request")
+    for i in range(requests_count):
+        if i and idle_s:
+            time.sleep(idle_s)
+        if warm_up:
+            # В агенте прогрев идёт параллельно со сбором мониторинга; здесь просто дожидаемся его
+            transport.warm_up(url).join()
+        started = time.perf_counter()
+        transport.request("POST", "heartbeat", url, json={"status": "online"})
+        latencies.append(time.perf_counter() - started)
+    transport.close()
+    latencies.sort()
+    return {
+        "median_ms": latencies[len(latencies) // 2] * 1000,
+        "max_ms": latencies[-1] * 1000,
+        "handshakes_in_request": HTTP_CONNECTIONS.value(scheme=url.split(":")[0], reason="request") - connections_before,
+    }
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="transport: heartbeat latency after idle, with and without connection warm-up")
+    p.add_argument("--url", default=None, help="endpoint для POST; по умолчанию — локальный mock backend")
+    p.add_argument("--requests", type=int, default=10)
+    p.add_argument("--idle", type=float, default=1.0, help="пауза между запросами, сек")
+    p.add_argument("--server-idle-timeout", type=float, default=0.5, help="mock backend: закрывать простаивающие соединения, сек")
+    args = p.parse_args()
+    backend = None
+    url = args.url
+    if url is None:
+        from mock_backend import MockBackend
+        backend = MockBackend(idle_timeout_s=args.server_idle_timeout)
+        url = backend.start() + "/v1/agents/mock-agent/heartbeat"
+    try:
+        for warm in (False, True):
+            result = _bench(url, args.requests, args.idle, warm)
+            print(f"warm-up {'on ' if warm else 'off'}: median {result['median_ms']:.2f} ms, max {result['max_ms']:.2f} ms, "
+                  f"handshakes inside requests {result['handshakes_in_request']:.0f}/{args.requests}")
+    finally:
+        if backend is not None:
+            backend.stop()
+
+
+if __name__ == "__main__":
+    main()
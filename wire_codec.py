@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import time
+from typing import Dict, Any, Optional, List, Tuple, FrozenSet
+
+from metrics import REGISTRY
+
+# Необязательные зависимости: без них агент говорит только JSON
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+API_PAYLOAD_BYTES = REGISTRY.gauge("gpuniq_agent_api_payload_bytes", "Размер последнего тела запроса по endpoint и кодировке")
+WIRE_ENCODING = REGISTRY.gauge("gpuniq_agent_wire_encoding_info", "Кодировка тел запросов, выбранная по ответу сервера")
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+CBOR = "application/cbor"
+
+# Имена полей, которые в бинарных кодировках передаются числами: номер = индекс + 1, ключ 0 — версия схемы.
+# Списки только дополняются в новой версии; неизвестные имена (интерфейсы, id GPU, контейнеры) остаются строками.
+FIELD_SCHEMAS: Dict[int, List[str]] = {
+    1: [
+        # heartbeat
+        "status", "gpu_usage", "cpu_usage", "memory_usage", "disk_usage", "network_usage", "up_mbps", "down_mbps",
+        "interfaces", "virtual", "containers", "container_gpu_usage", "container_io", "thermal", "stats", "events",
+        "clock", "local_time", "server_time", "offset_s", "uncertainty_s", "cpu_temperature", "sensors",
+        "cpu_throttle", "gpus", "throttling", "min", "avg", "p95", "max", "average", "rx_mbps", "tx_mbps",
+        "top_disk", "top_network", "disk_read_mb_s", "disk_write_mb_s", "net_rx_mbps", "net_tx_mbps",
+        "utilization", "memory_used_mb", "memory_total_mb", "temperature", "power_w", "total", "used", "free",
+        "percent", "mountpoint", "device",
+        # init и hardware_info
+        "hardware_info", "hostname", "ip_address", "location", "total_ram_gb", "ram_type", "cpus", "disks",
+        "networks", "model", "cores", "threads", "freq_ghz", "count", "vram_gb", "max_cuda_version", "tflops",
+        "bandwidth_gbps", "vendor", "driver_version", "name", "type", "size_bytes", "size_gb", "read_speed_mb_s",
+        "write_speed_mb_s", "ports", "disk_benchmark", "network_selftest", "resource_availability",
+        "fingerprint", "available", "reserved",
+        # статус задачи и sync
+        "task_id", "container_id", "container_name", "progress", "output", "error_message", "max_tasks",
+        "monitoring", "monitoring_full", "statuses", "logs", "message", "ts",
+        # ответы
+        "exception", "data", "tasks", "task_data", "container_info", "directives", "has_more", "operation",
+        "docker_image", "gpu_required", "ssh_username", "ssh_password", "ssh_port", "ssh_host", "ssh_command",
+        "agent_id", "id", "seconds",
+    ],
+}
+# Поля, значение которых — словарь с ключами-данными (GPU, точки монтирования, интерфейсы, контейнеры, сенсоры,
+# метрики): ключи такого словаря передаются как есть, даже если совпадают с именем поля; его значения — снова поля.
+NAME_MAP_FIELDS: Dict[int, FrozenSet[str]] = {
+    1: frozenset({"gpu_usage", "disk_usage", "interfaces", "virtual", "containers", "container_gpu_usage",
+                  "sensors", "gpus", "stats"}),
+}
+SCHEMA_VERSION = max(FIELD_SCHEMAS)
+SCHEMA_KEY = 0
+
+_FIELD_IDS = {version: {name: i + 1 for i, name in enumerate(names)} for version, names in FIELD_SCHEMAS.items()}
+
+
+def pack_keys(value: Any, ids: Dict[str, int], name_maps: FrozenSet[str] = frozenset(), data_keys: bool = False) -> Any:
+    """Имена полей → номера. data_keys — ключи этого словаря данные (см. NAME_MAP_FIELDS), они не кодируются.
+    Нестроковые ключи среди полей становятся строками, как в JSON: иначе их не отличить от номеров полей.
+    """
+    if isinstance(value, dict):
+        packed = {}
+        for k, v in value.items():
+            if data_keys:
+                key = k
+            elif isinstance(k, str):
+                key = ids.get(k, k)
+            else:
+                key = json.dumps(k)
+            packed[key] = pack_keys(v, ids, name_maps, not data_keys and isinstance(v, dict) and k in name_maps)
+        return packed
+    if isinstance(value, (list, tuple)):
+        return [pack_keys(v, ids, name_maps) for v in value]
+    return value
+
+
+def unpack_keys(value: Any, names: List[str], name_maps: FrozenSet[str] = frozenset(), data_keys: bool = False) -> Any:
+    """Обратное к pack_keys: номера полей → имена, кроме ключей-данных"""
+    if isinstance(value, dict):
+        unpacked = {}
+        for k, v in value.items():
+            key = k if data_keys or not (isinstance(k, int) and 0 < k <= len(names)) else names[k - 1]
+            unpacked[key] = unpack_keys(v, names, name_maps, not data_keys and isinstance(v, dict) and key in name_maps)
+        return unpacked
+    if isinstance(value, list):
+        return [unpack_keys(v, names, name_maps) for v in value]
+    return value
+
+
+def _media_type(header: Optional[str]) -> Tuple[str, Dict[str, str]]:
+    """'application/msgpack; schema=1' -> ('application/msgpack', {'schema': '1'})"""
+    parts = [p.strip() for p in (header or "").split(";")]
+    params = {}
+    for part in parts[1:]:
+        if "=" in part:
+            key, _, value = part.partition("=")
+            params[key.strip().lower()] = value.strip().strip('"')
+    return parts[0].lower(), params
+
+
+def available_types() -> List[str]:
+    """Бинарные кодировки, для которых установлены библиотеки, в порядке предпочтения"""
+    return [t for t, lib in ((MSGPACK, msgpack), (CBOR, cbor2)) if lib is not None]
+
+
+def encode(data: Any, content_type: str, schema: Optional[int] = SCHEMA_VERSION) -> bytes:
+    """schema=None — бинарная кодировка со строковыми ключами (только для сравнения в замерах)"""
+    if content_type == JSON:
+        return json.dumps(data).encode()
+    body = data
+    if schema is not None:
+        body = pack_keys(data, _FIELD_IDS[schema], NAME_MAP_FIELDS[schema])
+        if isinstance(body, dict):
+            body = {SCHEMA_KEY: schema, **body}
+    if content_type == MSGPACK:
+        return msgpack.packb(body, use_bin_type=True)
+    if content_type == CBOR:
+        return cbor2.dumps(body)
+    raise ValueError(f"Unsupported content type: {content_type}")
+
+
+def decode(body: bytes, content_type: str) -> Any:
+    if content_type == MSGPACK:
+        data = msgpack.unpackb(body, raw=False, strict_map_key=False)
+    elif content_type == CBOR:
+        data = cbor2.loads(body)
+    else:
+        return json.loads(body)
+    if isinstance(data, dict) and SCHEMA_KEY in data:
+        schema = data.pop(SCHEMA_KEY)
+        if schema not in FIELD_SCHEMAS:
+            schema = SCHEMA_VERSION
+        return unpack_keys(data, FIELD_SCHEMAS[schema], NAME_MAP_FIELDS[schema])
+    return data
+
+
+class WireCodec:
+    """Кодировка тел запросов к backend.
+    Пока сервер не объявил поддержку, всё идёт в JSON. Сервер перечисляет принимаемые типы
+    в заголовке Accept-Post успешного ответа (например "application/msgpack; schema=1, application/json");
+    клиент берёт первую доступную ему бинарную кодировку и общую версию схемы полей.
+    Ответ 415 или успешный ответ без объявления возвращают клиент к JSON.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.content_type = JSON
+        self.schema = SCHEMA_VERSION
+        self._advertised: Optional[str] = None
+        WIRE_ENCODING.set(1, encoding="json")
+
+    def accept(self) -> str:
+        """Заголовок Accept: какие ответы клиент умеет разобрать"""
+        types = available_types() if self.enabled else []
+        return ", ".join([f"{t}; schema={SCHEMA_VERSION}" for t in types] + [f"{JSON}; q=0.5" if types else JSON])
+
+    def encode(self, data: Any) -> Tuple[bytes, str]:
+        """Тело и Content-Type"""
+        content_type = self.content_type
+        body = encode(data, content_type, self.schema)
+        if content_type != JSON:
+            content_type = f"{content_type}; schema={self.schema}"
+        return body, content_type
+
+    def decode(self, response) -> Any:
+        """Разбор ответа по его Content-Type (вместо response.json())"""
+        media_type, _ = _media_type(response.headers.get("Content-Type"))
+        if media_type in (MSGPACK, CBOR):
+            return decode(response.content, media_type)
+        return response.json()
+
+    def _switch(self, content_type: str, schema: int) -> None:
+        if (content_type, schema) == (self.content_type, self.schema):
+            return
+        WIRE_ENCODING.set(0, encoding=self.content_type.split("/")[-1])
+        self.content_type, self.schema = content_type, schema
+        WIRE_ENCODING.set(1, encoding=content_type.split("/")[-1])
+        print(f"[INFO] Request encoding: {content_type}" + (f" (schema {schema})" if content_type != JSON else ""))
+
+    def negotiate(self, response) -> None:
+        """Выбор кодировки по Accept-Post успешного ответа"""
+        advertised = response.headers.get("Accept-Post")
+        if advertised == self._advertised:
+            return
+        self._advertised = advertised
+        offered = {}
+        for item in (advertised or "").split(","):
+            media_type, params = _media_type(item)
+            try:
+                offered[media_type] = int(params.get("schema", SCHEMA_VERSION))
+            except ValueError:
+                continue
+        if self.enabled:
+            for content_type in available_types():
+                if content_type in offered:
+                    # Общая версия схемы: сервер может быть новее или старше агента
+                    schema = max((v for v in FIELD_SCHEMAS if v <= offered[content_type]), default=None)
+                    if schema is not None:
+                        self._switch(content_type, schema)
+                        return
+        self._switch(JSON, SCHEMA_VERSION)
+
+    def rejected(self) -> bool:
+        """Сервер ответил 415 на бинарное тело: назад к JSON. True — запрос стоит повторить в JSON."""
+        if self.content_type == JSON:
+            return False
+        print(f"[WARNING] Server rejected {self.content_type}, falling back to JSON")
+        self._advertised = None
+        self._switch(JSON, SCHEMA_VERSION)
+        return True
+
+
+def sample_payloads() -> Dict[str, Any]:
+    """Типичные тела запросов: хост с 8 GPU, 4 физическими интерфейсами, 8 контейнерами"""
+    gpus = {f"gpu{i}": {"utilization": 87.5 + i, "memory_used_mb": 71234 + i, "memory_total_mb": 81559,
+                        "temperature": 64 + i, "power_w": 312.4 + i} for i in range(8)}
+    stats = {name: {"min": 1.25, "avg": 42.57, "p95": 88.12, "max": 97.3}
+             for name in ("cpu_usage", "memory_usage", "disk_usage", "up_mbps", "down_mbps")}
+    stats.update({f"gpu{i}": {"min": 80.0, "avg": 90.12, "p95": 98.0, "max": 100.0} for i in range(8)})
+    interfaces = {f"enp{i}s0": {"rx_mbps": 123.45 * i, "tx_mbps": 67.89 * i} for i in range(4)}
+    virtual = {f"veth{i:07x}": {"rx_mbps": 1.5 * i, "tx_mbps": 0.75 * i} for i in range(8)}
+    containers = {f"task_{1000 + i}": {"rx_mbps": 12.5, "tx_mbps": 3.25} for i in range(8)}
+    heartbeat = {
+        "status": "online",
+        "gpu_usage": {**{k: v["utilization"] for k, v in gpus.items()}, "average": 91.0},
+        "cpu_usage": 37.25,
+        "memory_usage": 61.5,
+        "disk_usage": {"/": {"total": 1920383410176, "used": 812345678912, "free": 1108037731264, "percent": 42.3},
+                       "/var/lib/docker": {"total": 7681533640704, "used": 3212345678912, "free": 4469187961792, "percent": 41.8}},
+        "network_usage": {"up_mbps": 271.56, "down_mbps": 493.8, "interfaces": interfaces, "virtual": virtual,
+                          "containers": containers},
+        "container_gpu_usage": {f"task_{1000 + i}": {"gpus": [f"gpu{i}"], "utilization": 90.5, "memory_used_mb": 70123}
+                                for i in range(8)},
+        "container_io": {"containers": 8, "top_disk": [{"name": "task_1003", "disk_read_mb_s": 512.3, "disk_write_mb_s": 80.1}],
+                         "top_network": [{"name": "task_1001", "net_rx_mbps": 120.0, "net_tx_mbps": 12.0}]},
+        "thermal": {"cpu_temperature": 58.0, "sensors": {"coretemp/Package id 0": 58.0, "coretemp/Package id 1": 61.0},
+                    "cpu_throttle": {}, "gpus": {k: {"temperature": v["temperature"]} for k, v in gpus.items()},
+                    "throttling": False},
+        "stats": stats,
+        "clock": {"local_time": 1792403248.7936053, "server_time": 1792403248.805673, "offset_s": 0.012, "uncertainty_s": 0.062},
+    }
+    init = {
+        "hostname": "gpu-node-17",
+        "ip_address": "203.0.113.10",
+        "location": "Amsterdam, Netherlands",
+        "status": "online",
+        "cpu_usage": 3.5,
+        "memory_usage": 12.25,
+        "total_ram_gb": 1024,
+        "ram_type": "DDR5",
+        "hardware_info": {
+            "cpus": [{"model": "AMD EPYC 9654 96-Core Processor", "cores": 96, "threads": 192, "freq_ghz": 2.4, "count": 2}],
+            "gpus": [{"model": "NVIDIA H100 80GB HBM3", "vram_gb": 80, "max_cuda_version": "12.4", "tflops": None,
+                      "bandwidth_gbps": None, "vendor": "NVIDIA", "count": 8}],
+            "disks": [{"name": f"nvme{i}n1", "model": "SAMSUNG MZQL27T6HBLA-00A07", "type": "NVMe",
+                       "size_bytes": 7681501126656, "size_gb": 7153.8, "read_speed_mb_s": 6800.0, "write_speed_mb_s": 4100.0}
+                      for i in range(4)],
+            "networks": [{"up_mbps": 25000, "down_mbps": 25000, "ports": f"enp{i}s0", "type": "Ethernet"} for i in range(4)],
+        },
+        "gpu_usage": heartbeat["gpu_usage"],
+        "disk_usage": heartbeat["disk_usage"],
+        "network_usage": {"up_mbps": 0.5, "down_mbps": 1.25, "interfaces": interfaces},
+    }
+    status = {"status": "running", "container_id": "4f9c2a8e1b7d" * 5 + "abcd", "container_name": "task_1003",
+              "progress": 0.0, "output": "Container task_1003 started successfully. SSH ready on 203.0.113.10:42003"}
+    return {"heartbeat": heartbeat, "init": init, "status": status}
+
+
+def _bench(data: Any, content_type: str, schema: Optional[int], iterations: int) -> Tuple[int, float, float]:
+    body = encode(data, content_type, schema)
+    assert decode(body, content_type) == json.loads(json.dumps(data)), content_type
+    started = time.perf_counter()
+    for _ in range(iterations):
+        encode(data, content_type, schema)
+    encode_us = (time.perf_counter() - started) / iterations * 1e6
+    started = time.perf_counter()
+    for _ in range(iterations):
+        decode(body, content_type)
+    decode_us = (time.perf_counter() - started) / iterations * 1e6
+    return len(body), encode_us, decode_us
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="размер и скорость JSON / MessagePack / CBOR на типичных телах запросов")
+    p.add_argument("--iterations", type=int, default=2000)
+    args = p.parse_args()
+    variants = [(JSON, None, "json")]
+    for content_type in available_types():
+        short = content_type.split("/")[-1]
+        variants += [(content_type, None, f"{short}, str keys"), (content_type, SCHEMA_VERSION, f"{short}, schema {SCHEMA_VERSION}")]
+    missing = [name for name, lib in (("msgpack", msgpack), ("cbor2", cbor2)) if lib is None]
+    if missing:
+        print(f"[INFO] Not installed: {', '.join(missing)} (pip install {' '.join(missing)})")
+    print(f"{'payload':<10} {'encoding':<20} {'bytes':>7} {'encode, us':>11} {'decode, us':>11}")
+    for name, data in sample_payloads().items():
+        for content_type, schema, label in variants:
+            size, encode_us, decode_us = _bench(data, content_type, schema, args.iterations)
+            print(f"{name:<10} {label:<20} {size:>7} {encode_us:>11.1f} {decode_us:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()